@@ -0,0 +1,542 @@
+"""Cold tier: completed and cancelled appointments archived to monthly Parquet files.
+
+`python archive.py run` moves the completed and cancelled appointments of
+every UTC month (by pickup) that ended more than ARCHIVE_AFTER_DAYS (default
+180) ago out of `appointments` into ARCHIVE_DIR/appointments-YYYY-MM.parquet,
+one zstd-compressed file per month, and records each month's row counts,
+client names and income aggregates in ARCHIVE_DIR/manifest.json. Scheduled
+trips are never archived. Archived rows leave tombstones so delta sync drops
+them, are taken out of the income rollup, and the appointments version stamp
+is bumped so cached responses revalidate. `--dry-run` only reports.
+
+Each month is moved in two phases so no row is ever counted in both tiers.
+The month (merged by id with any file it already has) is first written as a
+pending file, listed under the manifest's `pending` key, which readers
+ignore. Then its rows are deleted, each only if it hasn't changed since it
+was read. Finishing the month drops the rows that are still live from the
+pending file, takes the deleted ones out of the rollup, writes their
+tombstones and only then commits the file and its entry under `months`. A run
+first finishes any month an interrupted run left pending, so re-running is
+always safe. Between the delete and the commit the month's new rows are in
+neither tier: briefly, or until the next run if this one was interrupted.
+
+Readers merge the cold tier with the live collection: a whole month without
+filters is answered from the manifest, anything else reads the columns it
+needs from the month files, cached per file and worker. Every worker must see
+the same ARCHIVE_DIR (default backend/archive).
+
+    ARCHIVE_CACHE_MONTHS   month files kept in memory per worker (default 24)
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import rollups
+import search
+import sync
+import versioning
+
+ARCHIVED_STATUSES = ["completed", "cancelled"]
+MONTH_FORMAT = "%Y-%m"
+MANIFEST = "manifest.json"
+# Bump when the file layout changes
+ARCHIVE_VERSION = 1
+DELETE_BATCH = 500
+
+# Fields of the API's Appointment model, then the typed times and sync_seq the archive keeps for itself
+RECORD_COLUMNS = [
+    "id", "client_name", "pickup_time", "pickup_location", "arrival_time", "arrival_location", "flight_info",
+    "other_details", "amount", "appointment_type_id", "status", "created_at", "updated_at",
+]
+COLUMNS = RECORD_COLUMNS + ["pickup_at", "arrival_at", "sync_seq"]
+INCOME_COLUMNS = ["pickup_at", "client_name", "appointment_type_id", "amount", "status"]
+
+
+def archive_dir():
+    return Path(os.environ.get("ARCHIVE_DIR") or Path(__file__).parent / "archive")
+
+
+def _aware(value):
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _month_start(instant):
+    return instant.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(start):
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def month_bounds(month):
+    """UTC [start, end) of a "YYYY-MM" month."""
+    start = datetime.strptime(month, MONTH_FORMAT).replace(tzinfo=timezone.utc)
+    return start, _next_month(start)
+
+
+def cutoff(after_days, now=None):
+    """Start of the oldest month kept live: earlier months ended more than `after_days` ago."""
+    return _month_start((now or datetime.now(timezone.utc)) - timedelta(days=after_days))
+
+
+_manifest_cache = (None, None)
+
+
+def _empty_manifest():
+    return {"version": ARCHIVE_VERSION, "months": {}, "pending": {}}
+
+
+def manifest():
+    """The manifest as last written, re-read only when the file changes.
+
+    Readers use `months` only; `pending` lists months an archive run hasn't finished.
+    """
+    global _manifest_cache
+    path = archive_dir() / MANIFEST
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return _empty_manifest()
+    stamp = (str(path), stat.st_mtime_ns, stat.st_size)
+    if _manifest_cache[0] != stamp:
+        with open(path, encoding="utf-8") as f:
+            _manifest_cache = (stamp, json.load(f))
+    return _manifest_cache[1]
+
+
+def _replace(path, write):
+    """Write `path` through a temporary file and a rename, so readers never see a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _save_manifest(month, entry=None, pending=None):
+    """Set `month`'s committed entry and/or its pending record; pending=False clears the latter."""
+    current = manifest()
+    data = {
+        "version": ARCHIVE_VERSION,
+        "months": dict(current["months"]),
+        "pending": dict(current.get("pending", {})),
+    }
+    if entry is not None:
+        data["months"][month] = entry
+    if pending is False:
+        data["pending"].pop(month, None)
+    elif pending is not None:
+        data["pending"][month] = pending
+
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    _replace(archive_dir() / MANIFEST, write)
+
+
+def _sums(amounts, keys):
+    grouped = amounts.groupby(keys).agg(["count", "sum"])
+    return {key: {"count": int(count), "total": float(total)} for key, count, total in grouped.itertuples()}
+
+
+def _income(frame, period_format=None):
+    """Income stats over the completed rows of `frame`, shaped like get_income_stats' response."""
+    completed = frame[frame["status"] == "completed"]
+    amounts = completed["amount"].fillna(0)
+    stats = {
+        "total_income": float(amounts.sum()),
+        "total_count": len(completed),
+        "by_client": _sums(amounts, completed["client_name"].fillna("Unknown")),
+        "by_type": _sums(amounts, completed["appointment_type_id"].fillna("unknown")),
+    }
+    if period_format:
+        series = _sums(amounts, completed["pickup_at"].dt.strftime(period_format))
+        stats["series"] = [{"period": period, **series[period]} for period in sorted(series)]
+    return stats
+
+
+def _merge_sums(first, second):
+    merged = {key: dict(sums) for key, sums in first.items()}
+    for key, sums in second.items():
+        into = merged.setdefault(key, {"count": 0, "total": 0})
+        into["count"] += sums["count"]
+        into["total"] += sums["total"]
+    return merged
+
+
+def merge_income(stats, other):
+    """Sum of two income stats dicts; the series is merged by period when `stats` has one."""
+    merged = {
+        "total_income": stats["total_income"] + other["total_income"],
+        "total_count": stats["total_count"] + other["total_count"],
+        "by_client": _merge_sums(stats["by_client"], other["by_client"]),
+        "by_type": _merge_sums(stats["by_type"], other["by_type"]),
+    }
+    if "series" in stats:
+        series = _merge_sums(
+            {row["period"]: row for row in stats["series"]},
+            {row["period"]: row for row in other.get("series", [])},
+        )
+        merged["series"] = [
+            {"period": period, "count": series[period]["count"], "total": series[period]["total"]}
+            for period in sorted(series)
+        ]
+    return merged
+
+
+@functools.lru_cache(maxsize=int(os.environ.get("ARCHIVE_CACHE_MONTHS", "24")))
+def _read(path, stamp, columns):
+    import pandas as pd
+    return pd.read_parquet(path, columns=list(columns))
+
+
+def _month_frame(month, columns):
+    """Columns of one month's file. Shared between requests: filter it, never modify it."""
+    path = archive_dir() / manifest()["months"][month]["file"]
+    stat = os.stat(path)
+    return _read(str(path), (stat.st_mtime_ns, stat.st_size), tuple(columns))
+
+
+def _overlaps(time_range, start, end):
+    time_range = time_range or {}
+    return not (
+        ("$gte" in time_range and time_range["$gte"] >= end)
+        or ("$lt" in time_range and time_range["$lt"] <= start)
+        or ("$lte" in time_range and time_range["$lte"] < start)
+    )
+
+
+def _covers(time_range, start, end):
+    time_range = time_range or {}
+    return not (
+        ("$gte" in time_range and time_range["$gte"] > start)
+        or ("$lt" in time_range and time_range["$lt"] < end)
+        or ("$lte" in time_range and time_range["$lte"] < end)
+    )
+
+
+def months_in(time_range=None, client_name=None, status=None):
+    """Archived months that can hold rows matching the filters, oldest first.
+
+    `time_range` is a times.range_filter() dict; `client_name` a substring as in search.name_filter.
+    Answered from the manifest alone, so it's cheap enough to call on every request.
+    """
+    needle = search.normalize(client_name) if client_name else ""
+    months = []
+    for month, entry in sorted(manifest()["months"].items()):
+        if not entry["rows"] or not _overlaps(time_range, *month_bounds(month)):
+            continue
+        if status and not entry["statuses"].get(status):
+            continue
+        if needle and not any(needle in search.normalize(name) for name in entry["clients"]):
+            continue
+        months.append(month)
+    return months
+
+
+def _select(frame, time_range=None, client_name=None, appointment_type_id=None, status=None):
+    mask = frame["pickup_at"].notna()
+    time_range = time_range or {}
+    if "$gte" in time_range:
+        mask &= frame["pickup_at"] >= time_range["$gte"]
+    if "$lt" in time_range:
+        mask &= frame["pickup_at"] < time_range["$lt"]
+    if "$lte" in time_range:
+        mask &= frame["pickup_at"] <= time_range["$lte"]
+    if client_name:
+        needle = search.normalize(client_name)
+        mask &= frame["client_name"].map(search.normalize).str.contains(needle, regex=False)
+    if appointment_type_id:
+        mask &= frame["appointment_type_id"] == appointment_type_id
+    if status:
+        mask &= frame["status"] == status
+    return frame[mask]
+
+
+def income(months, time_range=None, client_name=None, appointment_type_id=None, period_format=None):
+    """Income stats over the archived `months` (see months_in), shaped like get_income_stats' response.
+
+    Reads files, so call it off the event loop.
+    """
+    stats = {"total_income": 0, "total_count": 0, "by_client": {}, "by_type": {}}
+    if period_format:
+        stats["series"] = []
+    for month in months:
+        entry = manifest()["months"][month]
+        whole_month = _covers(time_range, *month_bounds(month))
+        if whole_month and not client_name and not appointment_type_id and period_format in (None, MONTH_FORMAT):
+            part = dict(entry["income"])
+            if period_format and part["total_count"]:
+                part["series"] = [{"period": month, "count": part["total_count"], "total": part["total_income"]}]
+        else:
+            frame = _select(_month_frame(month, INCOME_COLUMNS), time_range, client_name, appointment_type_id)
+            part = _income(frame, period_format)
+        stats = merge_income(stats, part)
+    return stats
+
+
+def find(months, time_range=None, client_name=None, status=None, limit=100):
+    """Up to `limit` archived appointments in `months` matching the filters, latest pickup first.
+
+    Rows come back as the API's Appointment dicts. Reads files, so call it off the event loop.
+    """
+    rows = []
+    for month in reversed(months):
+        frame = _select(_month_frame(month, COLUMNS), time_range, client_name, status=status)
+        rows.extend(_records(frame.sort_values(["pickup_at", "id"], ascending=False).head(limit - len(rows))))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def month_rows(month, time_range=None, client_name=None, appointment_type_id=None, status=None):
+    """One archived month's rows matching the filters as Appointment dicts, in (pickup_time, id) order."""
+    frame = _select(_month_frame(month, COLUMNS), time_range, client_name, appointment_type_id, status)
+    return _records(frame.sort_values(["pickup_time", "id"]))
+
+
+async def merged(cursor, months, time_range=None, client_name=None, appointment_type_id=None, status=None):
+    """Rows of `cursor`, sorted by (pickup_time, id), merged in that order with the matching archived rows.
+
+    Archived rows are read one month at a time, so memory stays bounded by the largest month.
+    """
+    months = list(months)
+    cold = []  # current month's rows, reversed so the next one is at the end
+
+    def key(doc):
+        return doc.get("pickup_time") or "", doc["id"]
+
+    async def refill():
+        while not cold and months:
+            rows = await asyncio.to_thread(
+                month_rows, months.pop(0), time_range, client_name, appointment_type_id, status
+            )
+            cold.extend(reversed(rows))
+
+    await refill()
+    async for doc in cursor:
+        while cold and key(cold[-1]) <= key(doc):
+            yield cold.pop()
+            await refill()
+        yield doc
+    while cold:
+        yield cold.pop()
+        await refill()
+
+
+def client_trips(months, client_name, time_range=None, status=None, after=None, limit=100):
+    """Summary and first rows of one client's archived trips in `months`, by exact name like the drill-down.
+
+    Returns ({"count", "total", "first", "last"}, rows): the summary covers every match, the rows are
+    the first `limit` in (pickup_at, id) order after the (pickup_at, id) key `after`, as Appointment
+    dicts plus their pickup_at. Reads files, so call it off the event loop.
+    """
+    import pandas as pd
+    frames = [_select(_month_frame(month, COLUMNS), time_range, status=status) for month in months]
+    frame = pd.concat(frames, ignore_index=True) if frames else _frame([])
+    frame = frame[frame["client_name"] == client_name]
+    summary = {
+        "count": len(frame),
+        "total": float(frame["amount"].fillna(0).sum()),
+        "first": frame["pickup_at"].min().to_pydatetime() if len(frame) else None,
+        "last": frame["pickup_at"].max().to_pydatetime() if len(frame) else None,
+    }
+    if after is not None:
+        pickup_at, appointment_id = after
+        frame = frame[(frame["pickup_at"] > pickup_at) | ((frame["pickup_at"] == pickup_at) & (frame["id"] > appointment_id))]
+    page = frame.sort_values(["pickup_at", "id"]).head(limit)
+    rows = [{**row, "pickup_at": pickup_at.to_pydatetime()} for row, pickup_at in zip(_records(page), page["pickup_at"])]
+    return summary, rows
+
+
+def _records(frame):
+    """Rows of `frame` as the API's Appointment dicts, with None for missing values."""
+    records = frame[RECORD_COLUMNS].astype(object)
+    return records.where(records.notna(), None).to_dict("records")
+
+
+def _frame(docs):
+    import pandas as pd
+    frame = pd.DataFrame([[doc.get(column) for column in COLUMNS] for doc in docs], columns=COLUMNS)
+    for column in ("pickup_at", "arrival_at"):
+        frame[column] = pd.to_datetime(frame[column], utc=True)
+    frame["amount"] = frame["amount"].astype("float64")
+    frame["sync_seq"] = frame["sync_seq"].astype("Int64")
+    return frame
+
+
+def _with_existing(month, frame):
+    """`frame` merged by id with the month's existing file, the fresh rows winning."""
+    import pandas as pd
+    entry = manifest()["months"].get(month)
+    if entry is None:
+        return frame
+    existing = pd.read_parquet(archive_dir() / entry["file"])
+    frame = pd.concat([existing, frame], ignore_index=True).drop_duplicates("id", keep="last")
+    return frame.sort_values(["pickup_at", "id"], ignore_index=True)
+
+
+def _month_file(month):
+    return f"appointments-{month}.parquet"
+
+
+def _pending_file(month):
+    return f"appointments-{month}.pending.parquet"
+
+
+def _entry(month, frame):
+    pickups = frame["pickup_at"].dropna()
+    return {
+        "file": _month_file(month),
+        "rows": len(frame),
+        "statuses": {status: int(count) for status, count in frame["status"].value_counts().items()},
+        "first_pickup": pickups.min().isoformat() if len(pickups) else None,
+        "last_pickup": pickups.max().isoformat() if len(pickups) else None,
+        "clients": sorted(frame["client_name"].dropna().unique().tolist()),
+        "income": _income(frame),
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _write(path, frame):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _replace(path, lambda tmp: frame.to_parquet(tmp, compression="zstd", index=False))
+
+
+def _committed_ids(month):
+    import pandas as pd
+    entry = manifest()["months"].get(month)
+    if entry is None:
+        return set()
+    return set(pd.read_parquet(archive_dir() / entry["file"], columns=["id"])["id"])
+
+
+async def _delete_unchanged(db, docs):
+    """Delete `docs`, each only if it hasn't changed since it was read."""
+    for i in range(0, len(docs), DELETE_BATCH):
+        batch = docs[i:i + DELETE_BATCH]
+        await db.appointments.delete_many(
+            {"$or": [{"id": doc["id"], "sync_seq": doc.get("sync_seq")} for doc in batch]}
+        )
+
+
+async def _finish(db, month):
+    """Commit a pending month: keep the rows whose delete landed and drop the others; returns how many moved.
+
+    Every step is safe to repeat, so this also completes a month an interrupted run left pending.
+    """
+    import pandas as pd
+    pending_path = archive_dir() / manifest()["pending"][month]["file"]
+    frame = pd.read_parquet(pending_path)
+    committed = _committed_ids(month)
+    new_ids = [appointment_id for appointment_id in frame["id"] if appointment_id not in committed]
+
+    # Rows still live weren't deleted (changed since they were read, or the run stopped first)
+    live = set()
+    for i in range(0, len(new_ids), DELETE_BATCH):
+        cursor = db.appointments.find({"id": {"$in": new_ids[i:i + DELETE_BATCH]}}, {"_id": 0, "id": 1})
+        live.update([doc["id"] async for doc in cursor])
+    frame = frame[~frame["id"].isin(live)].reset_index(drop=True)
+
+    moved = frame[frame["id"].isin(set(new_ids) - live)]
+    # Out of the rollup before the commit: until then the rows are counted by neither tier, never by both.
+    # The rollup removals carry the tombstones' seqs, so they outrank any write still in flight.
+    first_seq = await sync.record_deletes(db, moved["id"].tolist())
+    await rollups.remove(db, _records(moved), first_seq)
+
+    if len(frame) or month in manifest()["months"]:
+        _write(archive_dir() / _month_file(month), frame)
+        _save_manifest(month, entry=_entry(month, frame), pending=False)
+    else:
+        _save_manifest(month, pending=False)
+    pending_path.unlink(missing_ok=True)
+    return len(moved)
+
+
+async def archive_month(db, month, dry_run=False):
+    """Move one month's completed and cancelled appointments to its file; returns how many were moved."""
+    moved = 0
+    if not dry_run and month in manifest().get("pending", {}):
+        moved += await _finish(db, month)
+
+    start, end = month_bounds(month)
+    query = {"status": {"$in": ARCHIVED_STATUSES}, "pickup_at": {"$gte": start, "$lt": end}}
+    docs = await db.appointments.find(query, {"_id": 0, "client_search_name": 0, "client_search_keys": 0}).to_list(None)
+    if dry_run or not docs:
+        return moved + len(docs)
+
+    _write(archive_dir() / _pending_file(month), _with_existing(month, _frame(docs)))
+    _save_manifest(month, pending={"file": _pending_file(month), "started_at": datetime.now(timezone.utc).isoformat()})
+    await _delete_unchanged(db, docs)
+    return moved + await _finish(db, month)
+
+
+async def run(db, after_days, dry_run=False):
+    """Archive every month that ended more than `after_days` ago; returns {month: appointments moved}."""
+    before = cutoff(after_days)
+    oldest = await db.appointments.find_one(
+        {"status": {"$in": ARCHIVED_STATUSES}, "pickup_at": {"$lt": before}},
+        {"_id": 0, "pickup_at": 1},
+        sort=[("pickup_at", 1)],
+    )
+    archived = {}
+    if not dry_run:
+        # Months an interrupted run left pending, which may have no live rows left to revisit them by
+        for month in sorted(manifest().get("pending", {})):
+            count = await _finish(db, month)
+            if count:
+                archived[month] = count
+
+    start = _month_start(_aware(oldest["pickup_at"])) if oldest else before
+    while start < before:
+        month = start.strftime(MONTH_FORMAT)
+        count = await archive_month(db, month, dry_run)
+        if count:
+            archived[month] = archived.get(month, 0) + count
+        start = _next_month(start)
+
+    if archived and not dry_run:
+        await versioning.bump(db, "appointments")
+    return archived
+
+
+async def main(args):
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.command == "status":
+            for month, entry in sorted(manifest()["months"].items()):
+                stats = entry["income"]
+                print(f"{month}: {entry['rows']} rows, {stats['total_count']} completed, "
+                      f"income {stats['total_income']:.2f}")
+            for month in sorted(manifest().get("pending", {})):
+                print(f"{month}: pending, finished by the next run")
+        else:
+            after_days = args.older_than_days
+            if after_days is None:
+                after_days = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+            archived = await run(db, after_days, args.dry_run)
+            for month, count in archived.items():
+                print(f"{month}: {count} appointment(s)")
+            print(f"{'Would archive' if args.dry_run else 'Archived'} "
+                  f"{sum(archived.values())} appointment(s) in {len(archived)} month(s)")
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old completed and cancelled appointments")
+    parser.add_argument("command", choices=["status", "run"])
+    parser.add_argument("--dry-run", action="store_true", help="report what would be archived without writing")
+    parser.add_argument("--older-than-days", type=int,
+                        help="archive months that ended more than this many days ago (default ARCHIVE_AFTER_DAYS)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,76 @@
+"""In-process read-through cache for small, rarely changing documents.
+
+Entries are grouped by the collection they were read from. A write in this
+worker invalidates its collection directly; writes in other workers are
+picked up by polling the collection version stamps (see versioning.py) at
+most once every `poll_interval` seconds, so a stale entry lives no longer
+than that.
+"""
+import os
+import time
+
+import versioning
+
+_MISSING = object()
+
+
+class ReadThroughCache:
+    def __init__(self, ttl=300.0, poll_interval=1.0):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._entries = {}
+        # Bumped on every invalidation so a load racing with a write is not stored
+        self._generations = {}
+        self._versions = {}
+        self._polled_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self, collection):
+        self._generations[collection] = self._generations.get(collection, 0) + 1
+        self._entries = {k: v for k, v in self._entries.items() if k[0] != collection}
+        self.invalidations += 1
+
+    async def _sync_versions(self, db, collection):
+        now = time.monotonic()
+        # A collection seen for the first time needs its baseline before anything is loaded
+        if collection in self._versions and now - self._polled_at < self.poll_interval:
+            return
+        self._polled_at = now
+        versions = await versioning.current(db, set(self._versions) | {collection})
+        for name, version in versions.items():
+            if name in self._versions and self._versions[name] != version:
+                self.invalidate(name)
+            self._versions[name] = version
+
+    async def get(self, db, collection, key, loader):
+        """Cached value for (collection, key), calling `loader()` on a miss."""
+        await self._sync_versions(db, collection)
+        value, expires_at = self._entries.get((collection, key), (_MISSING, 0))
+        if value is not _MISSING and expires_at > time.monotonic():
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self._generations.get(collection, 0)
+        value = await loader()
+        if self._generations.get(collection, 0) == generation:
+            self._entries[(collection, key)] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+documents = ReadThroughCache(
+    ttl=float(os.environ.get("CACHE_TTL_SECONDS", "300")),
+    poll_interval=float(os.environ.get("CACHE_VERSION_POLL_SECONDS", "1")),
+)
@@ -0,0 +1,76 @@
+"""Single-flight coalescing and micro-caching for expensive read endpoints.
+
+Requests are keyed on their route and ETag (see versioning.py), which already
+covers the path, the sorted query parameters and the version stamps of every
+collection the endpoint reads, as read by this request. Concurrent requests
+with the same key share one in-flight query. With a micro-cache window set for
+the route, the result is reused for that many seconds as well. Writes bump the
+stamps before they return, so a request that starts after a write has a
+different key and is never handed a result from before it.
+
+    COALESCE_WINDOWS   per-route micro-cache seconds by endpoint name, e.g.
+                       "get_income_stats=2,get_appointments=0.5" (default: none, coalescing only)
+
+Results are shared between requests, so callers must not modify them.
+"""
+import asyncio
+import os
+import time
+
+import metrics
+
+
+def _windows():
+    windows = {}
+    for item in os.environ.get("COALESCE_WINDOWS", "").split(","):
+        route, _, seconds = item.partition("=")
+        if route.strip() and seconds.strip():
+            windows[route.strip()] = float(seconds)
+    return windows
+
+
+class Coalescer:
+    def __init__(self, windows, max_entries=1000):
+        self.windows = windows
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._cached = {}  # key -> (expires_at, result)
+
+    async def run(self, route, key, loader):
+        """Result of `loader()`, shared with identical requests in flight or micro-cached."""
+        key = (route, key)
+        cached = self._cached.get(key)
+        if cached and cached[0] > time.monotonic():
+            metrics.COALESCED_REQUESTS.labels(route, "cached").inc()
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            outcome = "leader"
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(route, key, done))
+        else:
+            outcome = "coalesced"
+        metrics.COALESCED_REQUESTS.labels(route, outcome).inc()
+        # Shielded so one client going away doesn't cancel the query for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, route, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        window = self.windows.get(route)
+        if window:
+            if len(self._cached) >= self.max_entries:
+                self._evict()
+            self._cached[key] = (time.monotonic() + window, task.result())
+
+    def _evict(self):
+        now = time.monotonic()
+        self._cached = {key: entry for key, entry in self._cached.items() if entry[0] > now}
+        if len(self._cached) >= self.max_entries:
+            self._cached.clear()
+
+
+flights = Coalescer(_windows())
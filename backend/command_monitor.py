@@ -0,0 +1,58 @@
+"""Per-request accounting of the MongoDB commands (round trips) an endpoint issues.
+
+`command_listener` is registered on the Motor client. Motor copies the
+calling task's context into its executor threads, so the listener can
+attribute each command to the request that issued it through a ContextVar.
+With MONGO_COMMAND_HEADER=1 the count is reported in the X-Mongo-Commands
+response header, which tests/test_round_trips.py checks against budgets.
+"""
+from collections import Counter
+from contextvars import ContextVar
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+_current_commands: ContextVar = ContextVar("mongo_commands", default=None)
+
+
+class CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        commands = _current_commands.get()
+        if commands is not None:
+            commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+command_listener = CommandListener()
+
+
+class CommandCountMiddleware:
+    """Adds X-Mongo-Commands (total) and X-Mongo-Command-Names to every HTTP response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        commands = Counter()
+        token = _current_commands.set(commands)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Mongo-Commands", str(sum(commands.values())))
+                headers.append("X-Mongo-Command-Names", ",".join(f"{k}={v}" for k, v in sorted(commands.items())))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current_commands.reset(token)
@@ -0,0 +1,115 @@
+"""gzip / brotli compression of API responses.
+
+Responses whose body is at least COMPRESS_MIN_BYTES (default 1024; empty
+disables compression) are sent brotli-encoded when the client accepts `br`
+and the Brotli package is installed, gzip-encoded when it accepts `gzip`.
+Smaller bodies aren't worth the CPU. Streamed responses (exports, which can
+gzip themselves) and bodies that already have a Content-Encoding pass through.
+
+    BROTLI_QUALITY   0-11 (default 4: most of the size win for little CPU)
+    GZIP_LEVEL       1-9 (default 6)
+
+A compressed body is a different representation of the same resource, so its
+ETag is sent weak; versioning.matches compares weakly and 304s keep working.
+"""
+import gzip
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+
+
+def min_bytes():
+    value = os.environ.get("COMPRESS_MIN_BYTES", "1024")
+    return int(value) if value else None
+
+
+def accepted_codings(accept_encoding):
+    """Content codings the Accept-Encoding header allows (q > 0), lower-cased."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def choose_coding(accept_encoding):
+    """Coding to use for a request's Accept-Encoding header: "br", "gzip" or None."""
+    accepted = accepted_codings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_coding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if message.get("more_body", False) or "content-encoding" in headers or len(body) < self.minimum_size:
+                passthrough = True
+                headers.add_vary_header("Accept-Encoding")
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, coding)
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
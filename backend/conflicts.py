@@ -0,0 +1,96 @@
+"""Scheduling-conflict detection between scheduled appointments.
+
+A trip occupies [pickup_at, end), where end is its arrival_at, or pickup_at
+plus TRIP_DEFAULT_MINUTES when the arrival is missing or not after the pickup.
+Trips are capped at TRIP_MAX_HOURS, and that cap is what bounds the search:
+anything overlapping [start, end) was picked up after start - TRIP_MAX_HOURS
+and before end. One range scan of the (status, pickup_at, arrival_at, id)
+index, covered so no documents are read, finds every candidate in
+O(log n + k), k being the scheduled trips picked up in that window, no matter
+how much history the collection holds.
+
+    TRIP_DEFAULT_MINUTES   trip length assumed without an arrival time (default 60)
+    TRIP_MAX_HOURS         longest trip considered (default 12)
+"""
+import heapq
+import os
+from datetime import timedelta, timezone
+
+DEFAULT_TRIP = timedelta(minutes=float(os.environ.get("TRIP_DEFAULT_MINUTES", "60")))
+MAX_TRIP = timedelta(hours=float(os.environ.get("TRIP_MAX_HOURS", "12")))
+
+WINDOW_PROJECTION = {"_id": 0, "id": 1, "pickup_at": 1, "arrival_at": 1}
+
+
+def _aware(value):
+    # Motor hands back naive UTC datetimes
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def window(pickup_at, arrival_at):
+    """(start, end) of the time a trip occupies, or None without a pickup time."""
+    start = _aware(pickup_at)
+    if start is None:
+        return None
+    arrival_at = _aware(arrival_at)
+    if arrival_at is None or arrival_at <= start:
+        return start, start + DEFAULT_TRIP
+    return start, min(arrival_at, start + MAX_TRIP)
+
+
+def _scheduled_from(pickup_range):
+    return {"status": "scheduled", "pickup_at": pickup_range}
+
+
+async def for_appointment(db, appointment):
+    """Ids of scheduled appointments overlapping `appointment`, when it is scheduled itself."""
+    if appointment.get("status") != "scheduled":
+        return []
+    trip = window(appointment.get("pickup_at"), appointment.get("arrival_at"))
+    if trip is None:
+        return []
+    start, end = trip
+    query = _scheduled_from({"$gt": start - MAX_TRIP, "$lt": end})
+    query["id"] = {"$ne": appointment["id"]}
+    conflicting = []
+    async for doc in db.appointments.find(query, WINDOW_PROJECTION).sort("pickup_at", 1):
+        other = window(doc.get("pickup_at"), doc.get("arrival_at"))
+        if other[1] > start:
+            conflicting.append(doc["id"])
+    return conflicting
+
+
+async def in_range(db, pickup_range=None):
+    """Every overlapping pair of scheduled trips whose overlap falls in `pickup_range`.
+
+    `pickup_range` is a Mongo range from times.range_filter, or None for all
+    time. Trips are read in pickup order and swept with a heap of the ones
+    still running, so the cost is O(n log n + pairs) for n trips in range.
+    Returns dicts with both ids, the later-starting one first, and the overlap.
+    """
+    pickup_range = dict(pickup_range or {})
+    range_start = pickup_range.pop("$gte", None)
+    if range_start is not None:
+        # Trips that started earlier can still be running at range_start
+        pickup_range["$gt"] = range_start - MAX_TRIP
+    query = _scheduled_from(pickup_range) if pickup_range else {"status": "scheduled", "pickup_at": {"$ne": None}}
+
+    pairs = []
+    running = []  # heap of (end, id) of trips not yet finished
+    async for doc in db.appointments.find(query, WINDOW_PROJECTION).sort("pickup_at", 1):
+        start, end = window(doc["pickup_at"], doc.get("arrival_at"))
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for other_end, other_id in running:
+            overlap_end = min(end, other_end)
+            if range_start is None or overlap_end > range_start:
+                pairs.append({
+                    "appointment_id": doc["id"],
+                    "conflicting_id": other_id,
+                    "overlap_start": start.isoformat(),
+                    "overlap_end": overlap_end.isoformat(),
+                })
+        heapq.heappush(running, (end, doc["id"]))
+    return pairs
@@ -0,0 +1,207 @@
+"""Change feed for open dashboards, served as server-sent events on /api/events.
+
+Write endpoints publish small events (what changed, its id and, for creates
+and updates, the document as the API returns it) to an in-process bus. Each
+event is encoded once at publish time and handed to every connection's
+bounded queue, so an idle connection costs one sleeping coroutine, woken only
+by an event or the heartbeat. A connection that falls a whole queue behind is
+closed; it reconnects and catches up from the buffer like any other.
+
+The bus only sees its own worker's writes. With EVENTS_CHANGE_STREAMS=1 and a
+replica set (a single-node one will do) a MongoDB change stream feeds the bus
+instead, so every worker sees every write; while that stream is open the
+endpoints' own publish calls are ignored. A change stream delete only
+carries the document's `_id`: appointment deletes take our id from the
+tombstone written with them, and type and template deletes from an `_id` ->
+id map of those small collections, read when the stream opens and kept up to
+date from it. A delete the map can't resolve is published with a null id,
+and the client refetches that collection.
+
+Event ids are "<process id>-<sequence>". The last EVENTS_BUFFER (default 1000)
+events are kept, so a client reconnecting with Last-Event-ID is sent what it
+missed. An id from another process or older than the buffer gets a `reset`
+event instead, and the client should refetch.
+
+    EVENTS_HEARTBEAT_SECONDS   comment line sent on idle connections (default 15)
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+RETRY_MS = 3000
+
+# Collection -> event name
+WATCHED = {
+    "appointments": "appointment",
+    "appointment_types": "appointment_type",
+    "sms_templates": "sms_template",
+}
+TOMBSTONES = "appointment_tombstones"
+
+
+def _frame(event_id, name, payload):
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n".encode()
+
+
+class _Subscription:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+
+class EventBus:
+    def __init__(self, buffer_size=1000, queue_size=256):
+        self.process_id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.recent = deque(maxlen=buffer_size)  # (seq, frame)
+        self.local = True
+        self._queue_size = queue_size
+        self._subscribers = set()
+
+    @property
+    def last_event_id(self):
+        return f"{self.process_id}-{self.seq}"
+
+    def publish(self, name, action, id, data=None, local=True):
+        """Send an event to every connection; `local` ones are dropped while a change stream feeds the bus."""
+        if local and not self.local:
+            return
+        self.seq += 1
+        frame = _frame(self.last_event_id, name, {"action": action, "id": id, "data": data})
+        self.recent.append((self.seq, frame))
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait((self.seq, frame))
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self._subscribers.discard(subscription)
+
+    def _missed(self, last_event_id):
+        """Frames after `last_event_id`, or None if it can't be resumed from."""
+        process_id, _, seq = last_event_id.partition("-")
+        if process_id != self.process_id or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        seq = int(seq)
+        oldest = self.recent[0][0] if self.recent else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return [(s, frame) for s, frame in self.recent if s > seq]
+
+    def _marker(self, name):
+        return _frame(self.last_event_id, name, {})
+
+    async def stream(self, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """SSE byte frames for one connection, until it's closed or falls too far behind."""
+        # Subscribe before replaying so nothing published in between is lost
+        subscription = _Subscription(self._queue_size)
+        self._subscribers.add(subscription)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            sent = self.seq
+            missed = self._missed(last_event_id) if last_event_id else None
+            if missed is None:
+                yield self._marker("reset" if last_event_id else "ready")
+            else:
+                for _, frame in missed:
+                    yield frame
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    if subscription.overflowed:
+                        return
+                    yield b": heartbeat\n\n"
+                    continue
+                if item is None:
+                    return
+                seq, frame = item
+                if seq > sent:
+                    yield frame
+                if subscription.overflowed and subscription.queue.empty():
+                    return
+        finally:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """End every open stream, e.g. at shutdown."""
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+        self._subscribers.clear()
+
+    def stats(self):
+        return {"connections": len(self._subscribers), "last_event_id": self.last_event_id,
+                "buffered": len(self.recent), "source": "local" if self.local else "change_stream"}
+
+
+bus = EventBus(buffer_size=int(os.environ.get("EVENTS_BUFFER", "1000")))
+
+
+def _publish_change(change, shape, ids):
+    """Publish one change stream event; `ids` maps (collection, _id) to our id for non-appointments."""
+    collection = change["ns"]["coll"]
+    operation = change["operationType"]
+    if collection == TOMBSTONES:
+        # Appointment deletes carry only _id; the tombstone written with them has our id
+        if operation == "insert":
+            bus.publish("appointment", "deleted", change["fullDocument"]["id"], local=False)
+        return
+    name = WATCHED[collection]
+    if operation in ("insert", "update", "replace"):
+        doc = change.get("fullDocument")
+        if doc is None:  # deleted again before the lookup
+            return
+        if collection != "appointments":
+            ids[(collection, doc["_id"])] = doc.get("id")
+        action = "created" if operation == "insert" else "updated"
+        bus.publish(name, action, doc.get("id"), shape(name, doc), local=False)
+    elif operation == "delete" and collection != "appointments":
+        bus.publish(name, "deleted", ids.pop((collection, change["documentKey"]["_id"]), None), local=False)
+
+
+async def _known_ids(db):
+    """(collection, _id) -> id for the watched collections other than appointments."""
+    ids = {}
+    for collection in WATCHED:
+        if collection != "appointments":
+            async for doc in db[collection].find({}, {"_id": 1, "id": 1}):
+                ids[(collection, doc["_id"])] = doc.get("id")
+    return ids
+
+
+async def watch(db, shape):
+    """Feed the bus from a change stream on the watched collections, resuming after errors.
+
+    `shape(name, doc)` turns a stored document into the event's data.
+    """
+    pipeline = [{"$match": {"ns.coll": {"$in": [*WATCHED, TOMBSTONES]}}}]
+    resume_token = None
+    delay = 1
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                # Read after opening, so a document created in between is in the map or on the stream
+                ids = await _known_ids(db)
+                bus.local = False
+                delay = 1
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    _publish_change(change, shape, ids)
+        except PyMongoError as e:
+            logger.warning("Change stream unavailable, publishing locally; retrying in %ss: %s", delay, e)
+        finally:
+            bus.local = True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
@@ -0,0 +1,70 @@
+"""Streaming CSV / NDJSON encoders for export endpoints.
+
+Each encoder consumes an async Motor cursor and yields bytes chunks, so an
+export holds at most one batch of rows in memory regardless of its size.
+"""
+import csv
+import io
+import json
+import zlib
+
+# Flush a chunk to the client once this many bytes are buffered
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+async def csv_chunks(cursor, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    # BOM so spreadsheet apps detect UTF-8 (client names are mostly Chinese)
+    buffer.write("\ufeff")
+    writer.writeheader()
+    # Send the header right away so the first byte isn't held back by the query
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+
+    async for doc in cursor:
+        writer.writerow(doc)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def ndjson_chunks(cursor):
+    lines = []
+    size = 0
+    async for doc in cursor:
+        line = json.dumps(doc, ensure_ascii=False, default=str) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(lines).encode()
+            lines = []
+            size = 0
+    if lines:
+        yield "".join(lines).encode()
+
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode(cursor, fmt, fields, gzip=False):
+    """Chunk iterator, media type and file extension for a streamed export."""
+    chunks = csv_chunks(cursor, fields) if fmt == "csv" else ndjson_chunks(cursor)
+    if gzip:
+        return gzip_chunks(chunks), "application/gzip", f"{fmt}.gz"
+    return chunks, MEDIA_TYPES[fmt], fmt
@@ -0,0 +1,41 @@
+"""Opt-in fast JSON rendering for the list endpoints.
+
+By default FastAPI validates every returned document against the endpoint's
+response_model, rebuilds it as a model instance and serializes it again. With
+FAST_JSON_RESPONSES=1 the list endpoints skip that and render their MongoDB
+documents directly. This is safe because every write path builds its document
+from the Pydantic models (validation on write), and the reads project exactly
+the model's fields, so internal fields such as sync_seq never leak. orjson is
+used when it is installed, the stdlib encoder otherwise.
+
+    python scripts/bench_serialization.py   # per-request CPU, before and after
+"""
+import json
+import os
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENABLED = os.environ.get("FAST_JSON_RESPONSES") == "1"
+
+
+def projection(model):
+    """MongoDB projection returning exactly the fields of `model`."""
+    return {"_id": 0, **{field: 1 for field in model.model_fields}}
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that renders trusted content as-is, with orjson when available."""
+
+    def render(self, content):
+        return dumps(content)
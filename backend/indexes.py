@@ -0,0 +1,211 @@
+"""Managed MongoDB index set.
+
+The backend declares every index it relies on here and reconciles the live
+collections against this list at startup. Bump INDEX_VERSION whenever
+INDEX_SPECS changes so the applied version recorded in ``schema_meta`` shows
+which set a deployment is running.
+
+Only indexes this module created are ever dropped: the names it manages are
+recorded in ``schema_meta`` next to the version, and an index that is neither
+declared nor recorded (say, one an operator added by hand) is left in place
+and logged.
+"""
+import logging
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from sync import TOMBSTONE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+INDEX_SPECS = {
+    "appointments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # `id` trails pickup_time so keyset pagination on (pickup_time, id) needs no in-memory sort
+        IndexModel([("pickup_time", ASCENDING), ("id", ASCENDING)], name="pickup_time_id"),
+        IndexModel([("status", ASCENDING), ("pickup_time", ASCENDING), ("id", ASCENDING)], name="status_pickup_time_id"),
+        IndexModel(
+            [("appointment_type_id", ASCENDING), ("pickup_time", ASCENDING), ("id", ASCENDING)],
+            name="type_pickup_time_id",
+        ),
+        # Typed UTC times (see times.py) for date and range filters
+        IndexModel([("pickup_at", ASCENDING)], name="pickup_at"),
+        # arrival_at and id make the conflict scan in conflicts.py a covered query
+        IndexModel(
+            [("status", ASCENDING), ("pickup_at", ASCENDING), ("arrival_at", ASCENDING), ("id", ASCENDING)],
+            name="status_pickup_at_window",
+        ),
+        IndexModel([("appointment_type_id", ASCENDING), ("pickup_at", ASCENDING)], name="type_pickup_at"),
+        # Client drill-down: exact name, optional status, date range, keyset on (pickup_at, id)
+        IndexModel(
+            [("client_name", ASCENDING), ("status", ASCENDING), ("pickup_at", ASCENDING), ("id", ASCENDING)],
+            name="client_status_pickup_at_id",
+        ),
+        # ... and its page in (pickup_at, id) order without a status filter
+        IndexModel([("client_name", ASCENDING), ("pickup_at", ASCENDING), ("id", ASCENDING)], name="client_pickup_at_id"),
+        IndexModel([("sync_seq", ASCENDING)], name="sync_seq"),
+        # Delta sync's recheck of recently applied writes (see sync.py)
+        IndexModel([("synced_at", ASCENDING)], name="synced_at"),
+        IndexModel([("client_search_keys", ASCENDING)], name="client_search_keys"),
+    ],
+    "clients": [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        IndexModel([("client_search_keys", ASCENDING)], name="client_search_keys"),
+        IndexModel([("count", DESCENDING)], name="count"),
+    ],
+    "appointment_tombstones": [
+        IndexModel([("sync_seq", ASCENDING)], name="sync_seq"),
+        # TTL in the name so a changed retention is reconciled as a new index
+        IndexModel(
+            [("deleted_at", ASCENDING)],
+            name=f"deleted_at_ttl_{TOMBSTONE_TTL_SECONDS}",
+            expireAfterSeconds=TOMBSTONE_TTL_SECONDS,
+        ),
+    ],
+    "appointment_types": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "sms_templates": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "income_daily": [
+        IndexModel(
+            [("day", ASCENDING), ("client_name", ASCENDING), ("appointment_type_id", ASCENDING)],
+            name="day_client_type_unique",
+            unique=True,
+        ),
+    ],
+    # auth_config has no `id`; its natural key is the user name
+    "auth_config": [
+        IndexModel([("user", ASCENDING)], name="user_unique", unique=True),
+    ],
+}
+
+_DAY_START = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_DAY_END = datetime(2000, 1, 2, tzinfo=timezone.utc)
+_YEAR_END = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+# Representative filters for the hot read paths, used by the index report to
+# confirm each one is served by an index rather than a collection scan.
+HOT_QUERIES = {
+    "appointment_by_id": ("appointments", {"id": ""}),
+    "appointments_by_status_and_day": (
+        "appointments",
+        {"status": "scheduled", "pickup_at": {"$gte": _DAY_START, "$lt": _DAY_END}},
+    ),
+    "appointments_by_type_and_day": (
+        "appointments",
+        {"appointment_type_id": "", "pickup_at": {"$gte": _DAY_START, "$lt": _DAY_END}},
+    ),
+    "scheduled_conflict_window": (
+        "appointments",
+        {"status": "scheduled", "pickup_at": {"$gt": _DAY_START, "$lt": _DAY_END}, "id": {"$ne": ""}},
+    ),
+    "appointments_by_type": ("appointments", {"appointment_type_id": ""}),
+    "client_appointments_in_range": (
+        "appointments",
+        {"client_name": "", "status": "completed", "pickup_at": {"$gte": _DAY_START, "$lt": _YEAR_END}},
+    ),
+    "client_appointments_any_status": (
+        "appointments",
+        {"client_name": "", "pickup_at": {"$gte": _DAY_START, "$lt": _YEAR_END}},
+    ),
+    "income_completed_in_range": (
+        "appointments",
+        {"status": "completed", "pickup_at": {"$gte": _DAY_START, "$lt": _YEAR_END}},
+    ),
+}
+
+
+async def ensure_indexes(db):
+    """Create missing indexes and drop the ones this module created that are no longer declared."""
+    applied = await db.schema_meta.find_one({"_id": "indexes"}) or {}
+    managed = applied.get("managed", {})
+    for collection_name, models in INDEX_SPECS.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        wanted = {model.document["name"] for model in models}
+        ours = set(managed.get(collection_name, []))
+
+        for name in existing:
+            if name == "_id_" or name in wanted:
+                continue
+            if name in ours:
+                logger.info("Dropping retired index %s.%s", collection_name, name)
+                await collection.drop_index(name)
+            else:
+                logger.warning("Leaving index %s.%s in place: not declared in indexes.py", collection_name, name)
+
+        missing = [model for model in models if model.document["name"] not in existing]
+        if not missing:
+            continue
+        try:
+            created = await collection.create_indexes(missing)
+            logger.info("Created indexes on %s: %s", collection_name, ", ".join(created))
+        except OperationFailure as e:
+            # e.g. duplicate ids in legacy data; keep serving and report it
+            logger.error("Failed to create indexes on %s: %s", collection_name, e)
+
+    await db.schema_meta.update_one(
+        {"_id": "indexes"},
+        {"$set": {
+            "version": INDEX_VERSION,
+            "applied_at": datetime.now(timezone.utc).isoformat(),
+            "managed": {name: sorted(model.document["name"] for model in models) for name, models in INDEX_SPECS.items()},
+        }},
+        upsert=True,
+    )
+
+
+def winning_stages(plan):
+    """Flatten a winning plan into its list of stage names, outermost first."""
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            plan = plan["inputStages"][0]
+        else:
+            plan = None
+    return stages
+
+
+async def index_usage_report(db):
+    """Per-index access counters plus the plan chosen for each hot query."""
+    applied = await db.schema_meta.find_one({"_id": "indexes"})
+    report = {
+        "declared_version": INDEX_VERSION,
+        "applied_version": applied.get("version") if applied else None,
+        "collections": {},
+        "hot_queries": {},
+    }
+
+    for collection_name in INDEX_SPECS:
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        report["collections"][collection_name] = [
+            {
+                "name": s["name"],
+                "key": dict(s["key"]),
+                "ops": s["accesses"]["ops"],
+                "since": s["accesses"]["since"].isoformat(),
+            }
+            for s in stats
+        ]
+
+    for label, (collection_name, query) in HOT_QUERIES.items():
+        explain = await db.command("explain", {"find": collection_name, "filter": query}, verbosity="queryPlanner")
+        winning = explain["queryPlanner"]["winningPlan"]
+        # slot-based engine plans nest the classic tree under queryPlan
+        stages = winning_stages(winning.get("queryPlan", winning))
+        report["hot_queries"][label] = {
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        }
+
+    return report
@@ -0,0 +1,204 @@
+"""Prometheus metrics for HTTP routes and MongoDB commands, served on /metrics.
+
+`MetricsMiddleware` times every HTTP request and records its status and
+response size per route template (not raw path, so ids don't explode the
+label set). `command_listener` and `pool_listener` are registered on the
+Motor client and record per-collection, per-command latency and document
+counts, and connection pool gauges. Recording is a few dict lookups and
+lock-protected additions per event; rendering happens only on scrape.
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR to a shared, empty
+directory so /metrics aggregates all of them.
+"""
+import os
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+registry = CollectorRegistry()
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body byte is sent",
+    ["method", "route", "status"], registry=registry,
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size",
+    ["method", "route"], registry=registry,
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency as seen by the driver",
+    ["command", "collection"], registry=registry,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+MONGO_DOCUMENTS = Histogram(
+    "mongodb_command_documents", "Documents returned or written by a MongoDB command",
+    ["command", "collection"], registry=registry,
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000),
+)
+MONGO_FAILURES = Counter(
+    "mongodb_command_failures_total", "MongoDB commands that returned an error",
+    ["command", "collection"], registry=registry,
+)
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests_total",
+    "Coalesced reads by outcome: leader ran the query, coalesced joined one in flight, cached hit the micro-cache",
+    ["route", "outcome"], registry=registry,
+)
+POOL_CONNECTIONS = Gauge(
+    "mongodb_pool_connections", "Open connections in the MongoDB pool",
+    ["address"], registry=registry, multiprocess_mode="livesum",
+)
+POOL_CHECKED_OUT = Gauge(
+    "mongodb_pool_checked_out_connections", "MongoDB connections currently in use",
+    ["address"], registry=registry, multiprocess_mode="livesum",
+)
+
+# Commands whose name field holds something other than the collection name
+_COLLECTION_FIELD = {"getMore": "collection"}
+_UNTRACKED = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+def _collection(event):
+    name = event.command.get(_COLLECTION_FIELD.get(event.command_name, event.command_name))
+    return name if isinstance(name, str) else ""
+
+
+def _document_count(command_name, reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if "n" in reply:
+        return reply["n"]
+    return None
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        # started events carry the command, succeeded/failed only the request id
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in _UNTRACKED:
+            return
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = _collection(event)
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        count = _document_count(event.command_name, event.reply)
+        if count is not None:
+            MONGO_DOCUMENTS.labels(event.command_name, collection).observe(count)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name, collection).inc()
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def _address(self, event):
+        return "%s:%s" % event.address
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).set(0)
+        POOL_CHECKED_OUT.labels(self._address(event)).set(0)
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        POOL_CHECKED_OUT.labels(self._address(event)).inc()
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+
+command_listener = CommandMetricsListener()
+pool_listener = PoolMetricsListener()
+
+
+class MetricsMiddleware:
+    """Records latency, status and response size of every HTTP request by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.labels(method, template, str(status)).observe(time.perf_counter() - started)
+            HTTP_RESPONSE_SIZE.labels(method, template).observe(size)
+
+
+def render():
+    """(body, content type) of the current metrics in Prometheus text format."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return generate_latest(collected), CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
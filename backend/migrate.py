@@ -0,0 +1,218 @@
+"""Versioned data migrations.
+
+Migrations live in `migrations/` as numbered modules (`0001_name.py`), each
+with a docstring and an `async def up(ctx)`. They run in order, and each one
+that completes is recorded in the `schema_migrations` collection, so running
+the tool again only applies the new ones.
+
+Steps must be idempotent: a step selects only documents that still need the
+change. `MigrationContext.update_in_batches` walks them in `_id` order in
+bounded bulk_write chunks, checkpoints the last `_id` after every chunk (an
+interrupted run resumes from there), and sleeps between chunks in proportion
+to how long each took, so a migration over millions of appointments leaves
+room for API traffic. With `resync=True` each modified appointment also gets
+a new `sync_seq`, `updated_at` and `synced_at`, so delta-sync clients fetch it again.
+
+A migration that changes what the API returns bumps the version stamps of the
+collections it touched (see versioning.py), so cached responses and ETags
+don't outlive it.
+
+    python migrate.py status
+    python migrate.py up [--dry-run] [--target N] [--batch-size N] [--throttle R]
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+import sync
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+def discover():
+    """(number, name, module) for every migration module, in order."""
+    found = []
+    for path in sorted(MIGRATIONS_DIR.glob("[0-9][0-9][0-9][0-9]_*.py")):
+        number = int(path.stem[:4])
+        found.append((number, path.stem, importlib.import_module(f"migrations.{path.stem}")))
+    numbers = [number for number, _, _ in found]
+    if len(numbers) != len(set(numbers)):
+        raise RuntimeError(f"Duplicate migration numbers in {MIGRATIONS_DIR}")
+    return found
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m" if seconds >= 3600 else f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class MigrationContext:
+    """What a migration's `up(ctx)` gets: the database plus batching, checkpoints and throttling."""
+
+    def __init__(self, db, number, dry_run=False, batch_size=500, throttle=1.0):
+        self.db = db
+        self.number = number
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.throttle = throttle
+
+    def log(self, message):
+        print(f"  [{self.number:04d}]{' (dry run)' if self.dry_run else ''} {message}")
+
+    async def _checkpoint(self, step):
+        record = await self.db[MIGRATIONS_COLLECTION].find_one({"_id": self.number}, {"checkpoints": 1})
+        return ((record or {}).get("checkpoints") or {}).get(step)
+
+    async def _save_checkpoint(self, step, last_id):
+        await self.db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": self.number}, {"$set": {f"checkpoints.{step}": last_id}}
+        )
+
+    async def _resynced(self, updates):
+        """`updates` with a fresh sync_seq, updated_at and synced_at set by each, so delta sync sends the rows again."""
+        first = await sync.reserve_seqs(self.db, len(updates))
+        updated_at = datetime.now(timezone.utc).isoformat()
+        return [
+            (_id, sync.stamped({**update, "$set": {**update.get("$set", {}), "sync_seq": first + i, "updated_at": updated_at}}))
+            for i, (_id, update) in enumerate(updates)
+        ]
+
+    async def update_in_batches(self, step, collection, query, projection, make_update, resync=False):
+        """Apply `make_update(doc)` (an update document, or None to skip) to every doc matching `query`.
+
+        `resync` is for appointments: see the module docstring.
+        Returns the number of documents modified (or, in a dry run, that would be).
+        """
+        coll = self.db[collection]
+        total = await coll.count_documents(query)
+        last_id = None if self.dry_run else await self._checkpoint(step)
+        if last_id is not None:
+            self.log(f"{step}: resuming after _id {last_id}")
+        self.log(f"{step}: {total} {collection} to check")
+
+        done = modified = 0
+        started = reported = time.monotonic()
+        while True:
+            batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            batch_started = time.monotonic()
+            docs = await coll.find(batch_query, projection).sort("_id", 1).limit(self.batch_size).to_list(None)
+            if not docs:
+                break
+
+            updates = []
+            for doc in docs:
+                update = make_update(doc)
+                if update:
+                    updates.append((doc["_id"], update))
+            if self.dry_run:
+                modified += len(updates)
+            elif updates:
+                if resync:
+                    updates = await self._resynced(updates)
+                ops = [UpdateOne({"_id": _id}, update) for _id, update in updates]
+                modified += (await coll.bulk_write(ops, ordered=False)).modified_count
+            last_id = docs[-1]["_id"]
+            if not self.dry_run:
+                await self._save_checkpoint(step, last_id)
+            done += len(docs)
+
+            now = time.monotonic()
+            if now - reported >= PROGRESS_INTERVAL:
+                reported = now
+                rate = done / (now - started)
+                remaining = max(total - done, 0) / rate if rate else 0
+                percent = done * 100 // total if total else 100
+                self.log(f"{step}: {done}/{total} ({percent}%), {rate:.0f} docs/s, ETA {_format_seconds(remaining)}")
+            # Stay idle `throttle` times as long as the batch took, leaving the database to the API
+            await asyncio.sleep((now - batch_started) * self.throttle)
+
+        self.log(f"{step}: {modified} {'to modify' if self.dry_run else 'modified'} in {_format_seconds(time.monotonic() - started)}")
+        return modified
+
+
+async def applied_migrations(db):
+    return {
+        record["_id"]: record
+        async for record in db[MIGRATIONS_COLLECTION].find({"status": "applied"})
+    }
+
+
+async def run(db, target=None, dry_run=False, batch_size=500, throttle=1.0):
+    """Apply pending migrations up to `target` (all by default); returns the numbers applied."""
+    applied = await applied_migrations(db)
+    ran = []
+    for number, name, module in discover():
+        if number in applied or (target is not None and number > target):
+            continue
+        print(f"Migration {name}{' (dry run)' if dry_run else ''}: {(module.__doc__ or '').strip().splitlines()[0]}")
+        started = datetime.now(timezone.utc)
+        if not dry_run:
+            await db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": number},
+                {"$set": {"name": name, "status": "running", "started_at": started.isoformat()}},
+                upsert=True,
+            )
+        ctx = MigrationContext(db, number, dry_run=dry_run, batch_size=batch_size, throttle=throttle)
+        await module.up(ctx)
+        if not dry_run:
+            finished = datetime.now(timezone.utc)
+            await db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": number},
+                {
+                    "$set": {
+                        "status": "applied",
+                        "applied_at": finished.isoformat(),
+                        "duration_seconds": (finished - started).total_seconds(),
+                    },
+                    "$unset": {"checkpoints": ""},
+                },
+            )
+        ran.append(number)
+    return ran
+
+
+async def status(db):
+    applied = await applied_migrations(db)
+    for number, name, module in discover():
+        record = applied.get(number)
+        state = f"applied {record['applied_at']}" if record else "pending"
+        print(f"{name:<40} {state}")
+
+
+async def main(args):
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.command == "status":
+            await status(db)
+        else:
+            ran = await run(db, args.target, args.dry_run, args.batch_size, args.throttle)
+            print(f"{'Checked' if args.dry_run else 'Applied'} {len(ran)} migration(s)")
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned data migrations")
+    parser.add_argument("command", choices=["status", "up"])
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--target", type=int, help="stop after this migration number")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--throttle", type=float, default=1.0,
+                        help="idle time after each batch, as a multiple of the time the batch took")
+    sys.exit(asyncio.run(main(parser.parse_args())))
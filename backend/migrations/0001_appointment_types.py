@@ -0,0 +1,66 @@
+"""Create the default appointment types and give every appointment an appointment_type_id.
+
+Appointments from before configurable types carry a fixed `appointment_type`
+key (airport, city, ...); it is mapped to the default type of the same
+meaning and removed. Retyped appointments are re-sent to delta-sync clients,
+and the income rollup, bucketed by type, is marked stale until rebuilt.
+"""
+import uuid
+
+import rollups
+import versioning
+
+DEFAULT_TYPES = [
+    {"name": "機場接送", "color": "#9333ea", "icon": "Plane"},
+    {"name": "市區接送", "color": "#06b6d4", "icon": "Car"},
+    {"name": "商務用車", "color": "#64748b", "icon": "Briefcase"},
+    {"name": "私人行程", "color": "#10b981", "icon": "User"},
+    {"name": "VIP 專屬", "color": "#f59e0b", "icon": "Star"},
+]
+
+# Legacy appointment_type value -> default type name
+LEGACY_TYPES = {
+    "airport": "機場接送",
+    "city": "市區接送",
+    "corporate": "商務用車",
+    "personal": "私人行程",
+    "vip": "VIP 專屬",
+}
+
+
+async def up(ctx):
+    db = ctx.db
+    if not await db.appointment_types.find_one({}, {"_id": 1}):
+        types = [{"id": str(uuid.uuid4()), **t, "created_at": "2025-10-18T00:00:00"} for t in DEFAULT_TYPES]
+        if not ctx.dry_run:
+            await db.appointment_types.insert_many(types)
+            await versioning.bump(db, "appointment_types")
+        ctx.log(f"created {len(types)} default appointment types")
+    else:
+        types = await db.appointment_types.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+
+    if not types:
+        return
+    default_type_id = types[0]["id"]
+    ids_by_name = {t["name"]: t["id"] for t in types}
+
+    def map_legacy_type(doc):
+        name = LEGACY_TYPES.get(doc.get("appointment_type"))
+        return {
+            "$set": {"appointment_type_id": ids_by_name.get(name, default_type_id)},
+            "$unset": {"appointment_type": ""},
+        }
+
+    retyped = await ctx.update_in_batches(
+        "legacy_type_field", "appointments",
+        {"appointment_type": {"$exists": True}}, {"appointment_type": 1}, map_legacy_type, resync=True,
+    )
+    retyped += await ctx.update_in_batches(
+        "missing_type_id", "appointments",
+        {"appointment_type_id": {"$exists": False}}, {"_id": 1},
+        lambda doc: {"$set": {"appointment_type_id": default_type_id}}, resync=True,
+    )
+    if retyped and not ctx.dry_run:
+        await versioning.bump(db, "appointments")
+        await rollups.invalidate(db)
+        ctx.log("income rollup marked stale, run `python rollups.py rebuild` after migrating")
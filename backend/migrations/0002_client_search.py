@@ -0,0 +1,14 @@
+"""Add client-name search keys to appointments and rebuild the clients collection (see search.py)."""
+import search
+
+
+async def up(ctx):
+    await ctx.update_in_batches(
+        "search_fields", "appointments",
+        {"client_search_keys": {"$exists": False}}, {"client_name": 1},
+        lambda doc: {"$set": search.search_fields(doc.get("client_name"))},
+    )
+    if ctx.dry_run:
+        return
+    clients = await search.rebuild_clients(ctx.db, ctx.batch_size)
+    ctx.log(f"indexed {clients} clients")
@@ -0,0 +1,22 @@
+"""Add UTC pickup_at / arrival_at to appointments (see times.py).
+
+The fields aren't part of the API's appointments, so rows aren't re-sent to
+delta-sync clients, but every date filter and a rollup rebuild read them.
+"""
+import rollups
+import times
+import versioning
+
+
+async def up(ctx):
+    # Set both fields even when a string is missing, so the row isn't selected again
+    typed = await ctx.update_in_batches(
+        "typed_times", "appointments",
+        {"pickup_at": {"$exists": False}}, dict.fromkeys(times.TYPED_FIELDS, 1),
+        lambda doc: {"$set": times.typed_fields({field: doc.get(field) for field in times.TYPED_FIELDS})},
+    )
+    if typed and not ctx.dry_run:
+        await versioning.bump(ctx.db, "appointments")
+        # A rollup rebuilt before this put rows without pickup_at in no day
+        await rollups.invalidate(ctx.db)
+        ctx.log("income rollup marked stale, run `python rollups.py rebuild` after migrating")
@@ -0,0 +1,15 @@
+"""Rename the appointment type 「別的駕駛」 to 「代理駕駛」."""
+import versioning
+
+OLD_NAME = "別的駕駛"
+NEW_NAME = "代理駕駛"
+
+
+async def up(ctx):
+    renamed = await ctx.update_in_batches(
+        "rename", "appointment_types", {"name": OLD_NAME}, {"_id": 1},
+        lambda doc: {"$set": {"name": NEW_NAME}},
+    )
+    if renamed and not ctx.dry_run:
+        # The type list is cached by the API and revalidated with ETags
+        await versioning.bump(ctx.db, "appointment_types")
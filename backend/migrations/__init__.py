@@ -0,0 +1 @@
+"""Numbered data migrations, applied in order by `python migrate.py up`."""
@@ -0,0 +1,58 @@
+"""MongoDB client settings and connection warm-up.
+
+Pool, timeout and compression settings come from the environment:
+
+    MONGO_MAX_POOL_SIZE                 connections per server (default 100)
+    MONGO_MIN_POOL_SIZE                 connections kept open and warmed at startup (default 10)
+    MONGO_MAX_IDLE_TIME_MS              close connections idle this long (default: never)
+    MONGO_CONNECT_TIMEOUT_MS            TCP connect + handshake (default 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   wait for a usable server (default 5000)
+    MONGO_SOCKET_TIMEOUT_MS             per-operation network timeout (default: none)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         wait for a free pooled connection (default: none)
+    MONGO_COMPRESSORS                   e.g. "zstd,zlib"; zstd/snappy need their packages (default: none)
+"""
+import asyncio
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+_INT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", "100"),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", "10"),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", None),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", "5000"),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", None),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+}
+
+
+def client_options():
+    """Keyword arguments for AsyncIOMotorClient from the environment."""
+    options = {}
+    for option, (variable, default) in _INT_OPTIONS.items():
+        value = os.environ.get(variable, default)
+        if value:
+            options[option] = int(value)
+    compressors = os.environ.get("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def create_client(event_listeners=()):
+    return AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=list(event_listeners), **client_options())
+
+
+async def warm_up(client, connections):
+    """Open `connections` pooled connections by pinging on all of them at once."""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(connections, 1))))
+
+
+async def ping(client, timeout):
+    """True if the server answers a ping within `timeout` seconds."""
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,274 @@
+"""Daily income rollup.
+
+`income_daily` holds one document per (day, client_name, appointment_type_id)
+bucket of completed appointments, where day is the UTC date of `pickup_at`. Each bucket keeps an `entries` map of
+appointment id -> amount and derives `count`/`total` from it inside a single
+pipeline update, so replaying a write is idempotent and no multi-document
+transaction is needed. A `seqs` map keeps, per appointment id, the
+`sync_seq` of the last write applied to the bucket, including writes that
+took the appointment out of it, and an entry update only matches while that
+is older than its own. Two concurrent writes to one appointment can reach
+the rollup in either order, and the older one then changes nothing. Buckets also carry the appointments'
+`client_search_name` (see search.py), so a client filter matches the same
+names whichever of the rollup or the raw appointments answers it.
+
+Run `python rollups.py rebuild` to recompute the rollup from the raw
+appointments (and mark it ready for reads), or `python rollups.py verify` to
+compare it against the raw data without changing anything.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import search
+import times
+
+ROLLUP_COLLECTION = "income_daily"
+ROLLUP_META_ID = "income_rollup"
+DUPLICATE_KEY = 11000
+# Bump when the bucketing changes; a rollup built by another version isn't read until rebuilt
+ROLLUP_VERSION = 4
+
+
+def _bucket(doc):
+    """Rollup key, amount and client search name an appointment contributes, or None if it doesn't count."""
+    if not doc or doc.get("status") != "completed":
+        return None
+    client_name = doc.get("client_name")
+    type_id = doc.get("appointment_type_id")
+    key = (
+        times.utc_day(doc),
+        "Unknown" if client_name is None else client_name,
+        "unknown" if type_id is None else type_id,
+    )
+    return key, doc.get("amount") or 0, search.normalize(client_name)
+
+
+def _bucket_filter(key):
+    day, client_name, type_id = key
+    return {"day": day, "client_name": client_name, "appointment_type_id": type_id}
+
+
+def _entry_filter(key, appointment_id, seq=None):
+    """The bucket, as long as it hasn't seen a write to the appointment at `seq` or later."""
+    query = _bucket_filter(key)
+    if seq is not None:
+        query[f"seqs.{appointment_id}"] = {"$not": {"$gte": seq}}
+    return query
+
+
+def _entries_update(appointment_id, amount=None, search_name=None, seq=None):
+    """Pipeline update that sets (or, with amount=None, removes) one entry and recomputes the sums."""
+    entries = {"$ifNull": ["$entries", {}]}
+    if amount is None:
+        new_entries = {
+            "$arrayToObject": {
+                "$filter": {"input": {"$objectToArray": entries}, "cond": {"$ne": ["$$this.k", appointment_id]}}
+            }
+        }
+    else:
+        new_entries = {"$mergeObjects": [entries, {"$literal": {appointment_id: amount}}]}
+    fields = {"entries": new_entries}
+    if seq is not None:
+        fields["seqs"] = {"$mergeObjects": [{"$ifNull": ["$seqs", {}]}, {"$literal": {appointment_id: seq}}]}
+    if search_name is not None:
+        fields["client_search_name"] = {"$literal": search_name}
+    return [
+        {"$set": fields},
+        {
+            "$set": {
+                "count": {"$size": {"$objectToArray": "$entries"}},
+                "total": {"$sum": {"$map": {"input": {"$objectToArray": "$entries"}, "in": "$$this.v"}}},
+            }
+        },
+    ]
+
+
+async def _apply(db, key, appointment_id, amount=None, search_name=None, seq=None):
+    query = _entry_filter(key, appointment_id, seq)
+    update = _entries_update(appointment_id, amount, search_name, seq)
+    # A removal also upserts when it carries a seq, so an older write arriving later still finds its marker
+    upsert = amount is not None or seq is not None
+    try:
+        await db[ROLLUP_COLLECTION].update_one(query, update, upsert=upsert)
+    except DuplicateKeyError:
+        # Lost an upsert race on the unique bucket key, or the bucket has a newer write and the upsert
+        # tried to add a second one; either way the bucket exists now
+        await db[ROLLUP_COLLECTION].update_one(query, update)
+
+
+async def record_change(db, before, after, seq=None):
+    """Move an appointment's contribution from its `before` to its `after` image.
+
+    Either image may be None (create / delete). `seq` orders the change against
+    others to the same appointment: the after image's sync_seq by default, and
+    for a delete the seq of its tombstone. Safe to replay.
+    """
+    old = _bucket(before)
+    new = _bucket(after)
+    if old == new:
+        return
+    appointment_id = (after or before)["id"]
+    if seq is None and after:
+        seq = after.get("sync_seq")
+    if old and (not new or old[0] != new[0]):
+        await _apply(db, old[0], appointment_id, seq=seq)
+    if new:
+        await _apply(db, new[0], appointment_id, new[1], new[2], seq)
+
+
+async def remove(db, docs, first_seq=None):
+    """Drop the contributions of appointments leaving the collection in bulk (see archive.py). Safe to replay.
+
+    `first_seq` starts the consecutive seqs of the deletes, in the order of `docs`.
+    """
+    updates = []
+    for i, doc in enumerate(docs):
+        bucket = _bucket(doc)
+        if bucket:
+            seq = None if first_seq is None else first_seq + i
+            updates.append((_entry_filter(bucket[0], doc["id"], seq), _entries_update(doc["id"], seq=seq)))
+    if not updates:
+        return
+    try:
+        await db[ROLLUP_COLLECTION].bulk_write(
+            [UpdateOne(query, update, upsert=first_seq is not None) for query, update in updates], ordered=False
+        )
+    except BulkWriteError as e:
+        # Same as _apply's DuplicateKeyError: redo those without the upsert
+        errors = e.details["writeErrors"]
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+        await db[ROLLUP_COLLECTION].bulk_write(
+            [UpdateOne(*updates[error["index"]]) for error in errors], ordered=False
+        )
+
+
+async def invalidate(db):
+    """Stop answering reads from the rollup until the next rebuild, e.g. after a migration rewrote its inputs."""
+    await db.schema_meta.update_one({"_id": ROLLUP_META_ID}, {"$set": {"ready": False}}, upsert=True)
+
+
+async def is_ready(db):
+    meta = await db.schema_meta.find_one({"_id": ROLLUP_META_ID}, {"ready": 1, "version": 1})
+    return bool(meta and meta.get("ready") and meta.get("version") == ROLLUP_VERSION)
+
+
+def _raw_buckets_pipeline():
+    amount = {"$ifNull": ["$amount", 0]}
+    return [
+        {"$match": {"status": "completed"}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$pickup_at", "onNull": ""}},
+                    "client_name": {"$ifNull": ["$client_name", "Unknown"]},
+                    "appointment_type_id": {"$ifNull": ["$appointment_type_id", "unknown"]},
+                },
+                # Every row of a bucket has the same client_name, hence the same search name
+                "client_search_name": {"$first": {"$ifNull": ["$client_search_name", ""]}},
+                "entries": {"$push": {"k": "$id", "v": amount}},
+                "seqs": {"$push": {"k": "$id", "v": {"$ifNull": ["$sync_seq", 0]}}},
+                "count": {"$sum": 1},
+                "total": {"$sum": amount},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "day": "$_id.day",
+                "client_name": "$_id.client_name",
+                "appointment_type_id": "$_id.appointment_type_id",
+                "client_search_name": 1,
+                "entries": {"$arrayToObject": "$entries"},
+                "seqs": {"$arrayToObject": "$seqs"},
+                "count": 1,
+                "total": 1,
+            }
+        },
+    ]
+
+
+async def verify(db):
+    """Compare the rollup with the raw appointments; returns a list of mismatching buckets."""
+    expected = {}
+    async for row in db.appointments.aggregate(_raw_buckets_pipeline(), allowDiskUse=True):
+        expected[(row["day"], row["client_name"], row["appointment_type_id"])] = (row["count"], row["total"])
+
+    actual = {}
+    async for row in db[ROLLUP_COLLECTION].find({"count": {"$gt": 0}}, {"_id": 0, "entries": 0}):
+        actual[(row["day"], row["client_name"], row["appointment_type_id"])] = (row["count"], row["total"])
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, (0, 0))
+        got = actual.get(key, (0, 0))
+        if want[0] != got[0] or abs(want[1] - got[1]) > 1e-6:
+            mismatches.append({"bucket": _bucket_filter(key), "expected": want, "actual": got})
+    return mismatches
+
+
+async def rebuild(db):
+    """Recompute every bucket from the raw appointments, then verify and mark the rollup ready."""
+    started = datetime.now(timezone.utc).isoformat()
+    await invalidate(db)
+
+    pipeline = _raw_buckets_pipeline()
+    pipeline.append({"$set": {"rebuilt_at": started}})
+    pipeline.append({
+        "$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["day", "client_name", "appointment_type_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }
+    })
+    await db.appointments.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    # Buckets not produced by this rebuild no longer have completed appointments.
+    # Writes racing with the rebuild are caught by the verify pass below.
+    await db[ROLLUP_COLLECTION].delete_many({"rebuilt_at": {"$ne": started}})
+
+    mismatches = await verify(db)
+    await db.schema_meta.update_one(
+        {"_id": ROLLUP_META_ID},
+        {"$set": {
+            "ready": not mismatches,
+            "version": ROLLUP_VERSION,
+            "rebuilt_at": started,
+            "verified_at": datetime.now(timezone.utc).isoformat(),
+            "mismatches": len(mismatches),
+        }},
+    )
+    return mismatches
+
+
+async def main(command):
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if command == "rebuild":
+        mismatches = await rebuild(db)
+    else:
+        mismatches = await verify(db)
+
+    for m in mismatches[:20]:
+        print(f"Mismatch {m['bucket']}: expected {m['expected']}, rollup has {m['actual']}")
+    print(f"{command}: {len(mismatches)} mismatching buckets")
+
+    client.close()
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("rebuild", "verify"):
+        print("usage: python rollups.py rebuild|verify")
+        sys.exit(2)
+    sys.exit(asyncio.run(main(sys.argv[1])))
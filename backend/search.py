@@ -0,0 +1,163 @@
+"""Indexed client-name search and autocomplete.
+
+Appointments carry `client_search_name` (NFKC-normalized, case-folded name)
+and `client_search_keys` (its character unigrams and bigrams). Client names
+are mostly short Chinese names, where word tokenizers don't help but n-grams
+do: a substring query is narrowed through the multikey index on its bigrams
+(or its single character) and only the surviving candidates are checked with
+a literal substring match.
+
+The `clients` collection keeps one document per distinct client name with an
+appointment count and the latest pickup time, for ranked autocomplete. Both
+are kept exact on every write: a client whose latest trip is deleted, moved
+earlier or renamed away is recomputed from its appointments.
+"""
+import re
+import unicodedata
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+CLIENTS_COLLECTION = "clients"
+
+# Candidates fetched from the index before ranking in Python
+SUGGEST_CANDIDATES = 50
+
+
+def normalize(name):
+    return unicodedata.normalize("NFKC", name or "").casefold().strip()
+
+
+def _grams(text):
+    if len(text) == 1:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def search_keys(name):
+    """Every unigram and bigram of the normalized name, so any substring query can be served."""
+    text = normalize(name)
+    keys = set(text) | _grams(text)
+    return sorted(key for key in keys if key.strip())
+
+
+def search_fields(name):
+    return {"client_search_name": normalize(name), "client_search_keys": search_keys(name)}
+
+
+def _keys_filter(text, name_field):
+    return {"client_search_keys": {"$all": sorted(_grams(text))}, name_field: {"$regex": re.escape(text)}}
+
+
+def name_filter(query):
+    """Case-insensitive substring match on client_name, served by the n-gram index."""
+    text = normalize(query)
+    if not text:
+        return {}
+    return {"$or": [
+        _keys_filter(text, "client_search_name"),
+        # Rows written before the search fields existed, until migration 0002 has run
+        {"client_search_keys": {"$exists": False}, "client_name": {"$regex": re.escape(query.strip()), "$options": "i"}},
+    ]}
+
+
+async def _refresh_client(db, name):
+    """Recompute one client's count and latest pickup time from its appointments."""
+    rows = await db.appointments.aggregate([
+        {"$match": {"client_name": name}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "last_pickup_time": {"$max": "$pickup_time"}}},
+    ]).to_list(1)
+    count, last_pickup_time = (rows[0]["count"], rows[0]["last_pickup_time"] or "") if rows else (0, "")
+    await db[CLIENTS_COLLECTION].update_one(
+        {"name": name}, {"$set": {"count": count, "last_pickup_time": last_pickup_time}}
+    )
+
+
+async def _remove_from_client(db, name, pickup_time):
+    """An appointment picked up at `pickup_time` no longer belongs to client `name`."""
+    # $max can't be undone: the client is recomputed when this was (or tied) its latest pickup
+    result = await db[CLIENTS_COLLECTION].update_one(
+        {"name": name, "last_pickup_time": {"$ne": pickup_time or ""}}, {"$inc": {"count": -1}}
+    )
+    if result.matched_count == 0:
+        await _refresh_client(db, name)
+
+
+async def record_client_change(db, before, after):
+    """Keep per-client counts and latest pickup times in step with an appointment create/update/delete."""
+    old_name = before.get("client_name") if before else None
+    new_name = after.get("client_name") if after else None
+    if old_name == new_name:
+        old_pickup = (before or {}).get("pickup_time") or ""
+        new_pickup = (after or {}).get("pickup_time") or ""
+        if not after or new_name is None or new_pickup == old_pickup:
+            return
+        if new_pickup > old_pickup:
+            await db[CLIENTS_COLLECTION].update_one({"name": new_name}, {"$max": {"last_pickup_time": new_pickup}})
+        elif await db[CLIENTS_COLLECTION].find_one({"name": new_name, "last_pickup_time": old_pickup}, {"_id": 1}):
+            # Moved earlier, and it was the latest pickup
+            await _refresh_client(db, new_name)
+        return
+    if old_name is not None:
+        await _remove_from_client(db, old_name, before.get("pickup_time"))
+    if new_name is not None:
+        await db[CLIENTS_COLLECTION].update_one(
+            {"name": new_name},
+            {
+                "$inc": {"count": 1},
+                "$max": {"last_pickup_time": after.get("pickup_time") or ""},
+                "$set": search_fields(new_name),
+            },
+            upsert=True,
+        )
+
+
+def _recency_weight(last_pickup_time, now):
+    try:
+        last = datetime.fromisoformat(last_pickup_time.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return 0.5
+    if last.tzinfo is None:
+        last = last.replace(tzinfo=timezone.utc)
+    age_days = max((now - last).total_seconds() / 86400, 0)
+    return 1 / (1 + age_days / 30)
+
+
+async def suggest(db, query, limit):
+    """Distinct client names matching `query`, prefix matches first, then by frequency x recency."""
+    text = normalize(query)
+    mongo_filter = {"count": {"$gt": 0}}
+    if text:
+        mongo_filter.update(_keys_filter(text, "client_search_name"))
+    candidates = await db[CLIENTS_COLLECTION].find(
+        mongo_filter, {"_id": 0, "name": 1, "count": 1, "last_pickup_time": 1, "client_search_name": 1}
+    ).sort("count", -1).limit(SUGGEST_CANDIDATES).to_list(SUGGEST_CANDIDATES)
+
+    now = datetime.now(timezone.utc)
+    candidates.sort(key=lambda c: (
+        not c["client_search_name"].startswith(text),
+        -c["count"] * _recency_weight(c.get("last_pickup_time"), now),
+    ))
+    return [
+        {"name": c["name"], "count": c["count"], "last_pickup_time": c.get("last_pickup_time") or None}
+        for c in candidates[:limit]
+    ]
+
+
+async def rebuild_clients(db, batch_size=500):
+    """Recompute the clients collection from the appointments; returns the number of clients."""
+    clients = []
+    async for row in db.appointments.aggregate([
+        {"$match": {"client_name": {"$type": "string"}}},
+        {"$group": {"_id": "$client_name", "count": {"$sum": 1}, "last_pickup_time": {"$max": "$pickup_time"}}},
+    ], allowDiskUse=True):
+        clients.append(UpdateOne(
+            {"name": row["_id"]},
+            {"$set": {"count": row["count"], "last_pickup_time": row["last_pickup_time"] or "",
+                      **search_fields(row["_id"])}},
+            upsert=True,
+        ))
+    await db[CLIENTS_COLLECTION].delete_many({})
+    for i in range(0, len(clients), batch_size):
+        await db[CLIENTS_COLLECTION].bulk_write(clients[i:i + batch_size], ordered=False)
+    return len(clients)
@@ -1,25 +1,56 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 import uuid
-from datetime import datetime, timezone
+import re
+import json
+import base64
+from datetime import date, datetime, timezone
 import bcrypt
 import jwt
 
+from indexes import ensure_indexes, index_usage_report
+import rollups
+import exports
+import sync
+import versioning
+import cache
+import command_monitor
+import search
+import fast_json
+import times
+import metrics
+import slow_queries
+import mongo_client
+import conflicts
+import compression
+import sms
+import events
+import coalesce
+import archive
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+_IMPORTED_AT = time.perf_counter()
+
+# MongoDB connection, opened and closed by the app lifespan
+client = None
+db = None
+
+# Set once the background warm-up has finished; see /readyz
+startup_state = {"ready": False, "error": None, "warm_up_ms": None, "ready_after_ms": None}
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -27,8 +58,60 @@ ALGORITHM = "HS256"
 
 security = HTTPBearer()
 
+async def _warm_up():
+    """Open pooled connections, reconcile indexes and fill the hot caches; retried until it succeeds."""
+    delay = 1
+    while True:
+        started = time.perf_counter()
+        try:
+            if os.environ.get('MONGO_WARM_UP', '1') == '1':
+                await mongo_client.warm_up(client, mongo_client.client_options().get("minPoolSize", 1))
+                await _get_auth_config()
+                await _get_sms_template()
+                await _get_appointment_types()
+            await ensure_indexes(db)
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            logger.warning("Warm-up failed, retrying in %ss: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    slow_queries.profiler.start(db)
+    now = time.perf_counter()
+    startup_state.update(
+        ready=True, error=None,
+        warm_up_ms=round((now - started) * 1000, 1),
+        ready_after_ms=round((now - _IMPORTED_AT) * 1000, 1),
+    )
+    logger.info("Ready %.0f ms after import (warm-up %.0f ms)", startup_state["ready_after_ms"], startup_state["warm_up_ms"])
+
+@asynccontextmanager
+async def lifespan(app):
+    global client, db
+    client = mongo_client.create_client([
+        command_monitor.command_listener,
+        metrics.command_listener,
+        metrics.pool_listener,
+        slow_queries.profiler,
+    ])
+    db = client[os.environ['DB_NAME']]
+    # Warm up in the background so /healthz answers at once and /readyz reports progress
+    warm_up = asyncio.create_task(_warm_up())
+    change_feed = None
+    if os.environ.get('EVENTS_CHANGE_STREAMS') == '1':
+        change_feed = asyncio.create_task(events.watch(db, _event_data))
+    yield
+    warm_up.cancel()
+    if change_feed:
+        change_feed.cancel()
+    events.bus.close()
+    startup_state["ready"] = False
+    await slow_queries.profiler.stop()
+    client.close()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -84,6 +167,18 @@ class Appointment(BaseModel):
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class AppointmentWriteResult(Appointment):
+    conflicts: List[str] = []  # ids of scheduled appointments overlapping this one
+
+class AppointmentSearchResult(Appointment):
+    archived: bool = False  # read from the archive rather than the live collection
+
+class AppointmentConflict(BaseModel):
+    appointment_id: str
+    conflicting_id: str
+    overlap_start: str
+    overlap_end: str
+
 class AppointmentCreate(BaseModel):
     client_name: str
     pickup_time: str
@@ -108,6 +203,47 @@ class AppointmentUpdate(BaseModel):
     appointment_type_id: Optional[str] = None
     status: Optional[str] = None
 
+class AppointmentChanges(BaseModel):
+    token: str
+    full: bool  # True when `changes` is the complete list rather than a delta
+    changes: List[Appointment]
+    deleted: List[str]
+    has_more: bool
+
+class ClientSuggestion(BaseModel):
+    name: str
+    count: int
+    last_pickup_time: Optional[str] = None
+
+class ClientTripSummary(BaseModel):
+    count: int
+    total: float
+    average: float
+    first_trip: Optional[str] = None  # UTC pickup instants
+    last_trip: Optional[str] = None
+
+class ClientAppointments(BaseModel):
+    client_name: str
+    summary: ClientTripSummary
+    appointments: List[Appointment]
+
+class CalendarTypeCount(BaseModel):
+    appointment_type_id: str
+    name: Optional[str] = None
+    color: Optional[str] = None
+    count: int
+
+class CalendarDay(BaseModel):
+    date: str
+    count: int
+    amount: float  # 不含已取消
+    by_status: Dict[str, int]
+    by_type: List[CalendarTypeCount]
+
+class CalendarResponse(BaseModel):
+    tz: str
+    days: List[CalendarDay]
+
 class SMSTemplate(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -126,6 +262,137 @@ class SMSTemplateUpdate(BaseModel):
     fields: Optional[List[str]] = None
     closing: Optional[str] = None
 
+class SMSRenderRequest(BaseModel):
+    appointment_ids: Optional[List[str]] = None
+    # Or every appointment picked up on these dates (inclusive, in `tz`)
+    from_date: Optional[str] = None
+    to_date: Optional[str] = None
+    status: Optional[str] = "scheduled"  # date selection only
+    tz: str = "UTC"
+    date_format: Literal["MM/dd/yyyy", "dd/MM/yyyy"] = "MM/dd/yyyy"
+
+APPOINTMENT_PROJECTION = fast_json.projection(Appointment)
+APPOINTMENT_TYPE_PROJECTION = fast_json.projection(AppointmentType)
+# Always returned with `fields=`: the keys rows are identified, paged and shown by
+SPARSE_REQUIRED_FIELDS = ("id", "client_name", "pickup_time")
+
+def _sparse_fields(fields: Optional[str]) -> List[str]:
+    """Names in a comma-separated `fields` parameter; empty when it names none (e.g. `fields=`)"""
+    requested = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    unknown = sorted(set(requested) - set(Appointment.model_fields))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+def _fields_projection(requested: List[str]) -> dict:
+    """Projection for the fields from _sparse_fields, or every model field without any."""
+    if not requested:
+        return APPOINTMENT_PROJECTION
+    return {"_id": 0, **{field: 1 for field in (*SPARSE_REQUIRED_FIELDS, *requested)}}
+
+def _list_response(response: Response, docs: list, direct: bool = False):
+    """Return `docs` for response_model validation, or render them directly in fast JSON mode.
+
+    Only for documents read with the model's projection (or a subset of it,
+    which always renders directly: `direct`); headers already set on
+    `response` (ETag, cursors) are carried over.
+    """
+    if fast_json.ENABLED or direct:
+        return fast_json.FastJSONResponse(docs, headers=response.headers)
+    return docs
+
+def _encode_cursor(appointment: dict, field: str = "pickup_time") -> str:
+    """Opaque keyset cursor for the (`field`, id) sort key of an appointment."""
+    value = appointment.get(field)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, appointment["id"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(decoded, list):
+            raise ValueError(decoded)
+        value, appointment_id = decoded
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, appointment_id
+
+def _cursor_position(cursor: str, field: str = "pickup_time") -> tuple:
+    """The (`field`, id) key a cursor points at, with typed time fields parsed to datetimes."""
+    value, appointment_id = _decode_cursor(cursor)
+    if field in times.TYPED_FIELDS.values():
+        value = times.parse_utc(value)
+        if value is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, appointment_id
+
+def _keyset_filter(cursor: str, forward: bool, field: str = "pickup_time") -> dict:
+    """Rows strictly after (forward) or before the cursor in (`field`, id) order."""
+    value, appointment_id = _cursor_position(cursor, field)
+    op = "$gt" if forward else "$lt"
+    return {
+        # Redundant with the $or, but gives the planner a tight index bound
+        field: {op + "e": value},
+        "$or": [
+            {field: {op: value}},
+            {field: value, "id": {op: appointment_id}},
+        ],
+    }
+
+def conditional_get(*collections):
+    """Dependency that answers 304 from the collections' version stamps before the endpoint runs."""
+    async def check(request: Request, response: Response):
+        etag = await versioning.etag(db, request, collections)
+        if versioning.matches(request.headers.get("if-none-match"), etag):
+            raise versioning.NotModified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return Depends(check)
+
+async def _coalesced(route: str, response: Response, loader):
+    """`loader()`'s result, shared with identical concurrent requests; needs conditional_get's ETag"""
+    return await coalesce.flights.run(route, response.headers["ETag"], loader)
+
+async def _collection_changed(*collections):
+    """Bump the version stamps ETags and other workers' caches rely on, and drop our cached copies."""
+    await versioning.bump(db, *collections)
+    for collection in collections:
+        cache.documents.invalidate(collection)
+
+EVENT_MODELS = {"appointment": Appointment, "appointment_type": AppointmentType, "sms_template": SMSTemplate}
+
+def _event_data(name: str, doc: dict) -> dict:
+    """A stored document as the API returns it, for change events"""
+    return EVENT_MODELS[name](**doc).model_dump()
+
+def _publish(name: str, action: str, id: Optional[str], doc: Optional[dict] = None):
+    events.bus.publish(name, action, id, _event_data(name, doc) if doc is not None else None)
+
+async def _get_auth_config():
+    return await cache.documents.get(
+        db, "auth_config", "driver", lambda: db.auth_config.find_one({"user": "driver"}, {"_id": 0})
+    )
+
+async def _get_sms_template():
+    return await cache.documents.get(
+        db, "sms_templates", "current", lambda: db.sms_templates.find_one({}, {"_id": 0})
+    )
+
+async def _get_sms_renderer():
+    """The current template compiled by sms.compile_template, rebuilt only when sms_templates changes"""
+    async def compile_current():
+        return sms.compile_template(SMSTemplate(**(await _get_sms_template() or {})).model_dump())
+    return await cache.documents.get(db, "sms_templates", "renderer", compile_current)
+
+async def _get_appointment_types():
+    return await cache.documents.get(
+        db, "appointment_types", "all",
+        lambda: db.appointment_types.find({}, APPOINTMENT_TYPE_PROJECTION).to_list(1000)
+    )
+
 # Authentication function
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -143,7 +410,7 @@ async def login(request: LoginRequest):
     correct_password = "driver123"
     
     # Get stored pattern from database
-    auth_config = await db.auth_config.find_one({"user": "driver"})
+    auth_config = await _get_auth_config()
     
     # Check password login
     if request.password:
@@ -164,7 +431,7 @@ async def login(request: LoginRequest):
 
 @api_router.get("/auth/pattern-status", response_model=PatternStatusResponse)
 async def get_pattern_status():
-    auth_config = await db.auth_config.find_one({"user": "driver"})
+    auth_config = await _get_auth_config()
     has_pattern = auth_config is not None and "pattern" in auth_config
     return PatternStatusResponse(has_pattern=has_pattern)
 
@@ -178,6 +445,7 @@ async def setup_pattern(request: PatternSetupRequest, user=Depends(verify_token)
         {"$set": {"pattern": request.pattern, "updated_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    await _collection_changed("auth_config")
     
     return {"message": "Pattern setup successful"}
 
@@ -189,169 +457,597 @@ async def create_appointment_type(appointment_type: AppointmentTypeCreate, user=
     
     doc = type_obj.model_dump()
     await db.appointment_types.insert_one(doc)
+    await _collection_changed("appointment_types")
+    _publish("appointment_type", "created", doc["id"], doc)
     
     return type_obj
 
 @api_router.get("/appointment-types", response_model=List[AppointmentType])
-async def get_appointment_types(user=Depends(verify_token)):
-    types = await db.appointment_types.find({}, {"_id": 0}).to_list(1000)
-    return types
+async def get_appointment_types(
+    response: Response, user=Depends(verify_token), _=conditional_get("appointment_types")
+):
+    return _list_response(response, await _get_appointment_types())
 
 @api_router.put("/appointment-types/{type_id}", response_model=AppointmentType)
 async def update_appointment_type(type_id: str, type_update: AppointmentTypeUpdate, user=Depends(verify_token)):
-    existing = await db.appointment_types.find_one({"id": type_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Appointment type not found")
-    
     update_data = type_update.model_dump(exclude_unset=True)
-    await db.appointment_types.update_one({"id": type_id}, {"$set": update_data})
-    
-    updated = await db.appointment_types.find_one({"id": type_id}, {"_id": 0})
+    if update_data:
+        updated = await db.appointment_types.find_one_and_update(
+            {"id": type_id}, {"$set": update_data}, {"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+    else:
+        updated = await db.appointment_types.find_one({"id": type_id}, {"_id": 0})
+    if not updated:
+        raise HTTPException(status_code=404, detail="Appointment type not found")
+    if update_data:
+        await _collection_changed("appointment_types")
+        _publish("appointment_type", "updated", type_id, updated)
     return updated
 
 @api_router.delete("/appointment-types/{type_id}")
 async def delete_appointment_type(type_id: str, user=Depends(verify_token)):
-    appointments_count = await db.appointments.count_documents({"appointment_type_id": type_id})
-    if appointments_count > 0:
-        raise HTTPException(status_code=400, detail=f"Cannot delete: {appointments_count} appointments still use this type")
+    # Existence check only: stop at the first referencing appointment instead of counting them all
+    in_use = await db.appointments.find_one({"appointment_type_id": type_id}, {"_id": 1})
+    if in_use:
+        raise HTTPException(status_code=400, detail="Cannot delete: appointments still use this type")
     
     result = await db.appointment_types.delete_one({"id": type_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Appointment type not found")
+    await _collection_changed("appointment_types")
+    _publish("appointment_type", "deleted", type_id)
     return {"message": "Appointment type deleted successfully"}
 
 # Appointments CRUD endpoints
-@api_router.post("/appointments", response_model=Appointment)
+@api_router.post("/appointments", response_model=AppointmentWriteResult)
 async def create_appointment(appointment: AppointmentCreate, user=Depends(verify_token)):
     appointment_dict = appointment.model_dump()
     appointment_obj = Appointment(**appointment_dict)
     
     doc = appointment_obj.model_dump()
-    await db.appointments.insert_one(doc)
+    doc['sync_seq'] = await sync.next_seq(db)
+    doc.update(search.search_fields(doc['client_name']))
+    doc.update(times.typed_fields(doc))
+    # An upsert so the write can stamp synced_at with the server's clock (see sync.py)
+    await db.appointments.update_one({"id": doc["id"]}, sync.stamped({"$setOnInsert": doc}), upsert=True)
+    await rollups.record_change(db, None, doc)
+    await search.record_client_change(db, None, doc)
+    await _collection_changed("appointments")
+    _publish("appointment", "created", doc["id"], doc)
     
-    return appointment_obj
+    conflicting = await conflicts.for_appointment(db, doc)
+    return AppointmentWriteResult(**appointment_obj.model_dump(), conflicts=conflicting)
+
+def _time_range(start, end) -> Optional[dict]:
+    try:
+        return times.range_filter(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _appointments_query(status, client_name, date, appointment_type_id) -> dict:
+    query = {}
+    
+    if status:
+        query['status'] = status
+    if client_name:
+        query.update(search.name_filter(client_name))
+    if date:
+        query['pickup_at'] = _time_range(date, date)
+    if appointment_type_id:
+        query['appointment_type_id'] = appointment_type_id
+    return query
+
+EXPORT_FIELDS = list(Appointment.model_fields)
+
+def _export_response(query: dict, format: str, gzip: bool, filename: str,
+                     archived: Optional[dict] = None) -> StreamingResponse:
+    """Stream every appointment matching `query` in pickup order as CSV or NDJSON.
+
+    `archived` holds the same filters as keyword arguments for archive.merged; the archived
+    appointments matching them are merged into the stream.
+    """
+    cursor = db.appointments.find(query, APPOINTMENT_PROJECTION).sort([("pickup_time", 1), ("id", 1)]).batch_size(1000)
+    if archived is not None:
+        months = archive.months_in(archived.get("time_range"), archived.get("client_name"), archived.get("status"))
+        if months:
+            cursor = archive.merged(cursor, months, **archived)
+    chunks, media_type, extension = exports.encode(cursor, format, EXPORT_FIELDS, gzip=gzip)
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
 
 @api_router.get("/appointments", response_model=List[Appointment])
 async def get_appointments(
+    response: Response,
     status: Optional[str] = None,
     client_name: Optional[str] = None,
     date: Optional[str] = None,
     appointment_type_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    direction: Literal["asc", "desc"] = "asc",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(verify_token),
+    _=conditional_get("appointments")
+):
+    """List appointments ordered by (pickup_time, id).
+
+    Without `limit` every matching appointment is returned. With `limit` the
+    result is one page; follow the X-Next-Cursor / X-Prev-Cursor response
+    headers by passing them back as `after` / `before`.
+    
+    `fields` (comma-separated, e.g. `fields=status,amount`) limits each row to
+    those fields plus id, client_name and pickup_time; the rest are neither
+    read from MongoDB nor serialized. Such partial rows are rendered as read,
+    without response_model validation. Unknown field names are a 400.
+    """
+    if after and before:
+        raise HTTPException(status_code=400, detail="Use either after or before, not both")
+    
+    query = _appointments_query(status, client_name, date, appointment_type_id)
+    
+    # Walking backwards from `before` reads in reverse order and flips the page afterwards
+    backwards = before is not None
+    ascending = (direction == "asc") != backwards
+    cursor = after or before
+    if cursor:
+        query = {"$and": [query, _keyset_filter(cursor, forward=ascending)]}
+    
+    sort_dir = 1 if ascending else -1
+    requested = _sparse_fields(fields)
+    find = db.appointments.find(query, _fields_projection(requested)).sort([("pickup_time", sort_dir), ("id", sort_dir)])
+    # An empty `fields=` reads full rows, so they go through response_model like any other
+    sparse = bool(requested)
+    if limit is None:
+        return _list_response(response, await _coalesced("get_appointments", response, lambda: find.to_list(None)),
+                              direct=sparse)
+    
+    appointments = await _coalesced("get_appointments", response, lambda: find.limit(limit + 1).to_list(limit + 1))
+    has_more = len(appointments) > limit
+    appointments = appointments[:limit]
+    if backwards:
+        appointments.reverse()
+    
+    has_next = backwards or has_more
+    has_prev = has_more if backwards else after is not None
+    if appointments and has_next:
+        response.headers["X-Next-Cursor"] = _encode_cursor(appointments[-1])
+    if appointments and has_prev:
+        response.headers["X-Prev-Cursor"] = _encode_cursor(appointments[0])
+    return _list_response(response, appointments, direct=sparse)
+
+@api_router.get("/appointments/export")
+async def export_appointments(
+    status: Optional[str] = None,
+    client_name: Optional[str] = None,
+    date: Optional[str] = None,
+    appointment_type_id: Optional[str] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
     user=Depends(verify_token)
 ):
-    query = {}
+    """Stream every matching appointment, archived ones included, as a CSV or NDJSON download"""
+    query = _appointments_query(status, client_name, date, appointment_type_id)
+    archived = {"time_range": query.get("pickup_at"), "client_name": client_name,
+                "appointment_type_id": appointment_type_id, "status": status}
+    return _export_response(query, format, gzip, "appointments", archived)
+
+@api_router.get("/appointments/changes", response_model=AppointmentChanges)
+async def get_appointment_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    user=Depends(verify_token)
+):
+    """Appointments created/updated and ids deleted since a sync token.
+
+    Without `since` the full list is returned along with a token to resume from.
+    Keep calling with the returned token while `has_more` is true.
+    """
+    now = datetime.now(timezone.utc)
+    if since is None:
+        docs, high_water = await sync.snapshot(db)
+        return AppointmentChanges(token=sync.encode_token(high_water, now), full=True,
+                                  changes=docs, deleted=[], has_more=False)
     
-    if status:
-        query['status'] = status
-    if client_name:
-        query['client_name'] = {"$regex": client_name, "$options": "i"}
-    if date:
-        query['pickup_time'] = {"$regex": f"^{date}"}
-    if appointment_type_id:
-        query['appointment_type_id'] = appointment_type_id
+    try:
+        since_seq, issued_at = sync.decode_token(since)
+    except sync.TokenExpired:
+        raise HTTPException(status_code=410, detail="Sync token expired, fetch the full list again")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
     
-    appointments = await db.appointments.find(query, {"_id": 0}).to_list(1000)
-    return appointments
+    changes, deleted, high_water, has_more = await sync.changes_since(db, since_seq, limit, issued_at)
+    return AppointmentChanges(token=sync.encode_token(high_water, now), full=False,
+                              changes=changes, deleted=deleted, has_more=has_more)
+
+@api_router.get("/appointments/conflicts", response_model=List[AppointmentConflict])
+async def get_appointment_conflicts(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    user=Depends(verify_token),
+    _=conditional_get("appointments")
+):
+    """Every pair of overlapping scheduled appointments whose overlap falls between `from` and `to`"""
+    return await conflicts.in_range(db, _time_range(from_date, to_date))
+
+@api_router.get("/appointments/search", response_model=List[AppointmentSearchResult])
+async def search_appointments(
+    client_name: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    user=Depends(verify_token),
+    _=conditional_get("appointments")
+):
+    """Appointments by client name and pickup range, latest first, from the live collection and the archive"""
+    time_range = _time_range(from_date, to_date)
+    query = _appointments_query(status, client_name, None, None)
+    if time_range:
+        query['pickup_at'] = time_range
+    live = await db.appointments.find(query, APPOINTMENT_PROJECTION).sort(
+        [("pickup_at", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    
+    months = archive.months_in(time_range, client_name, status)
+    if len(live) == limit and months:
+        # A full page from the live collection only needs the archived months it reaches back into
+        oldest = times.parse_utc(live[-1]["pickup_time"])
+        months = [month for month in months if oldest is None or archive.month_bounds(month)[1] > oldest]
+    if not months:
+        return live
+    
+    cold = await asyncio.to_thread(archive.find, months, time_range, client_name, status, limit)
+    never = datetime.min.replace(tzinfo=timezone.utc)
+    results = live + [{**doc, "archived": True} for doc in cold]
+    results.sort(key=lambda doc: (times.parse_utc(doc["pickup_time"]) or never, doc["id"]), reverse=True)
+    return results[:limit]
 
 @api_router.get("/appointments/{appointment_id}", response_model=Appointment)
-async def get_appointment(appointment_id: str, user=Depends(verify_token)):
+async def get_appointment(appointment_id: str, user=Depends(verify_token), _=conditional_get("appointments")):
     appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     return appointment
 
-@api_router.put("/appointments/{appointment_id}", response_model=Appointment)
+@api_router.put("/appointments/{appointment_id}", response_model=AppointmentWriteResult)
 async def update_appointment(
     appointment_id: str,
     appointment_update: AppointmentUpdate,
     user=Depends(verify_token)
 ):
-    existing = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    
     update_data = appointment_update.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['sync_seq'] = await sync.next_seq(db)
+    if 'client_name' in update_data:
+        update_data.update(search.search_fields(update_data['client_name']))
+    update_data.update(times.typed_fields(update_data))
     
-    await db.appointments.update_one({"id": appointment_id}, {"$set": update_data})
+    # One round trip: the pre-image feeds the rollup and the post-image is just pre-image + $set
+    existing = await db.appointments.find_one_and_update(
+        {"id": appointment_id}, sync.stamped({"$set": update_data}), {"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Appointment not found")
     
-    updated = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+    updated = {**existing, **update_data}
+    await rollups.record_change(db, existing, updated)
+    await search.record_client_change(db, existing, updated)
+    await _collection_changed("appointments")
+    _publish("appointment", "updated", appointment_id, updated)
+    updated["conflicts"] = await conflicts.for_appointment(db, updated)
     return updated
 
 @api_router.delete("/appointments/{appointment_id}")
 async def delete_appointment(appointment_id: str, user=Depends(verify_token)):
-    result = await db.appointments.delete_one({"id": appointment_id})
-    if result.deleted_count == 0:
+    deleted = await db.appointments.find_one_and_delete({"id": appointment_id}, {"_id": 0})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    seq = await sync.record_delete(db, appointment_id)
+    await rollups.record_change(db, deleted, None, seq)
+    await search.record_client_change(db, deleted, None)
+    await _collection_changed("appointments")
+    _publish("appointment", "deleted", appointment_id)
     return {"message": "Appointment deleted successfully"}
 
+INCOME_PERIOD_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",  # ISO week
+    "month": "%Y-%m",
+}
+
+def _income_pipeline(query: dict, granularity: Optional[str] = None, rollup: bool = False) -> list:
+    """Single-pass pipeline producing totals, per-client, per-type and an optional time series
+
+    With rollup=True the pipeline runs over the income_daily buckets instead of raw appointments.
+    """
+    if rollup:
+        sums = {"count": {"$sum": "$count"}, "total": {"$sum": "$total"}}
+        date_field = "$day"
+    else:
+        sums = {"count": {"$sum": 1}, "total": {"$sum": {"$ifNull": ["$amount", 0]}}}
+        date_field = "$pickup_at"
+    facets = {
+        "totals": [{"$group": {"_id": None, **sums}}],
+        "by_client": [{"$group": {"_id": {"$ifNull": ["$client_name", "Unknown"]}, **sums}}],
+        "by_type": [{"$group": {"_id": {"$ifNull": ["$appointment_type_id", "unknown"]}, **sums}}],
+    }
+    if granularity:
+        date = date_field
+        if rollup:
+            date = {"$dateFromString": {"dateString": date_field, "onError": None, "onNull": None}}
+        period = {
+            "$dateToString": {"format": INCOME_PERIOD_FORMATS[granularity], "date": date, "onNull": "unknown"}
+        }
+        facets["series"] = [{"$group": {"_id": period, **sums}}, {"$sort": {"_id": 1}}]
+    return [{"$match": query}, {"$facet": facets}]
+
+def _income_query(start_date, end_date, client_name, appointment_type_id, rollup=False) -> dict:
+    """Filter for raw appointments, or for income_daily buckets with rollup=True"""
+    query = {}
+    
+    if rollup:
+        # Buckets are keyed by UTC day string; end_date is inclusive
+        time_range = {}
+        if start_date:
+            time_range["$gte"] = start_date
+        if end_date:
+            time_range["$lte"] = end_date
+        if time_range:
+            query['day'] = time_range
+    else:
+        time_range = _time_range(start_date, end_date)
+        if time_range:
+            query['pickup_at'] = time_range
+    
+    if client_name:
+        if rollup:
+            # Same substring match as search.name_filter; buckets are few (days x clients), so no index
+            needle = search.normalize(client_name)
+            if needle:
+                query['client_search_name'] = {"$regex": re.escape(needle)}
+        else:
+            query.update(search.name_filter(client_name))
+    
+    if appointment_type_id:
+        query['appointment_type_id'] = appointment_type_id
+    return query
+
+async def _income_stats(start_date, end_date, client_name, appointment_type_id, granularity) -> dict:
+    # Day-aligned bounds can be answered from the daily rollup; anything finer needs the raw rows
+    day_aligned = all(len(bound) == 10 for bound in (start_date, end_date) if bound)
+    if day_aligned and await rollups.is_ready(db):
+        query = _income_query(start_date, end_date, client_name, appointment_type_id, rollup=True)
+        query['count'] = {"$gt": 0}
+        collection = db[rollups.ROLLUP_COLLECTION]
+        pipeline = _income_pipeline(query, granularity, rollup=True)
+    else:
+        query = _income_query(start_date, end_date, client_name, appointment_type_id)
+        query['status'] = "completed"
+        collection = db.appointments
+        pipeline = _income_pipeline(query, granularity)
+    
+    result = await collection.aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {}
+    totals = facets.get("totals") or [{"count": 0, "total": 0}]
+    
+    stats = {
+        "total_income": totals[0]["total"],
+        "total_count": totals[0]["count"],
+        "by_client": {row["_id"]: {"count": row["count"], "total": row["total"]} for row in facets.get("by_client", [])},
+        "by_type": {row["_id"]: {"count": row["count"], "total": row["total"]} for row in facets.get("by_type", [])}
+    }
+    if granularity:
+        stats["series"] = [
+            {"period": row["_id"], "count": row["count"], "total": row["total"]}
+            for row in facets.get("series", [])
+        ]
+    
+    # Archived months only hold rows the live collection and rollup no longer have, so the tiers just add up
+    time_range = _time_range(start_date, end_date)
+    months = archive.months_in(time_range, client_name)
+    if months:
+        cold = await asyncio.to_thread(
+            archive.income, months, time_range, client_name, appointment_type_id, INCOME_PERIOD_FORMATS.get(granularity)
+        )
+        stats = archive.merge_income(stats, cold)
+    return stats
+
 @api_router.get("/appointments/stats/income")
 async def get_income_stats(
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     client_name: Optional[str] = None,
     appointment_type_id: Optional[str] = None,
-    user=Depends(verify_token)
+    granularity: Optional[Literal["day", "week", "month"]] = None,
+    user=Depends(verify_token),
+    _=conditional_get("appointments")
 ):
     """Get income statistics for completed appointments"""
-    query = {"status": "completed"}
+    return await _coalesced("get_income_stats", response, lambda: _income_stats(
+        start_date, end_date, client_name, appointment_type_id, granularity
+    ))
+
+@api_router.get("/appointments/stats/income/export")
+async def export_income(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    client_name: Optional[str] = None,
+    appointment_type_id: Optional[str] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
+    user=Depends(verify_token)
+):
+    """Stream the completed appointments behind an income report, archived ones included, as CSV or NDJSON"""
+    query = _income_query(start_date, end_date, client_name, appointment_type_id)
+    query['status'] = "completed"
+    archived = {"time_range": query.get("pickup_at"), "client_name": client_name,
+                "appointment_type_id": appointment_type_id, "status": "completed"}
+    return _export_response(query, format, gzip, "income", archived)
+
+def _local_day_range(from_date: str, to_date: str, tz: str, max_days: int) -> tuple:
+    """UTC bounds of the inclusive dates `from_date`..`to_date` in `tz`, at most `max_days` days"""
+    try:
+        start, end = times.local_day_range(from_date, to_date, tz)
+        days = (date.fromisoformat(to_date) - date.fromisoformat(from_date)).days + 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be YYYY-MM-DD and tz an IANA time zone")
+    if not 1 <= days <= max_days:
+        raise HTTPException(status_code=400, detail=f"Range must be 1 to {max_days} days")
+    return start, end
+
+# Calendar endpoints
+CALENDAR_MAX_DAYS = 366
+
+@api_router.get("/calendar", response_model=CalendarResponse)
+async def get_calendar(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    tz: str = "UTC",
+    user=Depends(verify_token),
+    _=conditional_get("appointments", "appointment_types")
+):
+    """Per-day appointment counts by status and type, and amounts, for a month or week view
+
+    `from` and `to` are inclusive dates; days are cut in the `tz` time zone.
+    Only days with appointments are listed.
+    """
+    start, end = _local_day_range(from_date, to_date, tz, CALENDAR_MAX_DAYS)
+    rows = await db.appointments.aggregate([
+        {"$match": {"pickup_at": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$pickup_at", "timezone": tz}},
+                "status": "$status",
+                "type": {"$ifNull": ["$appointment_type_id", ""]},
+            },
+            "count": {"$sum": 1},
+            "amount": {"$sum": {"$ifNull": ["$amount", 0]}},
+        }},
+    ]).to_list(None)
+    types = {t["id"]: t for t in await _get_appointment_types()}
     
-    if start_date:
-        query['pickup_time'] = {"$gte": start_date}
-    if end_date:
-        if 'pickup_time' in query:
-            query['pickup_time']['$lte'] = end_date
-        else:
-            query['pickup_time'] = {"$lte": end_date}
+    days = {}
+    for row in rows:
+        key = row["_id"]
+        day = days.setdefault(key["day"], {"date": key["day"], "count": 0, "amount": 0.0, "by_status": {}, "by_type": {}})
+        day["count"] += row["count"]
+        if key["status"] != "cancelled":
+            day["amount"] += row["amount"]
+        status = key["status"] or "unknown"
+        day["by_status"][status] = day["by_status"].get(status, 0) + row["count"]
+        day["by_type"][key["type"]] = day["by_type"].get(key["type"], 0) + row["count"]
     
-    if client_name:
-        query['client_name'] = {"$regex": client_name, "$options": "i"}
+    return CalendarResponse(tz=tz, days=[
+        CalendarDay(
+            **{**day, "by_type": [
+                CalendarTypeCount(appointment_type_id=type_id, name=types.get(type_id, {}).get("name"),
+                                  color=types.get(type_id, {}).get("color"), count=count)
+                for type_id, count in day["by_type"].items()
+            ]}
+        )
+        for _, day in sorted(days.items())
+    ])
+
+# Client endpoints
+@api_router.get("/clients/suggest", response_model=List[ClientSuggestion])
+async def suggest_clients(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=50),
+    user=Depends(verify_token)
+):
+    """Autocomplete client names: prefix matches first, then by trip count and recency"""
+    return await search.suggest(db, q, limit)
+
+@api_router.get("/clients/{client_name:path}/appointments", response_model=ClientAppointments)
+async def get_client_appointments(
+    client_name: str,
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    user=Depends(verify_token),
+    _=conditional_get("appointments")
+):
+    """One client's appointments in pickup order, with summary figures over every match.
+
+    The page is a keyset `find` in (pickup_at, id) order, served by the
+    (client_name, status, pickup_at, id) index with a status and by
+    (client_name, pickup_at, id) without one, so it stops after `limit` rows
+    instead of sorting the client's whole history. The summary is a `$group`
+    over the same filter, run concurrently. Both are merged with the client's
+    archived trips when the archive has any in range. Follow the X-Next-Cursor
+    response header by passing it back as `after`; the summary doesn't depend on it.
+    """
+    time_range = _time_range(from_date, to_date)
+    query = {"client_name": client_name, "pickup_at": time_range or {"$ne": None}}
+    if status:
+        query["status"] = status
     
-    if appointment_type_id:
-        query['appointment_type_id'] = appointment_type_id
+    page_query = {"$and": [query, _keyset_filter(after, forward=True, field="pickup_at")]} if after else query
+    page_cursor = db.appointments.find(page_query, {**APPOINTMENT_PROJECTION, "pickup_at": 1}).sort(
+        [("pickup_at", 1), ("id", 1)]
+    ).limit(limit + 1)
+    summary_cursor = db.appointments.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "total": {"$sum": "$amount"},
+            "first": {"$min": "$pickup_at"},
+            "last": {"$max": "$pickup_at"},
+        }},
+    ])
+    appointments, summaries = await asyncio.gather(page_cursor.to_list(limit + 1), summary_cursor.to_list(1))
     
-    appointments = await db.appointments.find(query, {"_id": 0}).to_list(10000)
-    
-    # Group by client
-    client_stats = {}
-    for apt in appointments:
-        name = apt.get('client_name', 'Unknown')
-        amount = apt.get('amount', 0)
-        if name not in client_stats:
-            client_stats[name] = {'count': 0, 'total': 0}
-        client_stats[name]['count'] += 1
-        client_stats[name]['total'] += amount
-    
-    # Group by type
-    type_stats = {}
-    for apt in appointments:
-        type_id = apt.get('appointment_type_id', 'unknown')
-        amount = apt.get('amount', 0)
-        if type_id not in type_stats:
-            type_stats[type_id] = {'count': 0, 'total': 0}
-        type_stats[type_id]['count'] += 1
-        type_stats[type_id]['total'] += amount
-    
-    total_income = sum(apt.get('amount', 0) for apt in appointments)
-    total_count = len(appointments)
+    totals = summaries[0] if summaries else {"count": 0, "total": 0}
+    first, last = totals.get("first"), totals.get("last")
     
-    return {
-        "total_income": total_income,
-        "total_count": total_count,
-        "by_client": client_stats,
-        "by_type": type_stats
-    }
+    months = archive.months_in(time_range, client_name, status)
+    if months:
+        position = _cursor_position(after, field="pickup_at") if after else None
+        cold, rows = await asyncio.to_thread(
+            archive.client_trips, months, client_name, time_range, status, position, limit + 1
+        )
+        # Both tiers in (pickup_at, id) order; Mongo hands back naive UTC datetimes
+        utc = lambda value: value.replace(tzinfo=timezone.utc) if value else None
+        appointments = sorted(appointments + rows, key=lambda doc: (utc(doc["pickup_at"]), doc["id"]))[:limit + 1]
+        first = min(filter(None, [utc(first), cold["first"]]), default=None)
+        last = max(filter(None, [utc(last), cold["last"]]), default=None)
+        totals = {"count": totals["count"] + cold["count"], "total": (totals["total"] or 0) + cold["total"]}
+    
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(appointments[-1], field="pickup_at")
+    
+    summary = ClientTripSummary(
+        count=totals["count"],
+        total=totals["total"] or 0,
+        average=(totals["total"] or 0) / totals["count"] if totals["count"] else 0,
+        first_trip=first.replace(tzinfo=timezone.utc).isoformat() if first else None,
+        last_trip=last.replace(tzinfo=timezone.utc).isoformat() if last else None,
+    )
+    return ClientAppointments(client_name=client_name, summary=summary, appointments=appointments)
 
 # SMS Template endpoints
 @api_router.get("/sms-template", response_model=SMSTemplate)
-async def get_sms_template(user=Depends(verify_token)):
+async def get_sms_template(user=Depends(verify_token), _=conditional_get("sms_templates")):
     """Get SMS template settings"""
-    template = await db.sms_templates.find_one({}, {"_id": 0})
+    template = await _get_sms_template()
     if not template:
-        # Return default template if none exists
-        default_template = SMSTemplate()
-        await db.sms_templates.insert_one(default_template.model_dump())
-        return default_template
+        # Store the default on first read; the upsert keeps concurrent first reads from inserting twice
+        template = await db.sms_templates.find_one_and_update(
+            {}, {"$setOnInsert": SMSTemplate().model_dump()}, {"_id": 0},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        await _collection_changed("sms_templates")
     return SMSTemplate(**template)
 
 @api_router.put("/sms-template", response_model=SMSTemplate)
@@ -360,31 +1056,165 @@ async def update_sms_template(
     user=Depends(verify_token)
 ):
     """Update SMS template settings"""
-    existing = await db.sms_templates.find_one({}, {"_id": 0})
-    
-    if not existing:
-        # Create default if doesn't exist
-        default_template = SMSTemplate()
-        await db.sms_templates.insert_one(default_template.model_dump())
-        existing = default_template.model_dump()
-    
     update_data = template_update.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
-    await db.sms_templates.update_one({}, {"$set": update_data})
-    
-    updated = await db.sms_templates.find_one({}, {"_id": 0})
+    # Fields not being updated fall back to the defaults if the template doesn't exist yet
+    defaults = {k: v for k, v in SMSTemplate().model_dump().items() if k not in update_data}
+    updated = await db.sms_templates.find_one_and_update(
+        {}, {"$set": update_data, "$setOnInsert": defaults}, {"_id": 0},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    await _collection_changed("sms_templates")
+    _publish("sms_template", "updated", updated.get("id"), updated)
     return SMSTemplate(**updated)
 
+SMS_RENDER_MAX_IDS = 500
+SMS_RENDER_MAX_DAYS = 31
+
+@api_router.post("/sms/render")
+async def render_sms(request: SMSRenderRequest, user=Depends(verify_token)):
+    """Render reminder messages for many appointments at once, streamed as NDJSON
+
+    Select appointments by `appointment_ids` or by pickup date (`from_date`,
+    optional `to_date`, `status`). Each line is {appointment_id, client_name,
+    pickup_time, message}, in pickup order; requested ids that don't exist
+    follow as {appointment_id, error} lines.
+    """
+    if (request.appointment_ids is None) == (request.from_date is None):
+        raise HTTPException(status_code=400, detail="Give either appointment_ids or from_date")
+    try:
+        zone = times.zone(request.tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    requested = list(dict.fromkeys(request.appointment_ids or []))
+    if request.appointment_ids is not None:
+        if len(requested) > SMS_RENDER_MAX_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {SMS_RENDER_MAX_IDS} appointment_ids")
+        query = {"id": {"$in": requested}}
+    else:
+        start, end = _local_day_range(request.from_date, request.to_date or request.from_date, request.tz,
+                                      SMS_RENDER_MAX_DAYS)
+        query = {"pickup_at": {"$gte": start, "$lt": end}}
+        if request.status:
+            query["status"] = request.status
+    
+    render = await _get_sms_renderer()
+    # Every type name in one (cached) lookup rather than one per appointment
+    type_names = {t["id"]: t["name"] for t in await _get_appointment_types()}
+    cursor = db.appointments.find(query, APPOINTMENT_PROJECTION).sort([("pickup_at", 1), ("id", 1)])
+    
+    async def messages():
+        missing = set(requested)
+        async for appointment in cursor:
+            missing.discard(appointment["id"])
+            yield {
+                "appointment_id": appointment["id"],
+                "client_name": appointment["client_name"],
+                "pickup_time": appointment["pickup_time"],
+                "message": render(appointment, type_names, zone, request.date_format),
+            }
+        for appointment_id in requested:
+            if appointment_id in missing:
+                yield {"appointment_id": appointment_id, "error": "Appointment not found"}
+    
+    return StreamingResponse(exports.ndjson_chunks(messages()), media_type=exports.MEDIA_TYPES["ndjson"])
+
+# Change feed
+@api_router.get("/events")
+async def get_events(request: Request, user=Depends(verify_token)):
+    """Server-sent events for appointment, appointment type and SMS template changes
+
+    Resumes after the Last-Event-ID request header when it can, and sends a
+    `reset` event when it can't (see events.py).
+    """
+    return StreamingResponse(
+        events.bus.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Admin endpoints
+@api_router.get("/admin/index-stats")
+async def get_index_stats(user=Depends(verify_token)):
+    """Index usage counters and the winning plan of each hot query"""
+    return await index_usage_report(db)
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(user=Depends(verify_token)):
+    """Hit/miss counters of the in-process document cache"""
+    return cache.documents.stats()
+
+@api_router.get("/admin/event-stats")
+async def get_event_stats(user=Depends(verify_token)):
+    """Open change-feed connections and where events come from"""
+    return events.bus.stats()
+
+@api_router.get("/admin/archive-stats")
+async def get_archive_stats(user=Depends(verify_token)):
+    """Archived months with their row counts and income, from the archive manifest"""
+    months = {}
+    for month, entry in sorted(archive.manifest()["months"].items()):
+        months[month] = {key: entry[key] for key in ("rows", "statuses", "first_pickup", "last_pickup", "archived_at")}
+        months[month]["total_income"] = entry["income"]["total_income"]
+        months[month]["total_count"] = entry["income"]["total_count"]
+    return months
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(user=Depends(verify_token)):
+    """Recent queries over the slow-query threshold, newest first, with their explained plans"""
+    return slow_queries.profiler.report()
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and its event loop is responsive"""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: warm-up has finished and MongoDB answers a ping"""
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "error": startup_state["error"]})
+    if not await mongo_client.ping(client, timeout=1.0):
+        return JSONResponse(status_code=503, content={"status": "mongodb unreachable"})
+    return {
+        "status": "ready",
+        "warm_up_ms": startup_state["warm_up_ms"],
+        "ready_after_ms": startup_state["ready_after_ms"],
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.exception_handler(versioning.NotModified)
+async def not_modified_handler(request: Request, exc: versioning.NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
+
+if os.environ.get('MONGO_COMMAND_HEADER') == '1':
+    app.add_middleware(command_monitor.CommandCountMiddleware)
+
+if compression.min_bytes() is not None:
+    # Inside MetricsMiddleware so response sizes are bytes on the wire
+    app.add_middleware(compression.CompressionMiddleware, minimum_size=compression.min_bytes())
+
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(slow_queries.ProfilerMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 # Configure logging
@@ -393,7 +1223,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
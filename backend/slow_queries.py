@@ -0,0 +1,182 @@
+"""Slow-query profiler for the hot read paths.
+
+`ProfilerMiddleware` makes the current request's ASGI scope visible to the
+command listener (Motor copies the request's context into its executor
+threads). When a query issued by one of PROFILED_ENDPOINTS takes longer than
+SLOW_QUERY_MS (default 100; empty disables profiling), the listener hands the
+command to a background task, which re-runs it under `explain` off the request
+path, logs the winning plan and flags collection scans and high
+docs-examined/returned ratios. The most recent findings are kept in a ring
+buffer served by GET /api/admin/slow-queries.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+from indexes import winning_stages
+
+logger = logging.getLogger(__name__)
+
+PROFILED_ENDPOINTS = {
+    "get_appointments",
+    "get_income_stats",
+    # id lookups
+    "get_appointment",
+    "update_appointment",
+    "delete_appointment",
+}
+PROFILED_COMMANDS = {"find", "aggregate", "count", "findAndModify", "delete", "update"}
+# Commands that change data are only explained with the query planner, never executed
+_WRITE_COMMANDS = {"findAndModify", "delete", "update"}
+# Driver-level fields that explain rejects or doesn't need
+_SESSION_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "readConcern", "writeConcern"}
+
+# Examining this many documents per returned one means the index doesn't fit the filter
+EXAMINED_RATIO_WARNING = 10
+
+_current_scope: ContextVar = ContextVar("profiled_scope", default=None)
+
+
+def _threshold_ms():
+    value = os.environ.get("SLOW_QUERY_MS", "100")
+    return float(value) if value else None
+
+
+def _plan_summary(explain):
+    """(queryPlanner, executionStats) of a find or aggregate explain, whatever its nesting."""
+    if "queryPlanner" in explain:
+        return explain["queryPlanner"], explain.get("executionStats") or {}
+    for stage in explain.get("stages", []):
+        cursor = stage.get("$cursor")
+        if cursor:
+            return cursor.get("queryPlanner", {}), cursor.get("executionStats") or {}
+    return {}, {}
+
+
+class SlowQueryProfiler(monitoring.CommandListener):
+    def __init__(self, threshold_ms, buffer_size=100, queue_size=100):
+        self.threshold_ms = threshold_ms
+        self.recent = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self._queue_size = queue_size
+        self._pending = {}
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def start(self, db):
+        """Begin explaining captured queries on the running event loop."""
+        if self.threshold_ms is None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self._queue_size)
+        self._worker = asyncio.create_task(self._explain_worker(db))
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+            self._loop = None
+
+    # Listener side: runs in Motor's executor threads, must stay cheap
+    def started(self, event):
+        if self._loop is None or event.command_name not in PROFILED_COMMANDS:
+            return
+        scope = _current_scope.get()
+        route = scope.get("route") if scope else None
+        if route is None or route.name not in PROFILED_ENDPOINTS:
+            return
+        self._pending[(event.connection_id, event.request_id)] = (route.name, event.command)
+
+    def succeeded(self, event):
+        captured = self._pending.pop((event.connection_id, event.request_id), None)
+        if captured and event.duration_micros / 1000 >= self.threshold_ms:
+            self._loop.call_soon_threadsafe(self._enqueue, captured, event)
+
+    def failed(self, event):
+        self._pending.pop((event.connection_id, event.request_id), None)
+
+    def _enqueue(self, captured, event):
+        endpoint, command = captured
+        try:
+            self._queue.put_nowait((endpoint, event.command_name, event.database_name, command,
+                                    event.duration_micros / 1000))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    # Worker side: on the event loop, outside any request
+    async def _explain_worker(self, db):
+        while True:
+            endpoint, command_name, database_name, command, duration_ms = await self._queue.get()
+            try:
+                await self._explain(db.client[database_name], endpoint, command_name, command, duration_ms)
+            except Exception:
+                logger.exception("Could not explain slow %s from %s", command_name, endpoint)
+
+    async def _explain(self, db, endpoint, command_name, command, duration_ms):
+        explained = {k: v for k, v in command.items() if k not in _SESSION_FIELDS}
+        verbosity = "queryPlanner" if command_name in _WRITE_COMMANDS else "executionStats"
+        explain = await db.command("explain", explained, verbosity=verbosity)
+
+        planner, stats = _plan_summary(explain)
+        winning = planner.get("winningPlan", {})
+        # slot-based engine plans nest the classic tree under queryPlan
+        stages = winning_stages(winning.get("queryPlan", winning))
+        returned = stats.get("nReturned")
+        examined = stats.get("totalDocsExamined")
+        ratio = examined / max(returned, 1) if examined is not None and returned is not None else None
+        collection = command.get(command_name)
+
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "endpoint": endpoint,
+            "command": command_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "duration_ms": round(duration_ms, 1),
+            "filter": command.get("filter", command.get("query", command.get("pipeline"))),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "docs_examined": examined,
+            "keys_examined": stats.get("totalKeysExamined"),
+            "returned": returned,
+            "examined_ratio": round(ratio, 1) if ratio is not None else None,
+        }
+        self.recent.append(entry)
+        logger.warning(
+            "Slow %s on %s from %s: %.0f ms, plan %s%s%s",
+            command_name, entry["collection"], endpoint, duration_ms, " > ".join(s or "?" for s in stages),
+            ", COLLSCAN" if entry["collscan"] else "",
+            f", examined {examined} docs for {returned}" if ratio and ratio >= EXAMINED_RATIO_WARNING else "",
+        )
+
+    def report(self):
+        return {
+            "threshold_ms": self.threshold_ms,
+            "dropped": self.dropped,
+            "queries": list(reversed(self.recent)),
+        }
+
+
+profiler = SlowQueryProfiler(_threshold_ms(), buffer_size=int(os.environ.get("SLOW_QUERY_BUFFER", "100")))
+
+
+class ProfilerMiddleware:
+    """Exposes the request scope (and so, once routed, its endpoint) to the profiler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
@@ -0,0 +1,71 @@
+"""Server-side rendering of client reminder SMS messages.
+
+Produces the text SMSPreviewModal.jsx used to build in the browser: the
+fixed greeting, a blank line, one "【label】value" line per non-empty
+template field in template order, a blank line and the fixed closing. The
+greeting and closing are not editable in the app (SMSTemplateContent.jsx
+shows them as fixed), so the template's own `greeting` / `closing` fields are
+not used. `compile_template` does the per-template work (field lookup and
+labels) once and returns a plain function; server.py caches that function
+next to the template document, so it is rebuilt only after the template
+changes.
+"""
+from datetime import timezone
+
+import times
+
+FIELD_LABELS = {
+    "client_name": "客戶",
+    "type": "類型",
+    "pickup_time": "接客時間",
+    "pickup_location": "接客地點",
+    "arrival_time": "抵達時間",
+    "arrival_location": "抵達地點",
+    "flight_info": "航班資訊",
+    "other_details": "備註",
+}
+TIME_FIELDS = {"pickup_time", "arrival_time"}
+
+GREETING = "您好，以下是我們接下來的行程："
+CLOSING = "期待為您服務！"
+
+# The app's date format settings (date-fns patterns) as strftime, with the time appended
+DATE_FORMATS = {
+    "MM/dd/yyyy": "%m/%d/%Y %H:%M",
+    "dd/MM/yyyy": "%d/%m/%Y %H:%M",
+}
+
+
+def format_time(value, zone, strftime_format):
+    """A display time string in `zone`, or the string unchanged if it isn't ISO 8601."""
+    instant = times.parse_utc(value)
+    if instant is None:
+        return value
+    return instant.astimezone(zone).strftime(strftime_format)
+
+
+def compile_template(template):
+    """Renderer for a stored SMS template: render(appointment, type_names, zone, date_format) -> str.
+
+    `type_names` maps appointment type ids to names; `zone` is the tzinfo times are shown in.
+    """
+    head = GREETING + "\n\n"
+    tail = "\n" + CLOSING
+    lines = [(field, f"【{FIELD_LABELS[field]}】") for field in template["fields"] if field in FIELD_LABELS]
+
+    def render(appointment, type_names, zone=timezone.utc, date_format="MM/dd/yyyy"):
+        strftime_format = DATE_FORMATS[date_format]
+        parts = [head]
+        for field, label in lines:
+            if field == "type":
+                value = type_names.get(appointment.get("appointment_type_id"), "")
+            elif field in TIME_FIELDS:
+                value = format_time(appointment.get(field), zone, strftime_format)
+            else:
+                value = appointment.get(field)
+            if value:
+                parts.append(f"{label}{value}\n")
+        parts.append(tail)
+        return "".join(parts)
+
+    return render
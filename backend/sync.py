@@ -0,0 +1,164 @@
+"""Sequence numbers, tombstones and sync tokens for delta sync of appointments.
+
+Every appointment write stamps the document with a `sync_seq` taken from a
+monotonic counter; deletions leave a tombstone carrying the sequence number
+of the delete. A client holding a sync token only needs the documents and
+tombstones with a higher sequence number.
+
+Sequence numbers are allocated just before the write that uses them, so a
+reader can see seq N+1 before seq N lands, and a stalled write can land
+after a token has already moved past its seq. Each write therefore also
+carries the server's clock at the moment it is applied (`synced_at` via
+$currentDate, `deleted_at` on tombstones), and two rules keep clients from
+missing it:
+
+- tokens only advance past changes applied more than SETTLE_SECONDS ago;
+  newer ones are sent again on the next poll;
+- a poll also returns everything applied since SETTLE_SECONDS before the
+  token was issued, whatever its seq, which catches the late writes.
+
+Changes may be sent twice, which is harmless because clients apply them by
+id. Both rules compare the database's clock with the API's, so the two must
+agree to well within SETTLE_SECONDS.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+
+TOMBSTONE_COLLECTION = "appointment_tombstones"
+TOMBSTONE_TTL_SECONDS = int(os.environ.get("TOMBSTONE_TTL_DAYS", "30")) * 86400
+SETTLE_SECONDS = 2
+
+
+class TokenExpired(Exception):
+    """The token predates the tombstone retention window; the client must resync."""
+
+
+async def reserve_seqs(db, count):
+    """First of `count` consecutive sequence numbers, taken in one counter update."""
+    counter = await db.counters.find_one_and_update(
+        {"_id": "appointments"},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"] - count + 1
+
+
+async def next_seq(db):
+    return await reserve_seqs(db, 1)
+
+
+def stamped(update):
+    """`update` also setting `synced_at` to the server's clock when it is applied."""
+    return {**update, "$currentDate": {**update.get("$currentDate", {}), "synced_at": True}}
+
+
+def _tombstone(appointment_id, seq):
+    # An upsert rather than an insert so deleted_at is the server's clock (a BSON date the TTL index can expire)
+    return {"id": appointment_id, "sync_seq": seq}, {"$currentDate": {"deleted_at": True}}
+
+
+async def record_delete(db, appointment_id):
+    """Tombstone for a delete; returns its sequence number."""
+    seq = await next_seq(db)
+    await db[TOMBSTONE_COLLECTION].update_one(*_tombstone(appointment_id, seq), upsert=True)
+    return seq
+
+
+async def record_deletes(db, appointment_ids):
+    """Tombstones for many deletes at once, taking their sequence numbers in one counter update.
+
+    Returns the first of those consecutive sequence numbers, in the order of `appointment_ids`.
+    """
+    if not appointment_ids:
+        return None
+    first = await reserve_seqs(db, len(appointment_ids))
+    await db[TOMBSTONE_COLLECTION].bulk_write(
+        [UpdateOne(*_tombstone(appointment_id, first + i), upsert=True) for i, appointment_id in enumerate(appointment_ids)],
+        ordered=False,
+    )
+    return first
+
+
+def encode_token(seq, issued_at):
+    raw = json.dumps({"seq": seq, "at": int(issued_at.timestamp())})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Returns (seq, issued_at); raises ValueError if malformed, TokenExpired if too old."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        seq = int(payload["seq"])
+        issued_at = datetime.fromtimestamp(payload["at"], timezone.utc)
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid sync token")
+    if datetime.now(timezone.utc) - issued_at > timedelta(seconds=TOMBSTONE_TTL_SECONDS):
+        raise TokenExpired()
+    return seq, issued_at
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _high_water(items, since):
+    """Highest sequence number among (seq, applied_at) items that are past the settle window."""
+    settled_before = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+    high_water = since
+    for seq, applied_at in items:
+        applied_at = _as_datetime(applied_at)
+        if seq is not None and applied_at and applied_at <= settled_before:
+            high_water = max(high_water, seq)
+    return high_water
+
+
+def _applied_at(doc):
+    # Rows written before synced_at existed only have the API's own timestamp
+    return doc.get("synced_at") or doc.get("updated_at")
+
+
+async def snapshot(db):
+    """Every appointment plus the sequence number a client can resume from."""
+    docs = await db.appointments.find({}, {"_id": 0}).to_list(None)
+    return docs, _high_water(((d.get("sync_seq"), _applied_at(d)) for d in docs), 0)
+
+
+async def changes_since(db, since, limit, issued_at=None):
+    """Appointments and tombstones with sync_seq > since, oldest first.
+
+    With the token's `issued_at`, changes applied from SETTLE_SECONDS before it
+    on are included whatever their seq (see the module docstring).
+    Returns (changes, deleted_ids, high_water_seq, has_more).
+    """
+    docs_query = tombstones_query = {"sync_seq": {"$gt": since}}
+    if issued_at is not None:
+        recheck_from = issued_at - timedelta(seconds=SETTLE_SECONDS)
+        docs_query = {"$or": [docs_query, {"synced_at": {"$gte": recheck_from}}]}
+        tombstones_query = {"$or": [tombstones_query, {"deleted_at": {"$gte": recheck_from}}]}
+    docs = await db.appointments.find(docs_query, {"_id": 0}).sort("sync_seq", 1).to_list(limit + 1)
+    tombstones = await db[TOMBSTONE_COLLECTION].find(tombstones_query, {"_id": 0}).sort("sync_seq", 1).to_list(limit + 1)
+
+    merged = sorted(
+        [(d["sync_seq"], _applied_at(d), d, None) for d in docs]
+        + [(t["sync_seq"], t.get("deleted_at"), None, t["id"]) for t in tombstones],
+        key=lambda item: item[0],
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    changes = [doc for _, _, doc, _ in merged if doc is not None]
+    deleted = [deleted_id for _, _, _, deleted_id in merged if deleted_id is not None]
+    high_water = _high_water(((seq, applied_at) for seq, applied_at, _, _ in merged), since)
+    # A full page still inside the settle window can't move the token; asking again right away would
+    # return the same page, so the rest waits for the next poll
+    return changes, deleted, high_water, has_more and high_water > since
@@ -0,0 +1,82 @@
+"""Typed pickup and arrival times.
+
+`pickup_time` and `arrival_time` stay the display strings the client sent.
+Every write also stores `pickup_at` / `arrival_at`: the same instant as a UTC
+BSON datetime, or null when the string is empty or not ISO 8601. Strings
+without an offset are taken as UTC. Date and range filters run against the
+typed fields, so offsets such as `+08:00` compare correctly and the range
+indexes hold real dates.
+
+Rows written before these fields existed get them from migration 0003.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+TYPED_FIELDS = {"pickup_time": "pickup_at", "arrival_time": "arrival_at"}
+
+
+def parse_utc(value):
+    """The instant an ISO 8601 string denotes, as an aware UTC datetime, or None."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def typed_fields(doc):
+    """`pickup_at` / `arrival_at` for whichever display strings `doc` carries."""
+    return {typed: parse_utc(doc[display]) for display, typed in TYPED_FIELDS.items() if display in doc}
+
+
+def utc_day(doc):
+    """UTC calendar day (YYYY-MM-DD) of an appointment's pickup, or "" if it has none."""
+    pickup_at = parse_utc(doc.get("pickup_time"))
+    return pickup_at.strftime("%Y-%m-%d") if pickup_at else ""
+
+
+def _bound(value):
+    parsed = parse_utc(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value!r}")
+    return parsed
+
+
+def range_filter(start=None, end=None):
+    """Mongo range on a typed time field, or None without bounds.
+
+    Both bounds are inclusive. A bare date as `end` covers that whole UTC day.
+    Raises ValueError for a bound that isn't ISO 8601.
+    """
+    time_range = {}
+    if start:
+        time_range["$gte"] = _bound(start)
+    if end:
+        if len(end) <= 10:
+            time_range["$lt"] = _bound(end) + timedelta(days=1)
+        else:
+            time_range["$lte"] = _bound(end)
+    return time_range or None
+
+
+def zone(tz):
+    """ZoneInfo for an IANA time zone name; ValueError if there is no such zone."""
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {tz!r}")
+
+
+def local_day_range(first, last, tz):
+    """UTC [start, end) covering the dates `first` to `last` (inclusive) as days in time zone `tz`.
+
+    Raises ValueError for a date that isn't YYYY-MM-DD or an unknown time zone.
+    """
+    local = zone(tz)
+    start = datetime.combine(date.fromisoformat(first), time.min, local)
+    end = datetime.combine(date.fromisoformat(last) + timedelta(days=1), time.min, local)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
@@ -0,0 +1,44 @@
+"""Per-collection version stamps and ETags for conditional GETs.
+
+Every write endpoint bumps the stamp of the collection it changed, after the
+write has landed. Read endpoints derive a strong ETag from the stamps they
+depend on plus the request's path and query string, so a client revalidating
+with If-None-Match can be answered from one tiny lookup. The stamps live in
+MongoDB, so all workers agree on them.
+"""
+import hashlib
+
+VERSION_COLLECTION = "collection_versions"
+
+
+class NotModified(Exception):
+    def __init__(self, etag):
+        self.etag = etag
+
+
+async def bump(db, *collections):
+    for name in collections:
+        await db[VERSION_COLLECTION].update_one({"_id": name}, {"$inc": {"v": 1}}, upsert=True)
+
+
+async def current(db, collections):
+    """Version stamp per collection; never-written collections are at 0."""
+    versions = dict.fromkeys(collections, 0)
+    async for doc in db[VERSION_COLLECTION].find({"_id": {"$in": list(collections)}}):
+        versions[doc["_id"]] = doc.get("v", 0)
+    return versions
+
+
+async def etag(db, request, collections):
+    versions = await current(db, collections)
+    params = sorted(request.query_params.multi_items())
+    key = repr((request.url.path, params, sorted(versions.items())))
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/ prefixes added by proxies still match
+    return "*" in candidates or tag in (c[2:] if c.startswith("W/") else c for c in candidates)
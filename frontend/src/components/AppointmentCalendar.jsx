@@ -1,12 +1,16 @@
-import { useState } from 'react';
+import { useState, useEffect } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Calendar } from '@/components/ui/calendar';
 import { Badge } from '@/components/ui/badge';
-import { format } from 'date-fns';
+import { format, parseISO, startOfMonth, endOfMonth } from 'date-fns';
 import { zhTW } from 'date-fns/locale';
 import { Clock, MapPin, Edit, Copy } from 'lucide-react';
 import * as LucideIcons from 'lucide-react';
 import { formatDate, formatShortDate } from '@/utils/dateFormat';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
 
 const statusConfig = {
   scheduled: { label: '已排程', color: 'bg-blue-100 text-blue-700 border-blue-200' },
@@ -27,6 +31,26 @@ const COLORS = [
 
 export default function AppointmentCalendar({ appointments, appointmentTypes, onEdit, onCopy }) {
   const [selectedDate, setSelectedDate] = useState(new Date());
+  const [month, setMonth] = useState(new Date());
+  const [calendarDays, setCalendarDays] = useState(null);
+
+  // 月曆上的標記由伺服器按日彙總，換月只需一個小請求
+  useEffect(() => {
+    let cancelled = false;
+    axios.get(`${API}/calendar`, {
+      params: {
+        from: format(startOfMonth(month), 'yyyy-MM-dd'),
+        to: format(endOfMonth(month), 'yyyy-MM-dd'),
+        tz: Intl.DateTimeFormat().resolvedOptions().timeZone
+      },
+      headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+    }).then(response => {
+      if (!cancelled) setCalendarDays(response.data.days);
+    }).catch(() => {
+      if (!cancelled) setCalendarDays(null);
+    });
+    return () => { cancelled = true; };
+  }, [month, appointments]);
 
   const getAppointmentsForDate = (date) => {
     const dateStr = format(date, 'yyyy-MM-dd');
@@ -54,13 +78,15 @@ export default function AppointmentCalendar({ appointments, appointmentTypes, on
     return color || COLORS[0];
   };
 
-  const appointmentDates = appointments.map(apt => {
-    try {
-      return new Date(apt.pickup_time.split('T')[0]);
-    } catch {
-      return null;
-    }
-  }).filter(Boolean);
+  const appointmentDates = calendarDays
+    ? calendarDays.map(day => parseISO(day.date))
+    : appointments.map(apt => {
+      try {
+        return new Date(apt.pickup_time.split('T')[0]);
+      } catch {
+        return null;
+      }
+    }).filter(Boolean);
 
   return (
     <div className="grid grid-cols-1 lg:grid-cols-3 gap-6" data-testid="calendar-view">
@@ -74,6 +100,8 @@ export default function AppointmentCalendar({ appointments, appointmentTypes, on
             mode="single"
             selected={selectedDate}
             onSelect={setSelectedDate}
+            month={month}
+            onMonthChange={setMonth}
             className="rounded-md border"
             modifiers={{
               hasAppointment: appointmentDates
@@ -252,7 +252,6 @@ export default function AppointmentList({ appointments, appointmentTypes, onEdit
       {showSMSModal && selectedAppointment && (
         <SMSPreviewModal
           appointment={selectedAppointment}
-          appointmentTypes={appointmentTypes}
           onClose={() => setShowSMSModal(false)}
         />
       )}
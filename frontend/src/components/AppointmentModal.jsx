@@ -8,6 +8,10 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Badge } from '@/components/ui/badge';
 import { toast } from 'sonner';
 import * as LucideIcons from 'lucide-react';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
 
 const COLORS = [
   { value: '#9333ea', badge: 'bg-purple-100 text-purple-700' },
@@ -36,6 +40,23 @@ export default function AppointmentModal({ appointment, appointmentTypes, allApp
 
   const [timeWarning, setTimeWarning] = useState('');
   const [overlapWarning, setOverlapWarning] = useState('');
+  const [clientSuggestions, setClientSuggestions] = useState([]);
+
+  // 客戶姓名自動完成（輸入停頓後才查詢）
+  useEffect(() => {
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/clients/suggest`, {
+          params: { q: formData.client_name, limit: 8 },
+          headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+        });
+        setClientSuggestions(response.data.map(c => c.name));
+      } catch (error) {
+        setClientSuggestions([]);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [formData.client_name]);
 
   useEffect(() => {
     if (appointmentTypes.length > 0 && !appointment) {
@@ -182,9 +203,14 @@ export default function AppointmentModal({ appointment, appointmentTypes, allApp
                 value={formData.client_name}
                 onChange={(e) => handleChange('client_name', e.target.value)}
                 required
+                list="client-suggestions"
+                autoComplete="off"
                 className="text-sm h-9"
                 data-testid="modal-client-name"
               />
+              <datalist id="client-suggestions">
+                {clientSuggestions.map(name => <option key={name} value={name} />)}
+              </datalist>
             </div>
 
             {/* 預約類型和狀態 - 並排 */}
@@ -21,6 +21,8 @@ export default function IncomeReportModal({ onClose }) {
   const [stats, setStats] = useState(null);
   const [appointmentTypes, setAppointmentTypes] = useState([]);
   const [clientAppointments, setClientAppointments] = useState([]);
+  const [clientSummary, setClientSummary] = useState(null);
+  const [clientNextCursor, setClientNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [showClientDetail, setShowClientDetail] = useState(false);
 
@@ -79,22 +81,21 @@ export default function IncomeReportModal({ onClose }) {
     }
   };
 
-  const fetchClientAppointments = async (clientName) => {
+  const fetchClientAppointments = async (clientName, after = null) => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API}/appointments`, getAuthHeader());
-      const appointments = response.data;
-      
-      // Filter appointments for the selected client and date range
-      const filtered = appointments.filter(apt => {
-        const pickupDate = apt.pickup_time.split('T')[0];
-        const matchClient = apt.client_name === clientName;
-        const matchDate = pickupDate >= startDate && pickupDate <= endDate;
-        const matchStatus = apt.status === 'completed';
-        return matchClient && matchDate && matchStatus;
+      const params = { from: startDate, to: endDate, status: 'completed' };
+      if (after) {
+        params.after = after;
+      }
+      const response = await axios.get(`${API}/clients/${encodeURIComponent(clientName)}/appointments`, {
+        params,
+        ...getAuthHeader()
       });
       
-      setClientAppointments(filtered);
+      setClientAppointments(prev => after ? [...prev, ...response.data.appointments] : response.data.appointments);
+      setClientSummary(response.data.summary);
+      setClientNextCursor(response.headers['x-next-cursor'] || null);
       setSelectedClient(clientName);
       setShowClientDetail(true);
     } catch (error) {
@@ -111,8 +112,6 @@ export default function IncomeReportModal({ onClose }) {
     return type ? type.name : '未知類型';
   };
 
-  const clientDetailTotal = clientAppointments.reduce((sum, apt) => sum + (apt.amount || 0), 0);
-
   return (
     <Dialog open={true} onOpenChange={onClose}>
       <DialogContent className="max-w-4xl max-h-[90vh] overflow-y-auto" data-testid="income-report-modal">
@@ -201,12 +200,24 @@ export default function IncomeReportModal({ onClose }) {
                     <div className="mb-4 p-4 bg-white rounded-lg">
                       <div className="flex justify-between items-center">
                         <span className="text-gray-600">總行程數：</span>
-                        <span className="text-xl font-bold text-blue-700">{clientAppointments.length} 趟</span>
+                        <span className="text-xl font-bold text-blue-700">{clientSummary?.count ?? 0} 趟</span>
                       </div>
                       <div className="flex justify-between items-center mt-2">
                         <span className="text-gray-600">總金額：</span>
-                        <span className="text-2xl font-bold text-green-700">${clientDetailTotal.toLocaleString()}</span>
+                        <span className="text-2xl font-bold text-green-700">${(clientSummary?.total ?? 0).toLocaleString()}</span>
+                      </div>
+                      <div className="flex justify-between items-center mt-2">
+                        <span className="text-gray-600">平均金額：</span>
+                        <span className="font-semibold text-gray-800">${Math.round(clientSummary?.average ?? 0).toLocaleString()}</span>
                       </div>
+                      {clientSummary?.first_trip && (
+                        <div className="flex justify-between items-center mt-2">
+                          <span className="text-gray-600">首次 / 最近行程：</span>
+                          <span className="text-sm text-gray-800">
+                            {formatDateTime(clientSummary.first_trip)} / {formatDateTime(clientSummary.last_trip)}
+                          </span>
+                        </div>
+                      )}
                     </div>
 
                     <div className="space-y-3 max-h-96 overflow-y-auto">
@@ -241,6 +252,15 @@ export default function IncomeReportModal({ onClose }) {
                         </div>
                       ))}
                     </div>
+                    {clientNextCursor && (
+                      <Button
+                        variant="outline"
+                        onClick={() => fetchClientAppointments(selectedClient, clientNextCursor)}
+                        className="w-full mt-3"
+                      >
+                        載入更多
+                      </Button>
+                    )}
                   </CardContent>
                 </Card>
               </div>
@@ -5,90 +5,53 @@ import { Copy, CheckCircle } from 'lucide-react';
 import { useState, useEffect } from 'react';
 import { toast } from 'sonner';
 import axios from 'axios';
-import { formatDateTime } from '@/utils/dateFormat';
+import { getDateFormat } from '@/utils/dateFormat';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-// 固定的問候語和結語
-const FIXED_GREETING = '您好，以下是我們接下來的行程：';
-const FIXED_CLOSING = '期待為您服務！';
+const parseNDJSON = (text) => text.split('\n').filter(line => line.trim()).map(line => JSON.parse(line));
 
-export default function SMSPreviewModal({ appointment, appointmentTypes, onClose }) {
-  const [copied, setCopied] = useState(false);
-  const [template, setTemplate] = useState(null);
+// 單筆：appointment；批次：date（YYYY-MM-DD，當日所有已排程的預約）
+export default function SMSPreviewModal({ appointment, date, onClose }) {
+  const [copiedId, setCopiedId] = useState(null);
+  const [messages, setMessages] = useState(null);
 
   const getAuthHeader = () => ({
     headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
   });
 
   useEffect(() => {
-    fetchTemplate();
-  }, []);
+    fetchMessages();
+  }, [appointment?.id, date]);
 
-  const fetchTemplate = async () => {
+  const fetchMessages = async () => {
+    const selection = appointment ? { appointment_ids: [appointment.id] } : { from_date: date };
     try {
-      const response = await axios.get(`${API}/sms-template`, getAuthHeader());
-      setTemplate(response.data);
+      const response = await axios.post(`${API}/sms/render`, {
+        ...selection,
+        tz: Intl.DateTimeFormat().resolvedOptions().timeZone,
+        date_format: getDateFormat()
+      }, { ...getAuthHeader(), responseType: 'text' });
+      setMessages(parseNDJSON(response.data).filter(item => item.message !== undefined));
     } catch (error) {
-      console.error('Failed to fetch SMS template');
-      // Use default template
-      setTemplate({
-        greeting: FIXED_GREETING,
-        fields: ['client_name', 'type', 'pickup_time', 'pickup_location', 'arrival_time', 'arrival_location', 'flight_info', 'other_details'],
-        closing: FIXED_CLOSING
-      });
+      toast.error('載入簡訊失敗');
+      setMessages([]);
     }
   };
 
-  const getTypeName = (typeId) => {
-    const type = appointmentTypes.find(t => t.id === typeId);
-    return type ? type.name : '';
-  };
-
-  // Generate SMS content based on template with fixed greeting and closing
-  const generateSMS = () => {
-    if (!template) return '';
-    
-    let sms = FIXED_GREETING + '\n\n';
-    
-    const fieldData = {
-      'client_name': { label: '客戶', value: appointment.client_name },
-      'type': { label: '類型', value: getTypeName(appointment.appointment_type_id) },
-      'pickup_time': { label: '接客時間', value: formatDateTime(appointment.pickup_time) },
-      'pickup_location': { label: '接客地點', value: appointment.pickup_location },
-      'arrival_time': { label: '抵達時間', value: formatDateTime(appointment.arrival_time) },
-      'arrival_location': { label: '抵達地點', value: appointment.arrival_location },
-      'flight_info': { label: '航班資訊', value: appointment.flight_info },
-      'other_details': { label: '備註', value: appointment.other_details },
-    };
-    
-    template.fields.forEach(fieldId => {
-      const field = fieldData[fieldId];
-      if (field && field.value) {
-        sms += `【${field.label}】${field.value}\n`;
-      }
-    });
-    
-    sms += '\n' + FIXED_CLOSING;
-    
-    return sms;
-  };
-
-  const smsContent = generateSMS();
-
-  const handleCopy = async () => {
+  const handleCopy = async (item) => {
     try {
-      await navigator.clipboard.writeText(smsContent);
-      setCopied(true);
+      await navigator.clipboard.writeText(item.message);
+      setCopiedId(item.appointment_id);
       toast.success('已複製到剪貼簿');
-      setTimeout(() => setCopied(false), 2000);
+      setTimeout(() => setCopiedId(null), 2000);
     } catch (error) {
       toast.error('複製失敗，請手動複製');
     }
   };
 
-  if (!template) {
+  if (!messages) {
     return null;
   }
 
@@ -97,7 +60,7 @@ export default function SMSPreviewModal({ appointment, appointmentTypes, onClose
       <DialogContent className="max-w-2xl" data-testid="sms-preview-modal">
         <DialogHeader>
           <DialogTitle className="text-xl flex items-center gap-2">
-            客戶提醒簡訊
+            {appointment ? '客戶提醒簡訊' : `${date} 行程提醒簡訊`}
           </DialogTitle>
         </DialogHeader>
 
@@ -108,15 +71,47 @@ export default function SMSPreviewModal({ appointment, appointmentTypes, onClose
             </p>
           </div>
 
-          <Textarea
-            value={smsContent}
-            readOnly
-            rows={15}
-            className="font-mono text-sm bg-gray-50 resize-none"
-            data-testid="sms-content"
-          />
+          {messages.length === 0 && (
+            <div className="text-center py-8 text-gray-500">沒有需要發送的行程</div>
+          )}
 
-          <div className="flex gap-3 justify-end">
+          <div className="space-y-4 max-h-[60vh] overflow-y-auto">
+            {messages.map(item => (
+              <div key={item.appointment_id} className="space-y-2">
+                {!appointment && (
+                  <div className="text-sm font-semibold text-gray-700">{item.client_name}</div>
+                )}
+                <Textarea
+                  value={item.message}
+                  readOnly
+                  rows={appointment ? 15 : 8}
+                  className="font-mono text-sm bg-gray-50 resize-none"
+                  data-testid={`sms-content-${item.appointment_id}`}
+                />
+                <div className="flex justify-end">
+                  <Button
+                    onClick={() => handleCopy(item)}
+                    className="bg-gradient-to-r from-blue-500 to-indigo-600 hover:from-blue-600 hover:to-indigo-700 flex items-center gap-2"
+                    data-testid={`sms-copy-${item.appointment_id}`}
+                  >
+                    {copiedId === item.appointment_id ? (
+                      <>
+                        <CheckCircle className="w-4 h-4" />
+                        已複製
+                      </>
+                    ) : (
+                      <>
+                        <Copy className="w-4 h-4" />
+                        複製簡訊
+                      </>
+                    )}
+                  </Button>
+                </div>
+              </div>
+            ))}
+          </div>
+
+          <div className="flex justify-end">
             <Button
               variant="outline"
               onClick={onClose}
@@ -124,23 +119,6 @@ export default function SMSPreviewModal({ appointment, appointmentTypes, onClose
             >
               關閉
             </Button>
-            <Button
-              onClick={handleCopy}
-              className="bg-gradient-to-r from-blue-500 to-indigo-600 hover:from-blue-600 hover:to-indigo-700 flex items-center gap-2"
-              data-testid="sms-copy"
-            >
-              {copied ? (
-                <>
-                  <CheckCircle className="w-4 h-4" />
-                  已複製
-                </>
-              ) : (
-                <>
-                  <Copy className="w-4 h-4" />
-                  複製簡訊
-                </>
-              )}
-            </Button>
           </div>
         </div>
       </DialogContent>
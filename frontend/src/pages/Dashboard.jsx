@@ -1,8 +1,9 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
-import { Calendar, List, Plus, LogOut, Search, Filter, Settings, DollarSign } from 'lucide-react';
+import { Calendar, List, Plus, LogOut, Search, Filter, Settings, DollarSign, MessageSquare } from 'lucide-react';
+import { addDays, format } from 'date-fns';
 import axios from 'axios';
 import { toast } from 'sonner';
 import AppointmentList from '@/components/AppointmentList';
@@ -10,11 +11,21 @@ import AppointmentCalendar from '@/components/AppointmentCalendar';
 import AppointmentModal from '@/components/AppointmentModal';
 import SettingsModal from '@/components/SettingsModal';
 import IncomeReportModal from '@/components/IncomeReportModal';
+import SMSPreviewModal from '@/components/SMSPreviewModal';
+import { subscribeEvents } from '@/utils/eventStream';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Merge a delta from /appointments/changes into the current list
+const applyChanges = (list, changes, deleted) => {
+  const byId = new Map(list.map(apt => [apt.id, apt]));
+  deleted.forEach(id => byId.delete(id));
+  changes.forEach(apt => byId.set(apt.id, apt));
+  return Array.from(byId.values());
+};
+
 export default function Dashboard({ onLogout }) {
   const [appointments, setAppointments] = useState([]);
   const [appointmentTypes, setAppointmentTypes] = useState([]);
@@ -23,12 +34,15 @@ export default function Dashboard({ onLogout }) {
   const [showModal, setShowModal] = useState(false);
   const [showSettingsModal, setShowSettingsModal] = useState(false);
   const [showIncomeModal, setShowIncomeModal] = useState(false);
+  const [showTomorrowSMS, setShowTomorrowSMS] = useState(false);
   const [editingAppointment, setEditingAppointment] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState('all');
   const [typeFilter, setTypeFilter] = useState('all');
   const [activeTab, setActiveTab] = useState('list');
   const [totalIncome, setTotalIncome] = useState(0);
+  const syncToken = useRef(null);
+  const incomeRefresh = useRef(null);
 
   useEffect(() => {
     fetchAppointmentTypes();
@@ -36,6 +50,15 @@ export default function Dashboard({ onLogout }) {
     fetchIncomeStats();
   }, []);
 
+  // 其他裝置的變更即時推送過來，不必重新載入
+  useEffect(() => {
+    const unsubscribe = subscribeEvents(`${API}/events`, () => localStorage.getItem('token'), handleServerEvent);
+    return () => {
+      unsubscribe();
+      clearTimeout(incomeRefresh.current);
+    };
+  }, []);
+
   useEffect(() => {
     filterAppointments();
   }, [appointments, searchTerm, statusFilter, typeFilter]);
@@ -58,11 +81,27 @@ export default function Dashboard({ onLogout }) {
 
   const fetchAppointments = async () => {
     try {
-      const response = await axios.get(`${API}/appointments`, getAuthHeader());
-      setAppointments(response.data);
+      // First call returns the full list; later calls only what changed since the token
+      let token = syncToken.current;
+      let hasMore = true;
+      while (hasMore) {
+        const response = await axios.get(`${API}/appointments/changes`, {
+          params: token ? { since: token } : {},
+          ...getAuthHeader()
+        });
+        const { changes, deleted, full } = response.data;
+        setAppointments(prev => applyChanges(full ? [] : prev, changes, deleted));
+        token = response.data.token;
+        hasMore = response.data.has_more;
+      }
+      syncToken.current = token;
       fetchIncomeStats();
     } catch (error) {
-      if (error.response?.status === 401) {
+      if (error.response?.status === 410) {
+        // Token older than the tombstone retention window: start over
+        syncToken.current = null;
+        fetchAppointments();
+      } else if (error.response?.status === 401) {
         toast.error('登入已過期，請重新登入');
         onLogout();
       } else {
@@ -73,6 +112,22 @@ export default function Dashboard({ onLogout }) {
     }
   };
 
+  const handleServerEvent = (event, payload) => {
+    if (event === 'appointment') {
+      const changes = payload.data ? [payload.data] : [];
+      const deleted = payload.action === 'deleted' ? [payload.id] : [];
+      setAppointments(prev => applyChanges(prev, changes, deleted));
+      // 連續多筆變更只重新計算一次收入
+      clearTimeout(incomeRefresh.current);
+      incomeRefresh.current = setTimeout(fetchIncomeStats, 1000);
+    } else if (event === 'appointment_type') {
+      fetchAppointmentTypes();
+    } else if (event === 'reset') {
+      // 漏掉的事件已無法補送，用同步權杖補齊差異
+      fetchAppointments();
+    }
+  };
+
   const fetchIncomeStats = async () => {
     try {
       // Get current month date range
@@ -159,13 +214,18 @@ export default function Dashboard({ onLogout }) {
 
   const handleSaveAppointment = async (appointmentData) => {
     try {
+      let response;
       if (editingAppointment?.id) {
-        await axios.put(`${API}/appointments/${editingAppointment.id}`, appointmentData, getAuthHeader());
+        response = await axios.put(`${API}/appointments/${editingAppointment.id}`, appointmentData, getAuthHeader());
         toast.success('預約已更新');
       } else {
-        await axios.post(`${API}/appointments`, appointmentData, getAuthHeader());
+        response = await axios.post(`${API}/appointments`, appointmentData, getAuthHeader());
         toast.success('預約已新增');
       }
+      const conflicts = response.data.conflicts || [];
+      if (conflicts.length > 0) {
+        toast.warning(`此預約與 ${conflicts.length} 筆已排定的預約時間重疊`, { duration: 5000 });
+      }
       setShowModal(false);
       fetchAppointments();
     } catch (error) {
@@ -211,6 +271,15 @@ export default function Dashboard({ onLogout }) {
               </p>
             </div>
             <div className="flex gap-2">
+              <Button
+                onClick={() => setShowTomorrowSMS(true)}
+                variant="outline"
+                className="flex items-center gap-2 hover:bg-indigo-50 hover:text-indigo-600 hover:border-indigo-200"
+                data-testid="tomorrow-sms-button"
+              >
+                <MessageSquare className="w-4 h-4" />
+                明日簡訊
+              </Button>
               <Button
                 onClick={() => setShowIncomeModal(true)}
                 variant="outline"
@@ -364,6 +433,13 @@ export default function Dashboard({ onLogout }) {
           onClose={() => setShowIncomeModal(false)}
         />
       )}
+
+      {showTomorrowSMS && (
+        <SMSPreviewModal
+          date={format(addDays(new Date(), 1), 'yyyy-MM-dd')}
+          onClose={() => setShowTomorrowSMS(false)}
+        />
+      )}
     </div>
   );
 }
\ No newline at end of file
@@ -0,0 +1,60 @@
+// 訂閱 /api/events 的變更通知（Server-Sent Events）
+// EventSource 無法帶 Authorization 標頭，所以用 fetch 讀取串流，
+// 斷線後帶 Last-Event-ID 重新連線，補收漏掉的事件
+export const subscribeEvents = (url, getToken, onEvent) => {
+  let lastEventId = null;
+  let retryMs = 3000;
+  let controller = null;
+  let closed = false;
+
+  const dispatch = (block) => {
+    let id = null;
+    let event = 'message';
+    const data = [];
+    block.split('\n').forEach(line => {
+      if (!line || line.startsWith(':')) return;  // 空行或心跳
+      const colon = line.indexOf(':');
+      const field = colon === -1 ? line : line.slice(0, colon);
+      const value = colon === -1 ? '' : line.slice(colon + 1).replace(/^ /, '');
+      if (field === 'id') id = value;
+      else if (field === 'event') event = value;
+      else if (field === 'data') data.push(value);
+      else if (field === 'retry' && /^\d+$/.test(value)) retryMs = Number(value);
+    });
+    if (id !== null) lastEventId = id;
+    if (data.length > 0) onEvent(event, JSON.parse(data.join('\n')));
+  };
+
+  const connect = async () => {
+    controller = new AbortController();
+    try {
+      const headers = { Authorization: `Bearer ${getToken()}` };
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+      const response = await fetch(url, { headers, signal: controller.signal });
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+          dispatch(buffer.slice(0, end));
+          buffer = buffer.slice(end + 2);
+        }
+      }
+    } catch (error) {
+      if (closed) return;
+    }
+    if (!closed) setTimeout(connect, retryMs);
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (controller) controller.abort();
+  };
+};
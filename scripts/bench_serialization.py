@@ -0,0 +1,157 @@
+"""Micro-benchmark: CPU time to turn a list of appointments into a response body.
+
+Compares FastAPI's default path (validate every row against List[Appointment],
+serialize, render with json.dumps) with the fast JSON mode enabled by
+FAST_JSON_RESPONSES=1 (render the projected documents directly, with orjson
+when installed and the stdlib encoder otherwise). No database is needed; the
+documents are synthetic but shaped like real ones.
+
+A second table covers GET /api/appointments with and without `fields=`: bytes
+on the wire and CPU to render and compress the body, uncompressed, gzip and
+brotli (when installed), using the same settings as compression.py. Full rows
+are rendered both ways; sparse rows are always rendered directly.
+
+    python scripts/bench_serialization.py [--sizes 1000,10000,100000] [--repeat 5]
+                                          [--fields pickup_location,arrival_location,status,amount]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+# server.py needs these to import; nothing connects to MongoDB
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench')
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import compression  # noqa: E402
+import fast_json  # noqa: E402
+from server import Appointment, _fields_projection  # noqa: E402
+
+
+def make_documents(n):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    docs = []
+    for i in range(n):
+        pickup = start + timedelta(minutes=37 * i)
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "client_name": f"客戶{i % 500}",
+            "pickup_time": pickup.isoformat(),
+            "pickup_location": "桃園國際機場第二航廈",
+            "arrival_time": (pickup + timedelta(hours=1)).isoformat(),
+            "arrival_location": "台北市信義區市府路45號",
+            "flight_info": f"BR{100 + i % 900}",
+            "other_details": "兩件行李",
+            "amount": float(1200 + i % 7 * 100),
+            "appointment_type_id": str(uuid.UUID(int=i % 5)),
+            "status": ("scheduled", "completed", "cancelled")[i % 3],
+            "created_at": start.isoformat(),
+            "updated_at": start.isoformat(),
+        })
+    return docs
+
+
+RESPONSE_FIELD = create_response_field(name="Response_get_appointments", type_=List[Appointment])
+
+
+async def default_path(docs):
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=docs)
+    return JSONResponse(content).body
+
+
+async def fast_path(docs):
+    return fast_json.FastJSONResponse(docs).body
+
+
+async def stdlib_fast_path(docs):
+    orjson, fast_json.orjson = fast_json.orjson, None
+    try:
+        return fast_json.FastJSONResponse(docs).body
+    finally:
+        fast_json.orjson = orjson
+
+
+def project(docs, fields):
+    """What MongoDB returns for `fields=` (see server._fields_projection)."""
+    keep = [field for field in _fields_projection(fields) if field != "_id"]
+    return [{field: doc[field] for field in keep if field in doc} for doc in docs]
+
+
+def encoded(render, coding):
+    async def encode(docs):
+        body = await render(docs)
+        return compression.compress(body, coding) if coding else body
+    return encode
+
+
+async def cpu_ms(render, docs, repeat):
+    """Best-of-`repeat` process CPU time for one render, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        await render(docs)
+        best = min(best, time.process_time() - started)
+    return best * 1000
+
+
+async def run_payload(sizes, repeat, fields):
+    codings = [None, "gzip"] + (["br"] if compression.brotli is not None else [])
+    print(f"\nGET /api/appointments; sparse = fields={fields}")
+    if compression.brotli is None:
+        print("Brotli not installed; only gzip is measured")
+    print(f"{'rows':>8} {'case':>13} " + "".join(f"{coding or 'identity':>24}" for coding in codings))
+    for size in sizes:
+        docs = make_documents(size)
+        cases = (
+            ("full", docs, default_path),
+            ("full, fast", docs, fast_path),
+            ("sparse", project(docs, fields), fast_path),
+        )
+        for case, rows, render in cases:
+            cells = []
+            for coding in codings:
+                body = await encoded(render, coding)(rows)
+                ms = await cpu_ms(encoded(render, coding), rows, repeat)
+                cells.append(f"{len(body) / 1024:>11.0f} KiB {ms:>7.1f} ms")
+            print(f"{size:>8} {case:>13} " + "".join(f"{cell:>24}" for cell in cells))
+
+
+async def run(sizes, repeat):
+    paths = [("response_model", default_path), ("fast (stdlib)", stdlib_fast_path)]
+    if fast_json.orjson is not None:
+        paths.append(("fast (orjson)", fast_path))
+    else:
+        print("orjson not installed; fast mode falls back to the stdlib encoder")
+
+    print(f"{'rows':>8} " + "".join(f"{name:>18}" for name, _ in paths) + f"{'speedup':>10}")
+    for size in sizes:
+        docs = make_documents(size)
+        timings = [await cpu_ms(render, docs, repeat) for _, render in paths]
+        cells = "".join(f"{ms:>15.1f} ms" for ms in timings)
+        print(f"{size:>8} {cells}{timings[0] / timings[-1]:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fields', default='pickup_location,arrival_location,status,amount')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    asyncio.run(run(sizes, args.repeat))
+    asyncio.run(run_payload(sizes, args.repeat, args.fields))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""Local load test: latency percentiles, throughput and MongoDB ops per endpoint.
+
+Seeds a dedicated database (MONGO_URL from backend/.env, DB_NAME suffixed with
+`_load_test`) with a synthetic dataset, then drives each endpoint in turn with
+`--concurrency` concurrent clients for `--duration` seconds. The app runs
+in-process behind httpx's ASGI transport (default; load generator and server
+share one CPU, so compare like with like) or as a local uvicorn server.
+MongoDB commands per request come from the X-Mongo-Commands header.
+
+Results are printed as JSON (and written to `--output`). With `--compare`
+they are checked against a saved baseline and the exit status is 1 if any
+endpoint regressed beyond `--tolerance`.
+
+    python scripts/load_test.py --appointments 100000 --output baseline.json
+    python scripts/load_test.py --appointments 100000 --compare baseline.json
+
+The seeded database is kept and reused while it has the requested size;
+pass --reseed to rebuild it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+load_dotenv(BACKEND_DIR / '.env')
+
+import rollups  # noqa: E402
+import search  # noqa: E402
+import times  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+PORT = int(os.environ.get('LOAD_TEST_PORT', '8766'))
+SEED_BATCH = 10_000
+SEED_DAYS = 365
+
+TYPES = [
+    ("機場接送", "#9333ea", "Plane"),
+    ("市區接送", "#06b6d4", "Car"),
+    ("商務用車", "#64748b", "Briefcase"),
+    ("私人行程", "#10b981", "User"),
+    ("VIP 專屬", "#f59e0b", "Star"),
+]
+STATUSES = ["completed"] * 6 + ["scheduled"] * 3 + ["cancelled"]
+SURNAMES = "王李張劉陳楊黃趙吳周徐孫馬朱胡郭何林羅高"
+
+
+def client_names(n_appointments):
+    count = max(50, n_appointments // 20)
+    return [f"{SURNAMES[i % len(SURNAMES)]}客戶{i:05d}" for i in range(count)]
+
+
+def seed_start():
+    # Fixed window so baselines taken on different days see the same data
+    return datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+async def seed(db, n_appointments):
+    """Fill `db` with `n_appointments` appointments plus the derived collections."""
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+    await ensure_indexes(db)
+
+    now = datetime.now(timezone.utc).isoformat()
+    types = [{"id": str(uuid.uuid4()), "name": n, "color": c, "icon": i, "created_at": now} for n, c, i in TYPES]
+    await db.appointment_types.insert_many([dict(t) for t in types])
+
+    rng = random.Random(42)
+    names = client_names(n_appointments)
+    start = seed_start()
+    step = SEED_DAYS * 86400 / max(n_appointments, 1)
+    batch = []
+    for i in range(n_appointments):
+        name = rng.choice(names)
+        pickup = (start + timedelta(seconds=i * step)).isoformat().replace("+00:00", "Z")
+        doc = {
+            "id": str(uuid.uuid4()),
+            "client_name": name,
+            "pickup_time": pickup,
+            "pickup_location": "桃園國際機場第二航廈",
+            "arrival_time": "",
+            "arrival_location": "台北市信義區市府路45號",
+            "flight_info": f"BR{rng.randint(100, 999)}",
+            "other_details": "",
+            "amount": float(rng.randrange(800, 3000, 100)),
+            "appointment_type_id": rng.choice(types)["id"],
+            "status": rng.choice(STATUSES),
+            "created_at": now,
+            "updated_at": now,
+            "sync_seq": i + 1,
+        }
+        doc.update(search.search_fields(name))
+        doc.update(times.typed_fields(doc))
+        batch.append(doc)
+        if len(batch) >= SEED_BATCH:
+            await db.appointments.insert_many(batch, ordered=False)
+            batch = []
+            print(f"  seeded {i + 1}/{n_appointments}", file=sys.stderr)
+    if batch:
+        await db.appointments.insert_many(batch, ordered=False)
+
+    await db.counters.update_one({"_id": "appointments"}, {"$set": {"seq": n_appointments}}, upsert=True)
+    await search.rebuild_clients(db)
+    await rollups.rebuild(db)
+    await db.load_test_meta.insert_one({"_id": "dataset", "appointments": n_appointments})
+
+
+async def ensure_dataset(db, n_appointments, reseed):
+    meta = await db.load_test_meta.find_one({"_id": "dataset"})
+    if reseed or not meta or meta.get("appointments") != n_appointments:
+        print(f"Seeding {n_appointments} appointments...", file=sys.stderr)
+        started = time.monotonic()
+        await seed(db, n_appointments)
+        print(f"Seeded in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
+
+class Scenario:
+    """Shared state the request builders draw from: ids, dates, names and a token."""
+
+    def __init__(self, db_sample, type_ids, names, n_appointments):
+        self.rng = random.Random(7)
+        self.ids = db_sample
+        self.type_ids = type_ids
+        self.names = names
+        self.n_appointments = n_appointments
+        self.created = []
+        self.sync_token = ""
+
+    def day(self):
+        return (seed_start() + timedelta(days=self.rng.randrange(SEED_DAYS))).strftime("%Y-%m-%d")
+
+    def month_range(self):
+        first = seed_start() + timedelta(days=self.rng.randrange(SEED_DAYS - 31))
+        return first.strftime("%Y-%m-%d"), (first + timedelta(days=30)).strftime("%Y-%m-%d")
+
+    def new_appointment(self):
+        return {
+            "client_name": self.rng.choice(self.names),
+            "pickup_time": f"{self.day()}T{self.rng.randrange(24):02d}:00:00.000Z",
+            "amount": 1200,
+            "appointment_type_id": self.rng.choice(self.type_ids),
+            "status": "scheduled",
+        }
+
+
+def endpoints(s):
+    """(name, builder) pairs; a builder returns (method, path, json body) for one request."""
+    def income():
+        start, end = s.month_range()
+        return "GET", f"appointments/stats/income?start_date={start}&end_date={end}", None
+
+    def income_series():
+        start, end = s.month_range()
+        return "GET", f"appointments/stats/income?start_date={start}&end_date={end}&granularity=day", None
+
+    def create():
+        return "POST", "appointments", s.new_appointment()
+
+    def delete():
+        # Only deletes what the create run made; skipped once those run out
+        return ("DELETE", f"appointments/{s.created.pop()}", None) if s.created else None
+
+    return [
+        ("pattern status", lambda: ("GET", "auth/pattern-status", None)),
+        ("list types", lambda: ("GET", "appointment-types", None)),
+        ("get appointment", lambda: ("GET", f"appointments/{s.rng.choice(s.ids)}", None)),
+        ("list appointments page", lambda: ("GET", "appointments?limit=100", None)),
+        ("list appointments by day", lambda: ("GET", f"appointments?date={s.day()}", None)),
+        ("list appointments by status and day",
+         lambda: ("GET", f"appointments?status=scheduled&date={s.day()}", None)),
+        ("search appointments by client",
+         lambda: ("GET", f"appointments?client_name={s.rng.choice(s.names)[:2]}&limit=100", None)),
+        ("appointment changes", lambda: ("GET", f"appointments/changes?since={s.sync_token}", None)),
+        ("income stats", income),
+        ("income stats series", income_series),
+        ("suggest clients", lambda: ("GET", f"clients/suggest?q={s.rng.choice(s.names)[0]}", None)),
+        ("get sms template", lambda: ("GET", "sms-template", None)),
+        ("create appointment", create),
+        ("update appointment",
+         lambda: ("PUT", f"appointments/{s.rng.choice(s.ids)}", {"amount": s.rng.randrange(800, 3000, 100)})),
+        ("delete appointment", delete),
+    ]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def drive(http, headers, build, concurrency, duration, scenario):
+    latencies = []
+    mongo_ops = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            request = build()
+            if request is None:
+                return
+            method, path, body = request
+            started = time.perf_counter()
+            response = await http.request(method, f"/api/{path}", json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            elif method == "POST" and path == "appointments":
+                scenario.created.append(response.json()["id"])
+            if "x-mongo-commands" in response.headers:
+                mongo_ops.append(int(response.headers["x-mongo-commands"]))
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "mongo_ops_per_request": round(sum(mongo_ops) / len(mongo_ops), 2) if mongo_ops else None,
+    }
+
+
+async def prepare_scenario(db, n_appointments):
+    sample = [doc["id"] async for doc in db.appointments.aggregate([
+        {"$sample": {"size": 1000}}, {"$project": {"_id": 0, "id": 1}},
+    ])]
+    type_ids = [t["id"] async for t in db.appointment_types.find({}, {"_id": 0, "id": 1})]
+    return Scenario(sample, type_ids, client_names(n_appointments), n_appointments)
+
+
+def start_uvicorn(env):
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(PORT), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/api/auth/pattern-status", timeout=1)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def run(args, db_name):
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = mongo[db_name]
+    await ensure_dataset(db, args.appointments, args.reseed)
+    scenario = await prepare_scenario(db, args.appointments)
+
+    os.environ.update(DB_NAME=db_name, MONGO_COMMAND_HEADER='1')
+    proc = None
+    if args.transport == "uvicorn":
+        proc = start_uvicorn(dict(os.environ))
+        http = httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=60)
+        lifespan = None
+    else:
+        import server  # reads DB_NAME and MONGO_COMMAND_HEADER at import
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://load", timeout=60)
+        lifespan = server.app.router.lifespan_context(server.app)
+        await lifespan.__aenter__()
+
+    results = {}
+    try:
+        token = (await http.post("/api/auth/login", json={"password": "driver123"})).json()["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        snapshot = await http.get("/api/appointments/changes?limit=1", headers=headers)
+        if snapshot.status_code == 200:
+            scenario.sync_token = snapshot.json()["token"]
+
+        selected = set(args.only.split(",")) if args.only else None
+        for name, build in endpoints(scenario):
+            if selected and name not in selected:
+                continue
+            print(f"  {name}...", file=sys.stderr)
+            results[name] = await drive(http, headers, build, args.concurrency, args.duration, scenario)
+    finally:
+        await http.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        mongo.close()
+
+    return {
+        "meta": {
+            "appointments": args.appointments,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "transport": args.transport,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "endpoints": results,
+    }
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """Regressions of `current` against `baseline`, as human-readable lines."""
+    regressions = []
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not now["requests"]:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if before.get(metric) and now[metric] > before[metric] * (1 + tolerance) \
+                    and now[metric] - before[metric] > min_delta_ms:
+                regressions.append(f"{name}: {metric} {before[metric]} -> {now[metric]}")
+        if before.get("rps") and now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {before['rps']} -> {now['rps']}")
+        if before.get("mongo_ops_per_request") is not None and now["mongo_ops_per_request"] is not None \
+                and now["mongo_ops_per_request"] > before["mongo_ops_per_request"] + 0.5:
+            regressions.append(
+                f"{name}: mongo ops/request {before['mongo_ops_per_request']} -> {now['mongo_ops_per_request']}"
+            )
+        if now["errors"] > before.get("errors", 0):
+            regressions.append(f"{name}: errors {before.get('errors', 0)} -> {now['errors']}")
+    if baseline.get("meta", {}).get("appointments") != current["meta"]["appointments"]:
+        print("⚠️  baseline was taken with a different dataset size", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test every API endpoint against a seeded local database")
+    parser.add_argument('--appointments', type=int, default=10_000, help="dataset size (1k to 1M)")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument('--transport', choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument('--only', help="comma-separated endpoint names to run")
+    parser.add_argument('--reseed', action='store_true')
+    parser.add_argument('--output', help="write the JSON results here (e.g. to use as a baseline)")
+    parser.add_argument('--compare', help="baseline JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="latency increases smaller than this are noise, whatever the ratio")
+    args = parser.parse_args()
+
+    db_name = f"{os.environ['DB_NAME']}_load_test"
+    results = asyncio.run(run(args, db_name))
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"❌ {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("🎉 No regressions against the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Measure cold start: process launch to live, ready and first fast response.
+
+Launches backend/server.py under uvicorn (MONGO_URL/DB_NAME from backend/.env)
+and probes it from the moment the process starts:
+
+    live_ms         first 200 from /healthz
+    ready_ms        first 200 from /readyz
+    first_fast_ms   first GET /api/appointments?limit=50 completing within
+                    2x the steady-state median latency
+    first_probe_ms  latency of the first successful probe
+    steady_ms       median probe latency once settled
+
+Each mode runs --runs times, with the warm-up enabled and disabled
+(MONGO_WARM_UP=0), and the medians are printed as JSON. Only read endpoints
+are probed, apart from what the app itself does at startup.
+
+    python scripts/measure_cold_start.py [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+load_dotenv(BACKEND_DIR / '.env')
+
+PORT = int(os.environ.get('COLD_START_PORT', '8767'))
+BASE = f"http://127.0.0.1:{PORT}"
+PROBE = "/api/appointments?limit=50"
+SETTLE_PROBES = 30
+TIMEOUT = 60
+
+
+def _since(launched):
+    return (time.perf_counter() - launched) * 1000
+
+
+def measure(warm_up):
+    env = dict(os.environ, MONGO_WARM_UP='1' if warm_up else '0')
+    launched = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(PORT), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    session = requests.Session()
+    result = {"live_ms": None, "ready_ms": None}
+    probes = []  # (completed at ms since launch, latency ms)
+    try:
+        while _since(launched) < TIMEOUT * 1000:
+            try:
+                if result["live_ms"] is None and session.get(f"{BASE}/healthz", timeout=1).ok:
+                    result["live_ms"] = _since(launched)
+                    token = session.post(f"{BASE}/api/auth/login", json={"password": "driver123"}).json()["token"]
+                    session.headers["Authorization"] = f"Bearer {token}"
+                if result["live_ms"] is None:
+                    continue
+                if result["ready_ms"] is None and session.get(f"{BASE}/readyz", timeout=1).ok:
+                    result["ready_ms"] = _since(launched)
+                started = time.perf_counter()
+                if session.get(f"{BASE}{PROBE}", timeout=10).ok:
+                    probes.append((_since(launched), (time.perf_counter() - started) * 1000))
+                if result["ready_ms"] is not None and len(probes) >= SETTLE_PROBES:
+                    break
+            except requests.ConnectionError:
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    if not probes:
+        raise RuntimeError("server never answered the probe")
+    steady = statistics.median(latency for _, latency in probes[-SETTLE_PROBES // 2:])
+    first_fast = next(at for at, latency in probes if latency <= 2 * steady)
+    result.update(first_fast_ms=first_fast, first_probe_ms=probes[0][1], steady_ms=steady)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time from process launch to ready and fast responses")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    report = {}
+    for label, warm_up in (("warm_up", True), ("no_warm_up", False)):
+        runs = [measure(warm_up) for _ in range(args.runs)]
+        report[label] = {
+            key: round(statistics.median(run[key] for run in runs), 1)
+            for key in runs[0]
+        }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
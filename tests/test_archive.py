@@ -0,0 +1,138 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import archive
+import times
+
+WEEK = "%G-W%V"
+
+
+def doc(pickup, amount, client_name="王小明", appointment_type_id="t1", status="completed", id=None):
+    return {
+        "id": id or f"{client_name}-{pickup}",
+        "client_name": client_name,
+        "pickup_time": pickup,
+        "pickup_at": times.parse_utc(pickup),
+        "amount": amount,
+        "appointment_type_id": appointment_type_id,
+        "status": status,
+    }
+
+
+@pytest.fixture
+def archived(tmp_path, monkeypatch):
+    """Commit month files and manifest entries for docs, like a finished archive run."""
+    monkeypatch.setenv("ARCHIVE_DIR", str(tmp_path))
+
+    def commit(month, docs):
+        frame = archive._frame(docs)
+        archive._write(tmp_path / archive._month_file(month), frame)
+        archive._save_manifest(month, archive._entry(month, frame))
+
+    return commit
+
+
+def test_income_groups_missing_client_and_type_as_unknown():
+    frame = archive._frame([
+        doc("2025-03-03T08:00:00Z", 100, client_name=None, appointment_type_id=None),
+        doc("2025-03-04T08:00:00Z", None, appointment_type_id=None),
+        doc("2025-03-05T08:00:00Z", 50, status="cancelled"),
+    ])
+    stats = archive._income(frame)
+    assert stats["total_income"] == 100
+    assert stats["total_count"] == 2
+    assert stats["by_client"] == {"Unknown": {"count": 1, "total": 100}, "王小明": {"count": 1, "total": 0}}
+    assert stats["by_type"] == {"unknown": {"count": 2, "total": 100}}
+
+
+def test_income_series_uses_iso_week_year():
+    # 2024-12-30 is a Monday in ISO week 2025-W01
+    frame = archive._frame([doc("2024-12-29T08:00:00Z", 10), doc("2024-12-30T08:00:00Z", 20)])
+    series = archive._income(frame, WEEK)["series"]
+    assert series == [
+        {"period": "2024-W52", "count": 1, "total": 10},
+        {"period": "2025-W01", "count": 1, "total": 20},
+    ]
+
+
+def test_merge_income_joins_a_week_split_across_month_files():
+    # 2025-03-31 and 2025-04-02 both fall in ISO week 2025-W14
+    march = archive._income(archive._frame([doc("2025-03-24T08:00:00Z", 5), doc("2025-03-31T08:00:00Z", 10)]), WEEK)
+    april = archive._income(archive._frame([doc("2025-04-02T08:00:00Z", 20, client_name="李四")]), WEEK)
+    merged = archive.merge_income(march, april)
+    assert merged["total_income"] == 35
+    assert merged["total_count"] == 3
+    assert merged["by_client"] == {"王小明": {"count": 2, "total": 15}, "李四": {"count": 1, "total": 20}}
+    assert merged["series"] == [
+        {"period": "2025-W13", "count": 1, "total": 5},
+        {"period": "2025-W14", "count": 2, "total": 30},
+    ]
+
+
+def test_merge_income_leaves_inputs_untouched():
+    first = {"total_income": 1, "total_count": 1, "by_client": {"a": {"count": 1, "total": 1}}, "by_type": {}}
+    archive.merge_income(first, first)
+    assert first["by_client"] == {"a": {"count": 1, "total": 1}}
+
+
+def test_covers_and_overlaps_partial_months():
+    start, end = archive.month_bounds("2025-03")
+    whole = times.range_filter("2025-03-01", "2025-03-31")
+    assert archive._covers(whole, start, end)
+    assert archive._covers(None, start, end)
+    partial = times.range_filter("2025-03-10", "2025-03-31")
+    assert not archive._covers(partial, start, end)
+    assert archive._overlaps(partial, start, end)
+    # A timestamp end is an inclusive $lte, so it leaves the rest of March 31 out
+    inclusive = times.range_filter("2025-03-01", "2025-03-31T00:00:00")
+    assert not archive._covers(inclusive, start, end)
+    assert archive._overlaps(inclusive, start, end)
+
+
+def test_overlaps_treats_lt_as_exclusive_and_lte_as_inclusive():
+    start, end = archive.month_bounds("2025-03")
+    assert not archive._overlaps({"$lt": start}, start, end)
+    assert archive._overlaps({"$lte": start}, start, end)
+    assert not archive._overlaps({"$gte": end}, start, end)
+    assert archive._overlaps({"$gte": datetime(2025, 3, 31, 23, tzinfo=timezone.utc)}, start, end)
+
+
+def test_months_in_filters_on_the_manifest(archived):
+    archived("2025-02", [doc("2025-02-03T08:00:00Z", 10, client_name="李四", status="cancelled")])
+    archived("2025-03", [doc("2025-03-03T08:00:00Z", 20)])
+    assert archive.months_in() == ["2025-02", "2025-03"]
+    assert archive.months_in(times.range_filter("2025-03-15", None)) == ["2025-03"]
+    assert archive.months_in(times.range_filter(None, "2025-02-28")) == ["2025-02"]
+    assert archive.months_in(client_name="小明") == ["2025-03"]
+    assert archive.months_in(status="cancelled") == ["2025-02"]
+
+
+def test_months_in_ignores_pending_months(archived):
+    archived("2025-03", [doc("2025-03-03T08:00:00Z", 20)])
+    archive._save_manifest("2025-04", pending={"file": "pending-2025-04.parquet", "started_at": "now"})
+    assert archive.months_in() == ["2025-03"]
+
+
+def test_income_reads_partial_months_from_the_files(archived):
+    archived("2025-03", [doc("2025-03-03T08:00:00Z", 20), doc("2025-03-20T08:00:00Z", 30, client_name="李四")])
+    whole = archive.income(["2025-03"], times.range_filter("2025-03-01", "2025-03-31"))
+    assert whole["total_income"] == 50
+    partial = archive.income(["2025-03"], times.range_filter("2025-03-10", "2025-03-31"))
+    assert partial["total_income"] == 30
+    assert partial["by_client"] == {"李四": {"count": 1, "total": 30}}
+
+
+def test_income_monthly_series_from_the_manifest_matches_the_files(archived):
+    archived("2025-03", [doc("2025-03-03T08:00:00Z", 20), doc("2025-03-20T08:00:00Z", 30)])
+    fast = archive.income(["2025-03"], period_format=archive.MONTH_FORMAT)
+    assert fast["series"] == [{"period": "2025-03", "count": 2, "total": 50}]
+    # A client filter forces the file path; with every row matching, both must agree
+    assert archive.income(["2025-03"], client_name="王", period_format=archive.MONTH_FORMAT) == fast
+
+
+def test_income_weekly_series_spans_month_files(archived):
+    archived("2025-03", [doc("2025-03-31T08:00:00Z", 10)])
+    archived("2025-04", [doc("2025-04-02T08:00:00Z", 20)])
+    stats = archive.income(archive.months_in(), period_format=WEEK)
+    assert stats["series"] == [{"period": "2025-W14", "count": 2, "total": 30}]
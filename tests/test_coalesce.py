@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import coalesce
+
+
+class SlowLoader:
+    """Counts its calls and returns only once `release` is set."""
+
+    def __init__(self, result="result", error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return f"{self.result}-{self.calls}"
+
+
+async def started(*coroutines):
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_identical_requests_share_one_call():
+    async def scenario():
+        flights = coalesce.Coalescer({})
+        loader = SlowLoader()
+        tasks = await started(*(flights.run("route", "etag", loader) for _ in range(5)))
+        loader.release.set()
+        assert await asyncio.gather(*tasks) == ["result-1"] * 5
+        assert loader.calls == 1
+        # Nothing cached without a window: the next request loads again
+        assert await flights.run("route", "etag", loader) == "result-2"
+
+    asyncio.run(scenario())
+
+
+def test_followers_get_the_leaders_exception_and_it_is_not_cached():
+    async def scenario():
+        flights = coalesce.Coalescer({"route": 60})
+        loader = SlowLoader(error=RuntimeError("boom"))
+        tasks = await started(*(flights.run("route", "etag", loader) for _ in range(3)))
+        loader.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert [str(result) for result in results] == ["boom"] * 3
+        assert loader.calls == 1
+        with pytest.raises(RuntimeError):
+            await flights.run("route", "etag", loader)
+        assert loader.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_request_does_not_cancel_the_shared_call():
+    async def scenario():
+        flights = coalesce.Coalescer({})
+        loader = SlowLoader()
+        leader, follower = await started(flights.run("route", "etag", loader), flights.run("route", "etag", loader))
+        leader.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await follower == "result-1"
+        assert leader.cancelled()
+        assert loader.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_micro_cache_serves_the_window_then_expires(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(coalesce.time, "monotonic", lambda: clock[0])
+
+    async def scenario():
+        flights = coalesce.Coalescer({"route": 2})
+        loader = SlowLoader()
+        loader.release.set()
+        assert await flights.run("route", "etag", loader) == "result-1"
+        clock[0] += 1.5
+        assert await flights.run("route", "etag", loader) == "result-1"
+        clock[0] += 1
+        assert await flights.run("route", "etag", loader) == "result-2"
+
+    asyncio.run(scenario())
+
+
+def test_a_new_etag_never_gets_the_old_result():
+    async def scenario():
+        flights = coalesce.Coalescer({"route": 60})
+        loader = SlowLoader()
+        loader.release.set()
+        assert await flights.run("route", "etag-1", loader) == "result-1"
+        # A write bumped the version stamps, so the ETag changed
+        assert await flights.run("route", "etag-2", loader) == "result-2"
+        assert await flights.run("other", "etag-2", loader) == "result-3"
+
+    asyncio.run(scenario())
+
+
+def test_a_full_cache_drops_expired_entries_first(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(coalesce.time, "monotonic", lambda: clock[0])
+
+    async def scenario():
+        flights = coalesce.Coalescer({"short": 1, "long": 60}, max_entries=2)
+        loader = SlowLoader()
+        loader.release.set()
+        await flights.run("short", "a", loader)
+        await flights.run("long", "b", loader)
+        clock[0] += 5
+        await flights.run("long", "c", loader)
+        assert set(flights._cached) == {("long", "b"), ("long", "c")}
+
+    asyncio.run(scenario())
+
+
+def test_windows_parse_from_the_environment(monkeypatch):
+    monkeypatch.setenv("COALESCE_WINDOWS", "get_income_stats=2, get_appointments=0.5,,bad")
+    assert coalesce._windows() == {"get_income_stats": 2.0, "get_appointments": 0.5}
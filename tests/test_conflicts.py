@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import conflicts
+import times
+
+OPERATORS = {
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+    "$ne": lambda value, bound: value != bound,
+}
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+        elif not all(
+            (value is not None or op == "$ne") and OPERATORS[op](value, bound) for op, bound in condition.items()
+        ):
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return _Cursor([{key: doc.get(key) for key in ("id", "pickup_at", "arrival_at")}
+                        for doc in self.docs if _matches(doc, query)])
+
+
+class _DB:
+    def __init__(self, docs):
+        self.appointments = _Collection(docs)
+
+
+def trip(id, pickup, arrival=None, status="scheduled"):
+    return {"id": id, "status": status, "pickup_at": times.parse_utc(pickup), "arrival_at": times.parse_utc(arrival)}
+
+
+def pairs(docs, start=None, end=None):
+    found = asyncio.run(conflicts.in_range(_DB(docs), times.range_filter(start, end)))
+    return [(pair["appointment_id"], pair["conflicting_id"], pair["overlap_start"], pair["overlap_end"]) for pair in found]
+
+
+def test_window_defaults_and_caps_the_trip_length():
+    pickup = datetime(2025, 3, 1, 8, tzinfo=timezone.utc)
+    assert conflicts.window(None, pickup) is None
+    assert conflicts.window(pickup, None) == (pickup, pickup + conflicts.DEFAULT_TRIP)
+    assert conflicts.window(pickup, pickup) == (pickup, pickup + conflicts.DEFAULT_TRIP)
+    assert conflicts.window(pickup, pickup + timedelta(days=3)) == (pickup, pickup + conflicts.MAX_TRIP)
+    # Motor's naive datetimes are UTC
+    assert conflicts.window(pickup.replace(tzinfo=None), None)[0] == pickup
+
+
+def test_back_to_back_trips_do_not_overlap():
+    docs = [trip("a", "2025-03-01T10:00:00Z", "2025-03-01T11:00:00Z"),
+            trip("b", "2025-03-01T11:00:00Z", "2025-03-01T12:00:00Z")]
+    assert pairs(docs) == []
+
+
+def test_every_pair_of_a_chain_is_reported_once():
+    docs = [trip("a", "2025-03-01T10:00:00Z", "2025-03-01T12:00:00Z"),
+            trip("b", "2025-03-01T11:00:00Z", "2025-03-01T13:00:00Z"),
+            trip("c", "2025-03-01T11:30:00Z", "2025-03-01T12:30:00Z")]
+    assert sorted(pairs(docs)) == [
+        ("b", "a", "2025-03-01T11:00:00+00:00", "2025-03-01T12:00:00+00:00"),
+        ("c", "a", "2025-03-01T11:30:00+00:00", "2025-03-01T12:00:00+00:00"),
+        ("c", "b", "2025-03-01T11:30:00+00:00", "2025-03-01T12:30:00+00:00"),
+    ]
+
+
+def test_a_chain_only_pairs_trips_that_actually_overlap():
+    docs = [trip("a", "2025-03-01T10:00:00Z", "2025-03-01T11:30:00Z"),
+            trip("b", "2025-03-01T11:00:00Z", "2025-03-01T13:00:00Z"),
+            trip("c", "2025-03-01T12:00:00Z", "2025-03-01T14:00:00Z"),
+            trip("d", "2025-03-01T13:30:00Z", "2025-03-01T15:00:00Z")]
+    assert sorted((first, second) for first, second, _, _ in pairs(docs)) == [("b", "a"), ("c", "b"), ("d", "c")]
+
+
+def test_trips_starting_before_the_range_count_when_the_overlap_reaches_into_it():
+    docs = [trip("a", "2025-03-01T22:00:00Z", "2025-03-02T02:00:00Z"),
+            trip("b", "2025-03-02T01:00:00Z", "2025-03-02T03:00:00Z"),
+            # Overlap over before the range starts
+            trip("c", "2025-03-01T20:00:00Z", "2025-03-01T21:00:00Z"),
+            trip("d", "2025-03-01T20:30:00Z", "2025-03-01T21:30:00Z")]
+    assert pairs(docs, "2025-03-02", "2025-03-02") == [
+        ("b", "a", "2025-03-02T01:00:00+00:00", "2025-03-02T02:00:00+00:00"),
+    ]
+
+
+def test_trips_longer_than_the_cap_are_cut_off_at_it():
+    start = datetime(2025, 3, 2, tzinfo=timezone.utc)
+    long_pickup = start - conflicts.MAX_TRIP - timedelta(hours=1)
+    docs = [trip("long", long_pickup.isoformat(), (start + timedelta(hours=5)).isoformat()),
+            trip("b", "2025-03-02T01:00:00Z", "2025-03-02T02:00:00Z")]
+    assert pairs(docs, "2025-03-02", "2025-03-02") == []
+    assert pairs(docs) == []
+
+
+def test_trips_that_are_not_scheduled_are_ignored():
+    docs = [trip("a", "2025-03-01T10:00:00Z", "2025-03-01T12:00:00Z", status="completed"),
+            trip("b", "2025-03-01T11:00:00Z", "2025-03-01T13:00:00Z"),
+            trip("c", "2025-03-01T11:30:00Z", "2025-03-01T12:30:00Z", status="cancelled")]
+    assert pairs(docs) == []
+
+
+def test_for_appointment_lists_overlapping_scheduled_trips_but_itself():
+    docs = [trip("a", "2025-03-01T10:00:00Z", "2025-03-01T12:00:00Z"),
+            trip("b", "2025-03-01T12:00:00Z", "2025-03-01T13:00:00Z"),
+            trip("c", "2025-03-01T11:00:00Z", "2025-03-01T11:30:00Z", status="completed"),
+            trip("d", "2025-03-01T09:00:00Z", "2025-03-01T10:30:00Z")]
+    db = _DB(docs)
+    assert asyncio.run(conflicts.for_appointment(db, docs[0])) == ["d"]
+    assert asyncio.run(conflicts.for_appointment(db, docs[1])) == []
+    assert asyncio.run(conflicts.for_appointment(db, docs[2])) == []
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_round_trip():
+    appointment = {"id": "王-1", "pickup_time": "2025-01-05T08:00:00+08:00"}
+    cursor = server._encode_cursor(appointment)
+    assert "=" not in cursor
+    assert server._decode_cursor(cursor) == ("2025-01-05T08:00:00+08:00", "王-1")
+
+
+def test_datetime_field_is_encoded_as_iso_string():
+    pickup_at = datetime(2025, 1, 5, 0, 0, tzinfo=timezone.utc)
+    cursor = server._encode_cursor({"id": "a", "pickup_at": pickup_at}, field="pickup_at")
+    assert server._decode_cursor(cursor) == ("2025-01-05T00:00:00+00:00", "a")
+
+
+def test_missing_field_round_trips_as_none():
+    cursor = server._encode_cursor({"id": "a"})
+    assert server._decode_cursor(cursor) == (None, "a")
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", "", "W10", "WzEsMiwzXQ", "eyJhIjoxLCJiIjoyfQ"])
+def test_invalid_cursor_is_a_400(cursor):
+    # garbage, empty, [], [1, 2, 3], {"a": 1, "b": 2}
+    with pytest.raises(HTTPException) as raised:
+        server._decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_keyset_filter_forward():
+    cursor = server._encode_cursor({"id": "b", "pickup_time": "2025-01-05T08:00"})
+    assert server._keyset_filter(cursor, forward=True) == {
+        "pickup_time": {"$gte": "2025-01-05T08:00"},
+        "$or": [
+            {"pickup_time": {"$gt": "2025-01-05T08:00"}},
+            {"pickup_time": "2025-01-05T08:00", "id": {"$gt": "b"}},
+        ],
+    }
+
+
+def test_keyset_filter_backward_on_typed_field():
+    pickup_at = datetime(2025, 1, 5, tzinfo=timezone.utc)
+    cursor = server._encode_cursor({"id": "b", "pickup_at": pickup_at}, field="pickup_at")
+    query = server._keyset_filter(cursor, forward=False, field="pickup_at")
+    assert query["pickup_at"] == {"$lte": pickup_at}
+    assert query["$or"] == [{"pickup_at": {"$lt": pickup_at}}, {"pickup_at": pickup_at, "id": {"$lt": "b"}}]
+
+
+def test_keyset_filter_rejects_untyped_value_for_typed_field():
+    cursor = server._encode_cursor({"id": "b", "pickup_at": "yesterday"}, field="pickup_at")
+    with pytest.raises(HTTPException) as raised:
+        server._keyset_filter(cursor, forward=True, field="pickup_at")
+    assert raised.value.status_code == 400
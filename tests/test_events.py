@@ -0,0 +1,175 @@
+import asyncio
+import json
+
+import pytest
+
+import events
+
+
+def parse(frame):
+    """(event id, event name, payload) of an SSE frame."""
+    fields = dict(line.split(": ", 1) for line in frame.decode().strip().split("\n"))
+    return fields.get("id"), fields.get("event"), json.loads(fields["data"]) if "data" in fields else None
+
+
+async def opened(bus, last_event_id=None, heartbeat=60):
+    """A subscribed stream, past its retry line, with the first frame after it."""
+    stream = bus.stream(last_event_id, heartbeat=heartbeat)
+    assert (await stream.__anext__()).startswith(b"retry:")
+    return stream, await stream.__anext__()
+
+
+async def take(stream, count):
+    return [parse(await asyncio.wait_for(stream.__anext__(), 1)) for _ in range(count)]
+
+
+def test_a_new_connection_is_ready_and_gets_later_events():
+    async def scenario():
+        bus = events.EventBus()
+        bus.publish("appointment", "created", "a1", {"id": "a1"})
+        stream, first = await opened(bus)
+        assert parse(first)[1] == "ready"
+        bus.publish("appointment", "deleted", "a1")
+        assert await take(stream, 1) == [(bus.last_event_id, "appointment", {"action": "deleted", "id": "a1", "data": None})]
+        await stream.aclose()
+        assert bus.stats()["connections"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_last_event_id_replays_what_was_missed():
+    async def scenario():
+        bus = events.EventBus()
+        for i in range(1, 4):
+            bus.publish("appointment", "updated", f"a{i}")
+        stream, first = await opened(bus, f"{bus.process_id}-1")
+        replayed = [parse(first)] + await take(stream, 1)
+        assert [(event_id, payload["id"]) for event_id, _, payload in replayed] == [
+            (f"{bus.process_id}-2", "a2"), (f"{bus.process_id}-3", "a3"),
+        ]
+        # Caught up: the next frame is a new event, not a marker
+        bus.publish("appointment", "updated", "a4")
+        assert (await take(stream, 1))[0][2]["id"] == "a4"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_an_up_to_date_last_event_id_replays_nothing():
+    async def scenario():
+        bus = events.EventBus()
+        bus.publish("appointment", "updated", "a1")
+        stream, _ = await opened(bus, bus.last_event_id, heartbeat=0.01)
+        assert await stream.__anext__() == b": heartbeat\n\n"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("last_event_id", ["expired", "other-3", "future", "garbage"])
+def test_unresumable_ids_get_a_reset(last_event_id):
+    async def scenario():
+        bus = events.EventBus(buffer_size=2)
+        for i in range(5):
+            bus.publish("appointment", "updated", f"a{i}")
+        last = {
+            "expired": f"{bus.process_id}-1",
+            "other-3": "deadbeef-3",
+            "future": f"{bus.process_id}-9",
+            "garbage": f"{bus.process_id}-x",
+        }[last_event_id]
+        stream, first = await opened(bus, last)
+        assert parse(first)[1] == "reset"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_the_oldest_buffered_event_can_still_be_resumed_from():
+    bus = events.EventBus(buffer_size=2)
+    for i in range(5):
+        bus.publish("appointment", "updated", f"a{i}")
+    # Events 4 and 5 are buffered: resuming after 3 needs nothing older
+    assert [seq for seq, _ in bus._missed(f"{bus.process_id}-3")] == [4, 5]
+    assert bus._missed(f"{bus.process_id}-2") is None
+
+
+def test_a_connection_that_falls_a_queue_behind_is_closed_after_draining():
+    async def scenario():
+        bus = events.EventBus(queue_size=2)
+        stream, _ = await opened(bus)
+        for i in range(3):
+            bus.publish("appointment", "updated", f"a{i}")
+        assert bus.stats()["connections"] == 0
+        assert [payload["id"] for _, _, payload in await take(stream, 2)] == ["a0", "a1"]
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+
+    asyncio.run(scenario())
+
+
+def test_close_ends_every_stream():
+    async def scenario():
+        bus = events.EventBus()
+        stream, _ = await opened(bus)
+        bus.close()
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+
+    asyncio.run(scenario())
+
+
+def test_local_publishes_are_ignored_while_a_change_stream_feeds_the_bus():
+    bus = events.EventBus()
+    bus.local = False
+    bus.publish("appointment", "created", "a1")
+    assert bus.seq == 0
+    bus.publish("appointment", "created", "a1", local=False)
+    assert bus.seq == 1
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = events.EventBus()
+    monkeypatch.setattr(events, "bus", bus)
+    return bus
+
+
+def published(bus):
+    return [parse(frame)[1:] for _, frame in bus.recent]
+
+
+def shape(name, doc):
+    return {"id": doc["id"]}
+
+
+def test_change_stream_deletes_of_types_carry_their_id(bus):
+    ids = {}
+    events._publish_change(
+        {"ns": {"coll": "appointment_types"}, "operationType": "insert", "fullDocument": {"_id": 1, "id": "t1"}},
+        shape, ids,
+    )
+    events._publish_change(
+        {"ns": {"coll": "appointment_types"}, "operationType": "delete", "documentKey": {"_id": 1}}, shape, ids,
+    )
+    # Not seen since the stream opened
+    events._publish_change(
+        {"ns": {"coll": "sms_templates"}, "operationType": "delete", "documentKey": {"_id": 2}}, shape, ids,
+    )
+    assert published(bus) == [
+        ("appointment_type", {"action": "created", "id": "t1", "data": {"id": "t1"}}),
+        ("appointment_type", {"action": "deleted", "id": "t1", "data": None}),
+        ("sms_template", {"action": "deleted", "id": None, "data": None}),
+    ]
+    assert ids == {}
+
+
+def test_change_stream_appointment_deletes_come_from_tombstones(bus):
+    ids = {}
+    events._publish_change(
+        {"ns": {"coll": "appointments"}, "operationType": "delete", "documentKey": {"_id": 1}}, shape, ids,
+    )
+    events._publish_change(
+        {"ns": {"coll": events.TOMBSTONES}, "operationType": "insert", "fullDocument": {"id": "a1"}}, shape, ids,
+    )
+    assert published(bus) == [("appointment", {"action": "deleted", "id": "a1", "data": None})]
@@ -0,0 +1,25 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.mark.parametrize("fields", [None, "", ",", " , "])
+def test_no_named_fields_reads_full_rows(fields):
+    assert server._sparse_fields(fields) == []
+    assert server._fields_projection(server._sparse_fields(fields)) == server.APPOINTMENT_PROJECTION
+
+
+def test_named_fields_add_the_required_ones():
+    requested = server._sparse_fields(" status,amount ")
+    assert requested == ["status", "amount"]
+    assert server._fields_projection(requested) == {
+        "_id": 0, "id": 1, "client_name": 1, "pickup_time": 1, "status": 1, "amount": 1,
+    }
+
+
+def test_unknown_fields_are_a_400():
+    with pytest.raises(HTTPException) as raised:
+        server._sparse_fields("status,sync_seq,nope")
+    assert raised.value.status_code == 400
+    assert raised.value.detail == "Unknown fields: nope, sync_seq"
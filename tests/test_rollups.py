@@ -0,0 +1,176 @@
+import asyncio
+
+import rollups
+
+
+def _evaluate(expr, doc, this=None):
+    """The subset of aggregation expressions rollups' pipeline updates use."""
+    if isinstance(expr, str) and expr.startswith("$$this"):
+        return this if expr == "$$this" else this[expr[len("$$this."):]]
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if isinstance(expr, list):
+        return [_evaluate(item, doc, this) for item in expr]
+    if not isinstance(expr, dict) or len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return expr
+    (op, arg), = expr.items()
+    if op == "$literal":
+        return arg
+    if op in ("$filter", "$map"):
+        items = _evaluate(arg["input"], doc, this)
+        if op == "$map":
+            return [_evaluate(arg["in"], doc, item) for item in items]
+        return [item for item in items if _evaluate(arg["cond"], doc, item)]
+    value = _evaluate(arg, doc, this)
+    if op == "$ifNull":
+        return value[1] if value[0] is None else value[0]
+    if op == "$mergeObjects":
+        return {key: v for part in value for key, v in part.items()}
+    if op == "$objectToArray":
+        return [{"k": key, "v": v} for key, v in value.items()]
+    if op == "$arrayToObject":
+        return {item["k"]: item["v"] for item in value}
+    if op == "$ne":
+        return value[0] != value[1]
+    if op == "$size":
+        return len(value)
+    if op == "$sum":
+        return sum(value)
+    raise NotImplementedError(op)
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict):
+            # {"seqs.<id>": {"$not": {"$gte": seq}}}
+            parent, _, key = field.partition(".")
+            value = (doc.get(parent) or {}).get(key)
+            if value is not None and value >= condition["$not"]["$gte"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class _Buckets:
+    def __init__(self):
+        self.docs = []
+
+    async def update_one(self, query, pipeline, upsert=False):
+        doc = next((doc for doc in self.docs if _matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            if any(all(doc.get(k) == v for k, v in query.items() if not isinstance(v, dict)) for doc in self.docs):
+                # The bucket exists but has a newer write: the upsert would be a duplicate key
+                raise rollups.DuplicateKeyError("duplicate bucket")
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            self.docs.append(doc)
+        for stage in pipeline:
+            doc.update({field: _evaluate(expr, doc) for field, expr in stage["$set"].items()})
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            await self.update_one(request._filter, request._doc, request._upsert)
+
+
+class _DB(dict):
+    def __init__(self):
+        super().__init__({rollups.ROLLUP_COLLECTION: _Buckets()})
+
+
+def appointment(seq, pickup="2025-03-01T08:00:00Z", amount=100, status="completed", client_name="王小明"):
+    return {"id": "a1", "sync_seq": seq, "pickup_time": pickup, "amount": amount, "status": status,
+            "client_name": client_name, "appointment_type_id": "t1"}
+
+
+def buckets(db):
+    """(day, client) -> (count, total) of the non-empty buckets."""
+    return {
+        (doc["day"], doc["client_name"]): (doc["count"], doc["total"])
+        for doc in db[rollups.ROLLUP_COLLECTION].docs if doc["count"]
+    }
+
+
+def apply(db, *changes):
+    async def run():
+        for change in changes:
+            await rollups.record_change(db, *change)
+    asyncio.run(run())
+
+
+def test_create_update_and_delete():
+    db = _DB()
+    first, second = appointment(1), appointment(2, amount=150)
+    apply(db, (None, first), (first, second))
+    assert buckets(db) == {("2025-03-01", "王小明"): (1, 150)}
+    apply(db, (second, None, 3))
+    assert buckets(db) == {}
+
+
+def test_moving_days_and_clients_moves_the_entry():
+    db = _DB()
+    first = appointment(1)
+    moved = appointment(2, pickup="2025-03-02T08:00:00Z")
+    renamed = appointment(3, pickup="2025-03-02T08:00:00Z", client_name="李四")
+    apply(db, (None, first), (first, moved))
+    assert buckets(db) == {("2025-03-02", "王小明"): (1, 100)}
+    apply(db, (moved, renamed))
+    assert buckets(db) == {("2025-03-02", "李四"): (1, 100)}
+    assert db[rollups.ROLLUP_COLLECTION].docs[-1]["client_search_name"] == "李四"
+
+
+def test_status_flips_take_the_entry_out_and_back():
+    db = _DB()
+    completed = appointment(1)
+    cancelled = appointment(2, status="cancelled")
+    again = appointment(3, amount=80)
+    apply(db, (None, completed), (completed, cancelled))
+    assert buckets(db) == {}
+    apply(db, (cancelled, again))
+    assert buckets(db) == {("2025-03-01", "王小明"): (1, 80)}
+
+
+def test_reapplied_changes_are_idempotent():
+    db = _DB()
+    first, moved = appointment(1), appointment(2, pickup="2025-03-02T08:00:00Z")
+    apply(db, (None, first), (first, moved), (None, first), (first, moved), (first, moved))
+    assert buckets(db) == {("2025-03-02", "王小明"): (1, 100)}
+
+
+def test_an_older_write_arriving_late_changes_nothing():
+    db = _DB()
+    first = appointment(1)
+    older = appointment(2, amount=120)
+    newer = appointment(3, amount=130)
+    apply(db, (None, first), (older, newer), (first, older))
+    assert buckets(db) == {("2025-03-01", "王小明"): (1, 130)}
+
+
+def test_an_older_move_arriving_late_does_not_resurrect_the_entry():
+    db = _DB()
+    # seq 2 completes the trip on day 1, seq 3 moves it to day 2; their rollup writes arrive in reverse
+    scheduled = appointment(1, status="scheduled")
+    completed = appointment(2)
+    moved = appointment(3, pickup="2025-03-02T08:00:00Z")
+    apply(db, (completed, moved), (scheduled, completed))
+    assert buckets(db) == {("2025-03-02", "王小明"): (1, 100)}
+
+
+def test_a_delete_outranks_an_update_still_in_flight():
+    db = _DB()
+    first, updated = appointment(1), appointment(2, amount=200)
+    apply(db, (None, first), (updated, None, 3), (first, updated))
+    assert buckets(db) == {}
+
+
+def test_remove_drops_archived_rows():
+    db = _DB()
+    first = appointment(1)
+    cancelled = {**appointment(1, status="cancelled"), "id": "a2"}
+    apply(db, (None, first))
+    asyncio.run(rollups.remove(db, [first, cancelled], first_seq=10))
+    assert buckets(db) == {}
+    # A write older than the archive's delete can't put it back
+    apply(db, (None, first))
+    assert buckets(db) == {}
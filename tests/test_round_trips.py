@@ -0,0 +1,154 @@
+"""MongoDB command budgets per endpoint, so a change that adds round trips fails the build.
+
+Boots backend/server.py with uvicorn against a throwaway database (MONGO_URL
+from the environment or backend/.env, DB_NAME suffixed with `_round_trips`),
+exercises every endpoint and reads the per-request command count from the
+X-Mongo-Commands header. Each repeatable call is made twice and the second
+(warm connection, warm cache) call is checked. Skipped when no MongoDB is
+reachable.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+load_dotenv(BACKEND_DIR / ".env")
+
+# Upper bounds on MongoDB commands per request. Lower them when an endpoint gets cheaper;
+# raising one needs a reason in the commit that does it.
+BUDGETS = {
+    "login": 2,
+    "pattern status": 2,
+    "setup pattern": 2,
+    "create type": 2,
+    "list types": 3,
+    "update type": 2,
+    "create appointment": 5,
+    "get appointment": 2,
+    "list appointments": 2,
+    "update appointment": 5,
+    # Scheduled trips also run the conflict query from conflicts.py
+    "create scheduled appointment": 5,
+    "update scheduled appointment": 5,
+    "income stats": 3,
+    "get sms template": 3,
+    "update sms template": 2,
+    "delete appointment": 6,
+    "delete type in use": 1,
+    "delete type": 3,
+}
+
+
+def _mongo():
+    url = os.environ.get("MONGO_URL")
+    if not url or not os.environ.get("DB_NAME"):
+        pytest.skip("MONGO_URL and DB_NAME are not set")
+    mongo = MongoClient(url, serverSelectionTimeoutMS=2000)
+    try:
+        mongo.admin.command("ping")
+    except PyMongoError as e:
+        mongo.close()
+        pytest.skip(f"No MongoDB at MONGO_URL: {e}")
+    return mongo
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def api():
+    mongo = _mongo()
+    db_name = f"{os.environ['DB_NAME']}_round_trips"
+    mongo.drop_database(db_name)
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=dict(os.environ, DB_NAME=db_name, MONGO_COMMAND_HEADER="1"),
+    )
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}/api", timeout=10)
+    try:
+        for _ in range(100):
+            try:
+                client.get("/auth/pattern-status")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        else:
+            pytest.fail("server did not start")
+        yield client
+    finally:
+        client.close()
+        proc.terminate()
+        proc.wait()
+        mongo.drop_database(db_name)
+        mongo.close()
+
+
+class RoundTripChecker:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def call(self, name, method, path, json=None, expected=200, repeat=True):
+        """Make the request (twice if repeat) and record the command count of the last one."""
+        for _ in range(2 if repeat else 1):
+            response = self.client.request(method, path, json=json)
+        assert response.status_code == expected, f"{name}: {response.status_code} {response.text[:200]}"
+        commands = int(response.headers["X-Mongo-Commands"])
+        self.results.append((name, commands, response.headers.get("X-Mongo-Command-Names", "")))
+        return response.json() if response.content else None
+
+    def run(self):
+        token = self.call("login", "POST", "/auth/login", {"password": "driver123"})["token"]
+        self.client.headers["Authorization"] = f"Bearer {token}"
+        self.call("pattern status", "GET", "/auth/pattern-status")
+        self.call("setup pattern", "POST", "/auth/setup-pattern", {"pattern": [0, 1, 2, 3]})
+
+        type_id = self.call("create type", "POST", "/appointment-types",
+                            {"name": "測試", "color": "#000000", "icon": "Car"}, repeat=False)["id"]
+        self.call("list types", "GET", "/appointment-types")
+        self.call("update type", "PUT", f"/appointment-types/{type_id}", {"color": "#111111"})
+
+        appointment = {"client_name": "測試客戶", "pickup_time": "2025-10-18T01:00:00.000Z",
+                       "amount": 100, "appointment_type_id": type_id, "status": "completed"}
+        appointment_id = self.call("create appointment", "POST", "/appointments", appointment, repeat=False)["id"]
+        self.call("get appointment", "GET", f"/appointments/{appointment_id}")
+        self.call("list appointments", "GET", "/appointments?status=completed")
+        self.call("update appointment", "PUT", f"/appointments/{appointment_id}", {"amount": 120})
+        self.call("income stats", "GET", "/appointments/stats/income?start_date=2025-10-01&end_date=2025-10-31")
+
+        scheduled = {**appointment, "pickup_time": "2025-10-20T01:00:00.000Z", "status": "scheduled"}
+        scheduled_id = self.call("create scheduled appointment", "POST", "/appointments", scheduled, repeat=False)["id"]
+        self.call("update scheduled appointment", "PUT", f"/appointments/{scheduled_id}",
+                  {"pickup_time": "2025-10-21T01:00:00.000Z"})
+
+        self.call("get sms template", "GET", "/sms-template")
+        self.call("update sms template", "PUT", "/sms-template", {"greeting": "您好"})
+
+        self.call("delete type in use", "DELETE", f"/appointment-types/{type_id}", expected=400)
+        self.call("delete appointment", "DELETE", f"/appointments/{appointment_id}", repeat=False)
+        self.call("delete appointment", "DELETE", f"/appointments/{scheduled_id}", repeat=False)
+        self.call("delete type", "DELETE", f"/appointment-types/{type_id}", repeat=False)
+
+
+def test_endpoints_stay_within_their_command_budget(api):
+    checker = RoundTripChecker(api)
+    checker.run()
+    over = [
+        f"{name}: {commands} > {BUDGETS[name]} ({detail})"
+        for name, commands, detail in checker.results
+        if commands > BUDGETS[name]
+    ]
+    assert not over, "MongoDB command budget exceeded:\n" + "\n".join(over)
@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import search
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict):
+            if doc.get(field) == condition["$ne"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class _Clients:
+    def __init__(self):
+        self.docs = []
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs if _matches(doc, query)), None)
+
+    async def update_one(self, query, update, upsert=False):
+        doc = await self.find_one(query)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0)
+            doc = {"name": query["name"]}
+            self.docs.append(doc)
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field, value in update.get("$max", {}).items():
+            doc[field] = max(doc.get(field, value), value)
+        doc.update(update.get("$set", {}))
+        return SimpleNamespace(matched_count=1)
+
+
+class _Aggregation:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows[:length]
+
+
+class _Appointments:
+    def __init__(self):
+        self.docs = []
+
+    def aggregate(self, pipeline):
+        name = pipeline[0]["$match"]["client_name"]
+        rows = [doc for doc in self.docs if doc["client_name"] == name]
+        if not rows:
+            return _Aggregation([])
+        return _Aggregation([{"count": len(rows), "last_pickup_time": max(doc["pickup_time"] for doc in rows)}])
+
+
+class _DB(dict):
+    """Appointments are written first, then record_client_change runs, as in the endpoints."""
+
+    def __init__(self):
+        super().__init__({search.CLIENTS_COLLECTION: _Clients()})
+        self.appointments = _Appointments()
+
+    def write(self, before, after):
+        if before:
+            self.appointments.docs.remove(before)
+        if after:
+            self.appointments.docs.append(after)
+        asyncio.run(search.record_client_change(self, before, after))
+
+    def client(self, name):
+        doc = asyncio.run(self[search.CLIENTS_COLLECTION].find_one({"name": name}))
+        return doc["count"], doc["last_pickup_time"]
+
+
+def trip(id, pickup_time, client_name="王小明"):
+    return {"id": id, "client_name": client_name, "pickup_time": pickup_time}
+
+
+def test_creates_count_and_keep_the_latest_pickup():
+    db = _DB()
+    db.write(None, trip("a", "2025-03-05T08:00:00Z"))
+    db.write(None, trip("b", "2025-03-01T08:00:00Z"))
+    assert db.client("王小明") == (2, "2025-03-05T08:00:00Z")
+
+
+def test_moving_the_latest_trip_earlier_recomputes_the_latest_pickup():
+    db = _DB()
+    a, b = trip("a", "2025-03-05T08:00:00Z"), trip("b", "2025-03-03T08:00:00Z")
+    db.write(None, a)
+    db.write(None, b)
+    db.write(b, trip("b", "2025-03-01T08:00:00Z"))
+    assert db.client("王小明") == (2, "2025-03-05T08:00:00Z")
+    db.write(a, trip("a", "2025-02-01T08:00:00Z"))
+    assert db.client("王小明") == (2, "2025-03-01T08:00:00Z")
+
+
+def test_deleting_the_latest_trip_recomputes_the_latest_pickup():
+    db = _DB()
+    a, b = trip("a", "2025-03-05T08:00:00Z"), trip("b", "2025-03-03T08:00:00Z")
+    db.write(None, a)
+    db.write(None, b)
+    db.write(b, None)
+    assert db.client("王小明") == (1, "2025-03-05T08:00:00Z")
+    db.write(a, None)
+    assert db.client("王小明") == (0, "")
+
+
+def test_renaming_moves_the_trip_between_clients():
+    db = _DB()
+    a, b = trip("a", "2025-03-05T08:00:00Z"), trip("b", "2025-03-03T08:00:00Z")
+    db.write(None, a)
+    db.write(None, b)
+    db.write(a, trip("a", "2025-03-05T08:00:00Z", client_name="李四"))
+    assert db.client("王小明") == (1, "2025-03-03T08:00:00Z")
+    assert db.client("李四") == (1, "2025-03-05T08:00:00Z")
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import sync
+
+NOW = datetime.now(timezone.utc)
+SETTLED = NOW - timedelta(seconds=sync.SETTLE_SECONDS + 60)
+FRESH = NOW + timedelta(seconds=60)
+
+
+def test_high_water_advances_past_settled_items():
+    assert sync._high_water([(3, SETTLED), (5, SETTLED.isoformat())], 1) == 5
+
+
+def test_high_water_stays_behind_unsettled_items():
+    assert sync._high_water([(3, SETTLED), (4, FRESH), (5, FRESH.isoformat())], 1) == 3
+    assert sync._high_water([(4, FRESH)], 2) == 2
+
+
+def test_high_water_never_moves_backwards():
+    assert sync._high_water([(3, SETTLED)], 7) == 7
+
+
+def test_high_water_skips_items_without_seq_or_time():
+    assert sync._high_water([(None, SETTLED), (4, None), (5, "not a time")], 1) == 1
+
+
+def test_high_water_reads_naive_times_as_utc():
+    naive = SETTLED.replace(tzinfo=None)
+    assert sync._high_water([(3, naive)], 0) == 3
+
+
+def test_token_round_trip():
+    token = sync.encode_token(42, NOW)
+    seq, issued_at = sync.decode_token(token)
+    assert seq == 42
+    assert issued_at == NOW.replace(microsecond=0)
+
+
+def test_token_errors():
+    with pytest.raises(ValueError):
+        sync.decode_token("garbage")
+    old = NOW - timedelta(seconds=sync.TOMBSTONE_TTL_SECONDS + 60)
+    with pytest.raises(sync.TokenExpired):
+        sync.decode_token(sync.encode_token(1, old))
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return _Cursor([doc for doc in self.docs if _matches(doc, query)])
+
+
+def _matches(doc, query):
+    """The subset of query syntax changes_since uses: $or of single-field $gt/$gte conditions."""
+    if "$or" in query:
+        return any(_matches(doc, branch) for branch in query["$or"])
+    (field, condition), = query.items()
+    value = doc.get(field)
+    if value is None:
+        return False
+    if "$gt" in condition:
+        return value > condition["$gt"]
+    return value >= condition["$gte"]
+
+
+class _DB(dict):
+    def __init__(self, appointments, tombstones):
+        super().__init__({sync.TOMBSTONE_COLLECTION: _Collection(tombstones)})
+        self.appointments = _Collection(appointments)
+
+
+def test_changes_since_pages_through_settled_changes():
+    appointments = [{"id": f"a{seq}", "sync_seq": seq, "updated_at": SETTLED.isoformat()} for seq in (1, 2, 4)]
+    tombstones = [{"id": "d3", "sync_seq": 3, "deleted_at": SETTLED}]
+    db = _DB(appointments, tombstones)
+
+    changes, deleted, high_water, has_more = asyncio.run(sync.changes_since(db, 0, 3))
+    assert [doc["id"] for doc in changes] == ["a1", "a2"]
+    assert deleted == ["d3"]
+    assert (high_water, has_more) == (3, True)
+
+    changes, deleted, high_water, has_more = asyncio.run(sync.changes_since(db, high_water, 3))
+    assert [doc["id"] for doc in changes] == ["a4"]
+    assert (high_water, has_more) == (4, False)
+
+
+def test_changes_since_stops_paging_when_the_token_cannot_advance():
+    # e.g. a bulk archive run's tombstones, all written a moment ago
+    tombstones = [{"id": f"d{seq}", "sync_seq": seq, "deleted_at": NOW} for seq in range(1, 6)]
+    changes, deleted, high_water, has_more = asyncio.run(sync.changes_since(_DB([], tombstones), 0, 3))
+    assert deleted == ["d1", "d2", "d3"]
+    assert (high_water, has_more) == (0, False)
+
+
+def test_changes_since_returns_a_write_that_lands_below_the_token():
+    # seq 9 was reserved first but its write stalled; seq 10 landed and settled
+    appointments = [{"id": "a10", "sync_seq": 10, "synced_at": SETTLED}]
+    db = _DB(appointments, [])
+    issued = NOW - timedelta(seconds=1)
+    changes, _, high_water, _ = asyncio.run(sync.changes_since(db, 0, 100, issued))
+    assert [doc["id"] for doc in changes] == ["a10"]
+    assert high_water == 10
+    _, issued_at = sync.decode_token(sync.encode_token(high_water, issued))
+
+    # The stalled write lands after the token was issued, below its seq
+    appointments.append({"id": "a9", "sync_seq": 9, "synced_at": NOW})
+    db[sync.TOMBSTONE_COLLECTION].docs.append({"id": "d8", "sync_seq": 8, "deleted_at": NOW})
+    assert asyncio.run(sync.changes_since(db, high_water, 100))[:2] == ([], [])
+    changes, deleted, next_high_water, has_more = asyncio.run(sync.changes_since(db, high_water, 100, issued_at))
+    assert [doc["id"] for doc in changes] == ["a9"]
+    assert deleted == ["d8"]
+    assert (next_high_water, has_more) == (10, False)
+
+
+def test_changes_since_settles_on_the_server_stamp_not_updated_at():
+    # updated_at is taken before the write is sent; synced_at when it is applied
+    appointments = [{"id": "a1", "sync_seq": 1, "updated_at": SETTLED.isoformat(), "synced_at": NOW}]
+    _, _, high_water, _ = asyncio.run(sync.changes_since(_DB(appointments, []), 0, 100))
+    assert high_water == 0